@@ -15,12 +15,14 @@ app = cdk.App()
 # Deployed to Primary Region (US East 1)
 ServiceStack(app, "ServiceStack-Primary",
     env=cdk.Environment(account="570484142060", region="us-east-1"),
+    bedrock_regions=["us-east-1", "us-west-2"],
 )
 
 # Part 3: Cross-Region Failover (Secondary Region)
 # Deployed to Secondary Region (US West 2)
 ServiceStack(app, "ServiceStack-Secondary",
     env=cdk.Environment(account="570484142060", region="us-west-2"),
+    bedrock_regions=["us-west-2", "us-east-1"],
 )
 
 app.synth()
@@ -4,6 +4,7 @@ from aws_cdk import (
     aws_lambda as lambda_,
     aws_apigateway as apigw,
     aws_appconfig as appconfig,
+    aws_dynamodb as dynamodb,
     aws_iam as iam,
     aws_stepfunctions as sfn,
     aws_stepfunctions_tasks as tasks,
@@ -12,10 +13,32 @@ from aws_cdk import (
 from constructs import Construct
 import json
 
+# Python 3.12 starts faster than 3.9 and is required for Lambda SnapStart
+LAMBDA_RUNTIME = lambda_.Runtime.PYTHON_3_12
+
+# Behind the Step Functions workflow the router may run for a minute; behind
+# API Gateway (29s integration limit) it must finish, fallback included, first
+ROUTER_TIMEOUT = Duration.seconds(60)
+DIRECT_ROUTER_TIMEOUT = Duration.seconds(28)
+# Direct mode: the in-process fallback gets the last FALLBACK_RESERVE of the
+# invocation. The deadline only bounds retries and waits, so the read timeout
+# caps a single Bedrock call at what is left before the reserve (less 1s of slack)
+FALLBACK_RESERVE = Duration.seconds(8)
+DIRECT_READ_TIMEOUT = DIRECT_ROUTER_TIMEOUT.to_seconds() - FALLBACK_RESERVE.to_seconds() - 1
+
 class ServiceStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str,
+                 router_memory_size: int = 1024,
+                 enable_snapstart: bool = False,
+                 provisioned_concurrency: int = 0,
+                 bedrock_regions: list = None,
+                 direct_invoke: bool = False,
+                 **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        if enable_snapstart and provisioned_concurrency:
+            raise ValueError("enable_snapstart and provisioned_concurrency cannot be combined on one Lambda version")
+
         # --- Part 2: AppConfig ---
         app = appconfig.CfnApplication(self, "ModelSelectionApp",
             name="ModelSelectionApp"
@@ -57,22 +80,56 @@ class ServiceStack(Stack):
             environment_id=env.ref
         )
 
+        # --- Response Cache (shared across router containers) ---
+        cache_table = dynamodb.Table(self, "ResponseCacheTable",
+            partition_key=dynamodb.Attribute(name="cache_key", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # --- Shared runtime code (model adapters) ---
+        shared_layer = lambda_.LayerVersion(self, "SharedRuntimeLayer",
+            code=lambda_.Code.from_asset("runtime/shared"),
+            compatible_runtimes=[LAMBDA_RUNTIME],
+            description="Bedrock model adapters shared by the router and workflow functions"
+        )
+
         # --- Part 2: Lambda Model Router ---
         router_fn = lambda_.Function(self, "ModelRouterFunction",
-            runtime=lambda_.Runtime.PYTHON_3_9,
+            runtime=LAMBDA_RUNTIME,
             handler="handler.lambda_handler",
             code=lambda_.Code.from_asset("runtime/model_router"),
-            timeout=Duration.seconds(60),
+            layers=[shared_layer],
+            # More memory also means more CPU for init and JSON work
+            memory_size=router_memory_size,
+            # The Lambda timeout is also the deadline Bedrock retries stop short of
+            timeout=DIRECT_ROUTER_TIMEOUT if direct_invoke else ROUTER_TIMEOUT,
             environment={
                 "APPCONFIG_APP_ID": app.ref,
                 "APPCONFIG_ENV_ID": env.ref,
-                "APPCONFIG_PROFILE_ID": config_profile.ref
+                "APPCONFIG_PROFILE_ID": config_profile.ref,
+                "RESPONSE_CACHE_TABLE": cache_table.table_name,
+                "RESPONSE_CACHE_TTL": "300",
+                # Coalesces identical in-flight questions across containers
+                "SINGLE_FLIGHT_TABLE": cache_table.table_name,
+                "METRICS_NAMESPACE": "GenAIModelRouter",
+                "LOG_EVENTS": "false",
+                # Active-active Bedrock regions, own region first
+                "BEDROCK_REGIONS": ",".join(bedrock_regions or []),
+                # Direct mode has no workflow around the router to catch failures
+                "IN_PROCESS_FALLBACK": "true" if direct_invoke else "false",
+                **({
+                    "FALLBACK_RESERVE_MS": str(int(FALLBACK_RESERVE.to_milliseconds())),
+                    "AWS_READ_TIMEOUT": str(int(DIRECT_READ_TIMEOUT))
+                } if direct_invoke else {})
             }
         )
+        cache_table.grant_read_write_data(router_fn)
 
         # Permissions
         router_fn.add_to_role_policy(iam.PolicyStatement(
-            actions=["bedrock:InvokeModel"],
+            actions=["bedrock:InvokeModel", "bedrock:InvokeModelWithResponseStream"],
             resources=["*"] # Ideally scoped to specific models
         ))
         
@@ -84,20 +141,45 @@ class ServiceStack(Stack):
             resources=["*"] # Ideally scoped to the AppConfig resources
         ))
 
+        # Cold-start options: SnapStart restores initialized snapshots of
+        # published versions; provisioned concurrency keeps instances warm.
+        # Both apply to a version, so the workflow (or API Gateway in direct
+        # mode) then invokes a "live" alias.
+        router_target = router_fn
+        if enable_snapstart:
+            router_fn.node.default_child.add_property_override(
+                "SnapStart", {"ApplyOn": "PublishedVersions"}
+            )
+        if enable_snapstart or provisioned_concurrency:
+            router_target = lambda_.Alias(self, "ModelRouterLiveAlias",
+                alias_name="live",
+                version=router_fn.current_version,
+                provisioned_concurrent_executions=provisioned_concurrency or None
+            )
+
+        if direct_invoke:
+            # Low-latency mode: API Gateway -> router, with fallback and
+            # degradation running inside the router instead of extra states
+            apigw.LambdaRestApi(self, "AssistantApi",
+                handler=router_target,
+                deploy=True
+            )
+            return
 
         # --- Part 3: Step Functions (Circuit Breaker Pattern) ---
         
         # 1. Primary Model (The Router)
         primary_task = tasks.LambdaInvoke(self, "TryPrimaryModel",
-            lambda_function=router_fn,
+            lambda_function=router_target,
             output_path="$.Payload"
         )
 
         # 2. Fallback Model
         fallback_fn = lambda_.Function(self, "FallbackFunction",
-            runtime=lambda_.Runtime.PYTHON_3_9,
+            runtime=LAMBDA_RUNTIME,
             handler="fallback_handler.lambda_handler",
             code=lambda_.Code.from_asset("runtime/workflow"),
+            layers=[shared_layer],
             timeout=Duration.seconds(30),
             environment={}
         )
@@ -113,9 +195,10 @@ class ServiceStack(Stack):
 
         # 3. Graceful Degradation
         degradation_fn = lambda_.Function(self, "DegradationFunction",
-            runtime=lambda_.Runtime.PYTHON_3_9,
+            runtime=LAMBDA_RUNTIME,
             handler="degradation_handler.lambda_handler",
             code=lambda_.Code.from_asset("runtime/workflow"),
+            layers=[shared_layer],
             timeout=Duration.seconds(5)
         )
         
@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Reuse the router's model selection, caches and resilience logic as-is
+RUNTIME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(RUNTIME_DIR, "shared", "python"))
+sys.path.insert(0, os.path.join(RUNTIME_DIR, "model_router"))
+import handler
+
+# Streams a JSONL file through the router. Records are read lazily, at most
+# `max_in_flight` are pending at once (backpressure), and results are written
+# in input order. The checkpoint records how many input records are done and
+# the matching output size, so a resumed run truncates any partial tail and
+# skips the finished records. Memory is bounded by the in-flight window, not
+# the file size.
+
+
+def read_records(path, skip=0):
+    # Yields (line_no, record) lazily; unparsable lines yield an error record
+    with open(path) as f:
+        for line_no, line in enumerate(f):
+            if line_no < skip:
+                continue
+            line = line.strip()
+            if not line:
+                yield line_no, None
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except ValueError as e:
+                yield line_no, {"_error": f"Invalid JSON: {e}"}
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return {"records_done": 0, "output_bytes": 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, records_done, output_bytes):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"records_done": records_done, "output_bytes": output_bytes}, f)
+    os.replace(tmp, path)
+
+
+def process_record(line_no, record, fields):
+    if record is None:
+        return None # Blank line: counted as done, nothing written
+    result = {"line": line_no}
+    if not isinstance(record, dict):
+        result["error"] = "Record is not a JSON object"
+        return result
+    if "_error" in record:
+        result["error"] = record["_error"]
+        return result
+
+    question = record.get(fields["question"])
+    req_type = record.get(fields["type"], "general")
+    if fields["id"] in record:
+        result["id"] = record[fields["id"]]
+    result["type"] = req_type
+    if not question:
+        result["error"] = "Missing question"
+        return result
+
+    try:
+        config = handler.get_config()
+        result.update(handler.handle_question(question, req_type, config))
+    except Exception as e:
+        print(f"Record {line_no} failed: {e}")
+        result["error"] = str(e)
+    return result
+
+
+def run(input_path, output_path, checkpoint_path=None, workers=8, max_in_flight=None,
+        checkpoint_every=10, fields=None):
+    fields = dict({"question": "question", "type": "type", "id": "id"}, **(fields or {}))
+    checkpoint_path = checkpoint_path or output_path + ".checkpoint"
+    max_in_flight = max_in_flight or workers * 2
+
+    if not os.path.exists(checkpoint_path) and os.path.exists(output_path) and os.path.getsize(output_path):
+        raise SystemExit(f"{output_path} exists without a checkpoint; remove it or choose another output")
+    if not os.path.exists(checkpoint_path):
+        # Claim the output before any record runs so a crash before the first
+        # periodic checkpoint still leaves a resumable run
+        save_checkpoint(checkpoint_path, 0, 0)
+
+    checkpoint = load_checkpoint(checkpoint_path)
+    done = checkpoint["records_done"]
+    if done:
+        print(f"Resuming after {done} records")
+
+    with open(output_path, "a+") as out:
+        # Drop anything written after the last checkpoint
+        out.truncate(checkpoint["output_bytes"])
+        out.seek(0, os.SEEK_END)
+
+        pending = deque()
+        written = 0
+
+        def drain_one():
+            nonlocal done, written
+            result = pending.popleft().result()
+            if result is not None:
+                out.write(json.dumps(result) + "\n")
+                written += 1
+            done += 1
+            if done % checkpoint_every == 0:
+                out.flush()
+                save_checkpoint(checkpoint_path, done, out.tell())
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for line_no, record in read_records(input_path, skip=done):
+                if len(pending) >= max_in_flight:
+                    drain_one()
+                pending.append(pool.submit(process_record, line_no, record, fields))
+            while pending:
+                drain_one()
+
+        out.flush()
+        save_checkpoint(checkpoint_path, done, out.tell())
+
+    print(f"Processed {done} records ({written} written this run) -> {output_path}")
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a JSONL file of questions through the model router")
+    parser.add_argument("input", help="Input JSONL, one {\"question\", \"type\"} record per line")
+    parser.add_argument("output", help="Output JSONL (appended to; resumable)")
+    parser.add_argument("--checkpoint", help="Checkpoint path (default: <output>.checkpoint)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent router calls")
+    parser.add_argument("--max-in-flight", type=int, help="Records buffered ahead of the writer (default: 2 x workers)")
+    parser.add_argument("--checkpoint-every", type=int, default=10, help="Records between checkpoints")
+    parser.add_argument("--question-field", default="question")
+    parser.add_argument("--type-field", default="type")
+    parser.add_argument("--id-field", default="id")
+    args = parser.parse_args()
+    run(
+        args.input, args.output,
+        checkpoint_path=args.checkpoint,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        checkpoint_every=args.checkpoint_every,
+        fields={"question": args.question_field, "type": args.type_field, "id": args.id_field}
+    )
@@ -0,0 +1,170 @@
+import io
+import json
+import math
+import random
+import threading
+import time
+
+# Local stand-in for the bedrock-runtime client. Per-model profiles simulate
+# time to first token (lognormal), generation speed (tokens/sec), response
+# length and capacity: calls beyond a model's concurrent capacity or its
+# requests-per-second quota fail with ThrottlingException, like Bedrock
+# on-demand quotas. Profiles can be fitted from a benchmark_report.json.
+# `time_scale` shrinks every simulated delay (0.1 runs 10x faster).
+
+DEFAULT_PROFILE = {
+    "ttft_ms": 400.0,        # median time to first token
+    "ttft_sigma": 0.3,       # lognormal shape of the TTFT distribution
+    "tokens_per_sec": 60.0,
+    "output_tokens": [150],  # sampled uniformly per call
+    "max_concurrency": 32,   # in-flight calls before throttling
+    "rps_quota": 0           # requests/sec before throttling; 0 disables
+}
+
+
+class ThrottlingException(Exception):
+    def __init__(self, model_id):
+        super().__init__(f"Too many requests for {model_id}")
+        self.response = {"Error": {"Code": "ThrottlingException"}}
+
+
+def fit_profiles(results, overrides=None):
+    # latency = ttft + output_tokens / tokens_per_sec, least squares per model
+    samples = {}
+    for r in results:
+        if "error" in r or not r.get("output_tokens"):
+            continue
+        samples.setdefault(r["model"], []).append((r["output_tokens"], r["latency"] * 1000))
+
+    profiles = {}
+    for model, points in samples.items():
+        profile = dict(DEFAULT_PROFILE, output_tokens=[n for n, _ in points])
+        n = len(points)
+        mean_x = sum(x for x, _ in points) / n
+        mean_y = sum(y for _, y in points) / n
+        var_x = sum((x - mean_x) ** 2 for x, _ in points)
+        if var_x > 0:
+            slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+            if slope > 0:
+                profile["tokens_per_sec"] = round(1000.0 / slope, 1)
+                profile["ttft_ms"] = round(max(50.0, mean_y - slope * mean_x), 1)
+        profiles[model] = profile
+    for model, values in (overrides or {}).items():
+        profiles[model] = dict(profiles.get(model, DEFAULT_PROFILE), **values)
+    return profiles
+
+
+def load_report(path):
+    with open(path) as f:
+        report = json.load(f)
+    # Flat list, or {"results": [...]} from a statistical run
+    return report["results"] if isinstance(report, dict) else report
+
+
+def response_body(model_id, text, input_tokens, output_tokens):
+    if "anthropic.claude" in model_id:
+        return {"content": [{"text": text}], "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens}}
+    if "meta.llama" in model_id:
+        return {"generation": text, "prompt_token_count": input_tokens, "generation_token_count": output_tokens}
+    if "mistral." in model_id:
+        return {"outputs": [{"text": text}]}
+    return {"results": [{"outputText": text, "tokenCount": output_tokens}], "inputTextTokenCount": input_tokens}
+
+
+def stream_chunk(model_id, text):
+    if "anthropic.claude" in model_id:
+        return {"type": "content_block_delta", "delta": {"type": "text_delta", "text": text}}
+    if "meta.llama" in model_id:
+        return {"generation": text}
+    if "mistral." in model_id:
+        return {"outputs": [{"text": text}]}
+    return {"outputText": text}
+
+
+class BedrockSimulator:
+    def __init__(self, profiles=None, default_profile=None, time_scale=1.0, seed=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.profiles = profiles or {}
+        self.default_profile = dict(DEFAULT_PROFILE, **(default_profile or {}))
+        self.time_scale = time_scale
+        self.rng = random.Random(seed)
+        self.clock = clock
+        self.sleep = sleep
+        self.in_flight = {}
+        self.windows = {}
+        self.counters = {"calls": 0, "throttled": 0}
+        self.lock = threading.Lock()
+
+    def profile(self, model_id):
+        return self.profiles.get(model_id, self.default_profile)
+
+    def _admit(self, model_id, profile):
+        # Capacity check; raises ThrottlingException when over quota
+        with self.lock:
+            self.counters["calls"] += 1
+            now = self.clock()
+            window = self.windows.setdefault(model_id, [])
+            while window and now - window[0] >= 1.0 * self.time_scale:
+                window.pop(0)
+            quota = profile["rps_quota"]
+            if self.in_flight.get(model_id, 0) >= profile["max_concurrency"] or (quota and len(window) >= quota):
+                self.counters["throttled"] += 1
+                raise ThrottlingException(model_id)
+            window.append(now)
+            self.in_flight[model_id] = self.in_flight.get(model_id, 0) + 1
+
+    def _release(self, model_id):
+        with self.lock:
+            self.in_flight[model_id] -= 1
+
+    def _sample(self, profile):
+        with self.lock:
+            ttft_ms = profile["ttft_ms"] * math.exp(self.rng.gauss(0.0, profile["ttft_sigma"]))
+            output_tokens = self.rng.choice(profile["output_tokens"])
+        return ttft_ms, output_tokens
+
+    def invoke_model(self, body, modelId, **kwargs):
+        profile = self.profile(modelId)
+        self._admit(modelId, profile)
+        try:
+            ttft_ms, output_tokens = self._sample(profile)
+            gen_ms = output_tokens / profile["tokens_per_sec"] * 1000.0
+            self.sleep((ttft_ms + gen_ms) / 1000.0 * self.time_scale)
+        finally:
+            self._release(modelId)
+        input_tokens = max(1, len(body) // 4)
+        payload = response_body(modelId, "simulated " * min(output_tokens, 20), input_tokens, output_tokens)
+        return {"body": io.BytesIO(json.dumps(payload).encode()), "ResponseMetadata": {"HTTPHeaders": {
+            "x-amzn-bedrock-input-token-count": str(input_tokens),
+            "x-amzn-bedrock-output-token-count": str(output_tokens)
+        }}}
+
+    def invoke_model_with_response_stream(self, body, modelId, **kwargs):
+        profile = self.profile(modelId)
+        self._admit(modelId, profile)
+        ttft_ms, output_tokens = self._sample(profile)
+        input_tokens = max(1, len(body) // 4)
+        chunk_tokens = 10
+
+        def events():
+            try:
+                self.sleep(ttft_ms / 1000.0 * self.time_scale)
+                sent = 0
+                while sent < output_tokens:
+                    n = min(chunk_tokens, output_tokens - sent)
+                    if sent:
+                        self.sleep(n / profile["tokens_per_sec"] * self.time_scale)
+                    sent += n
+                    chunk = stream_chunk(modelId, "simulated " * n)
+                    if sent >= output_tokens:
+                        chunk["amazon-bedrock-invocationMetrics"] = {
+                            "inputTokenCount": input_tokens, "outputTokenCount": output_tokens
+                        }
+                    yield {"chunk": {"bytes": json.dumps(chunk).encode()}}
+            finally:
+                self._release(modelId)
+        return {"body": events()}
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
@@ -1,8 +1,22 @@
-import boto3
+import argparse
 import json
+import os
+import sys
+import threading
 import time
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
+from latency_stats import summarize
+from result_store import ResultStore, DEFAULT_STORE
+
+# Model adapters are shared with the Lambda functions (deployed as a layer)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared", "python"))
+from aws_clients import get_client
+from model_adapters import get_adapter
+from pricing import estimate_cost
+import compliance
+import prompt_templates
 
 # Configuration
 MODELS = [
@@ -18,94 +32,135 @@ QUESTIONS = [
     "What should I do if I suspect fraudulent activity on my account?"
 ]
 
-# Pricing (Approximate per 1M tokens for estimation)
-PRICING = {
-    "anthropic.claude-3-sonnet-20240229-v1:0": {"input": 3.00, "output": 15.00},
-    "meta.llama3-8b-instruct-v1:0": {"input": 0.40, "output": 0.60},
-    "mistral.mistral-7b-instruct-v0:2": {"input": 0.15, "output": 0.20}
-}
+# Concurrency limits for the benchmark engine
+MAX_CONCURRENCY = int(os.environ.get("BENCHMARK_MAX_CONCURRENCY", "8")) # Overall in-flight calls
+PER_MODEL_CONCURRENCY = int(os.environ.get("BENCHMARK_PER_MODEL_CONCURRENCY", "2")) # In-flight calls per model
+RATE_LIMIT_RPS = float(os.environ.get("BENCHMARK_RATE_LIMIT_RPS", "4")) # Sustained requests/sec across all models
+RATE_LIMIT_BURST = int(os.environ.get("BENCHMARK_RATE_LIMIT_BURST", "4"))
+
+BEDROCK_REGION = 'us-east-1'
+
+class TokenBucket:
+    # Thread-safe token bucket: `rate` tokens/sec refill, up to `capacity` tokens of burst
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1, rate))
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.last = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return  # Rate limiting disabled
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
 
-bedrock = boto3.client(service_name='bedrock-runtime', region_name='us-east-1')
+def read_stream(adapter, response, start_ns):
+    # Drains an invoke_model_with_response_stream body.
+    # Returns (text, input_tokens, output_tokens, ttft_ns, (cache_read, cache_write));
+    # token counts come from the invocation metrics Bedrock attaches to the final chunk.
+    parts = []
+    input_tokens = 0
+    output_tokens = 0
+    cache_read = cache_write = 0
+    ttft_ns = None
+    for event in response['body']:
+        chunk = event.get('chunk')
+        if not chunk:
+            continue
+        text, usage = adapter.decode_chunk(json.loads(chunk['bytes']))
+        if text:
+            if ttft_ns is None:
+                ttft_ns = time.perf_counter_ns() - start_ns
+            parts.append(text)
+        if usage:
+            input_tokens = usage.get('input_tokens') or input_tokens
+            output_tokens = usage.get('output_tokens') or output_tokens
+            cache_read = usage.get('cache_read_tokens', cache_read)
+            cache_write = usage.get('cache_write_tokens', cache_write)
+    return "".join(parts), input_tokens, output_tokens, ttft_ns, (cache_read, cache_write)
 
-def invoke_model(model_id, prompt):
+def invoke_model(model_id, prompt, client=None, stream=False, system=None, keep_text=False):
+    client = client or get_client('bedrock-runtime', region_name=BEDROCK_REGION)
     print(f"Invoking {model_id}...")
-    
-    body = ""
-    if "claude" in model_id:
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 512,
-            "messages": [{"role": "user", "content": prompt}]
-        })
-    elif "llama3" in model_id:
-        formatted_prompt = f"<|begin_of_text|><|start_header_id|>user<|end_header_id|>\n\n{prompt}<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"
-        body = json.dumps({
-            "prompt": formatted_prompt,
-            "max_gen_len": 512,
-            "temperature": 0.5,
-            "top_p": 0.9
-        })
-    elif "mistral" in model_id:
-        formatted_prompt = f"<s>[INST] {prompt} [/INST]"
-        body = json.dumps({
-            "prompt": formatted_prompt,
-            "max_tokens": 512,
-            "temperature": 0.5,
-            "top_p": 0.9,
-            "top_k": 50
-        })
-
-    start_time = time.time()
+
+    # Same adapter (prompt template, parameters, parser) the router uses
+    adapter = get_adapter(model_id)
+    body = adapter.build_body(prompt, system=system, cache_prefix=prompt_templates.use_cache(model_id, system))
+
+    start_time = time.perf_counter_ns()
+    ttft_ns = None
     try:
-        response = bedrock.invoke_model(
-            body=body,
-            modelId=model_id,
-            accept='application/json',
-            contentType='application/json'
-        )
-        end_time = time.time()
-        latency = end_time - start_time
-        
-        response_body = json.loads(response.get('body').read())
-        output_text = ""
-        input_tokens = 0
-        output_tokens = 0
-        
-        # Parse response based on model
-        if "claude" in model_id:
-            output_text = response_body['content'][0]['text']
-            input_tokens = response_body['usage']['input_tokens']
-            output_tokens = response_body['usage']['output_tokens']
-        elif "llama3" in model_id:
-            output_text = response_body['generation']
-            input_tokens = response_body['prompt_token_count']
-            output_tokens = response_body['generation_token_count']
-        elif "mistral" in model_id:
-            output_text = response_body['outputs'][0]['text']
-            # Mistral might not return token counts in headers, estimating if missing
-            # Checking headers if available usually `x-amzn-bedrock-input-token-count`
-            headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
-            input_tokens = int(headers.get('x-amzn-bedrock-input-token-count', len(prompt.split()) * 1.3))
-            output_tokens = int(headers.get('x-amzn-bedrock-output-token-count', len(output_text.split()) * 1.3))
-
-        # Cost Calculation
-        price_cfg = PRICING.get(model_id, {"input": 0, "output": 0})
-        cost = (input_tokens / 1_000_000 * price_cfg['input']) + (output_tokens / 1_000_000 * price_cfg['output'])
-
-        # Guardrail Check (Simple keyword check simulation)
-        compliance_check = "PASS"
-        if "error" in output_text.lower() or "sorry" in output_text.lower():
-            compliance_check = "FLAGGED"
+        if stream:
+            response = client.invoke_model_with_response_stream(
+                body=body,
+                modelId=model_id,
+                accept='application/json',
+                contentType='application/json'
+            )
+            output_text, input_tokens, output_tokens, ttft_ns, cache_usage = read_stream(adapter, response, start_time)
+            latency_ns = time.perf_counter_ns() - start_time
+            if not input_tokens:
+                input_tokens = adapter.estimate_tokens(prompt)
+            if not output_tokens:
+                output_tokens = adapter.estimate_tokens(output_text)
+        else:
+            response = client.invoke_model(
+                body=body,
+                modelId=model_id,
+                accept='application/json',
+                contentType='application/json'
+            )
+            latency_ns = time.perf_counter_ns() - start_time
+            parsed = adapter.parse_result(response, prompt)
+            output_text, input_tokens, output_tokens = parsed['text'], parsed['input_tokens'], parsed['output_tokens']
+            cache_usage = (parsed['cache_read_tokens'], parsed['cache_write_tokens'])
+        latency = latency_ns / 1e9
 
-        return {
+        # Cost Calculation; prompt-cache tokens are billed apart from input_tokens
+        cache_read, cache_write = cache_usage
+        cost = estimate_cost(model_id, input_tokens, output_tokens, cache_read, cache_write)
+        uncached_cost = estimate_cost(model_id, input_tokens + cache_read + cache_write, output_tokens)
+
+        # Same compliance scanner the router runs on its responses
+        findings = compliance.DEFAULT.scan(output_text)
+
+        result = {
             "model": model_id,
             "latency": round(latency, 4),
+            "latency_ns": latency_ns,
             "input_tokens": int(input_tokens),
             "output_tokens": int(output_tokens),
+            "estimated_input_tokens": adapter.estimate_tokens(prompt) + adapter.estimate_tokens(system),
+            "cache_read_tokens": int(cache_read),
+            "cache_write_tokens": int(cache_write),
             "cost": round(cost, 6),
-            "compliance": compliance_check,
+            "cache_savings": round(uncached_cost - cost, 6),
+            "compliance": compliance.verdict(findings),
             "response_preview": output_text[:50].replace("\n", " ") + "..."
         }
+        if findings:
+            result["compliance_findings"] = compliance.summarize(findings)
+        if keep_text:
+            # Full answer for quality scoring (evaluate_model.py)
+            result["output_text"] = output_text
+        if stream and ttft_ns is not None:
+            # Generation rate after the first token arrives
+            generation_s = (latency_ns - ttft_ns) / 1e9
+            result["ttft"] = round(ttft_ns / 1e9, 4)
+            result["ttft_ns"] = ttft_ns
+            result["tokens_per_sec"] = round(int(output_tokens) / generation_s, 2) if generation_s > 0 else None
+        return result
 
     except ClientError as e:
         print(f"Error invoking {model_id}: {e}")
@@ -120,18 +175,86 @@ def invoke_model(model_id, prompt):
             "error": str(e)
         }
 
-def run_benchmark():
-    results = []
+def run_matrix(models, questions, client=None, max_concurrency=MAX_CONCURRENCY,
+               per_model_concurrency=PER_MODEL_CONCURRENCY, rate_limiter=None, repetitions=1,
+               stream=False, templates=None, req_type="general", keep_text=False, systems=None):
+    # Runs every model x question pair (x repetitions) concurrently. Each model gets
+    # its own lane (semaphore) so one slow model cannot hold every worker, and all
+    # lanes share the token bucket. Results come back in model-major order like the
+    # serial loop. systems: optional per-question system prompt that replaces the
+    # template's (None entries keep it).
+    if rate_limiter is None:
+        rate_limiter = TokenBucket(RATE_LIMIT_RPS, RATE_LIMIT_BURST)
+    lanes = {model: threading.BoundedSemaphore(per_model_concurrency) for model in models}
+
+    templates = templates or prompt_templates.EMPTY
+
+    def run_one(model, question, repetition, system_override=None):
+        # Same system prefix and template the router would use for req_type
+        system, prompt = templates.render(req_type, question)
+        if system_override is not None:
+            system = system_override
+        with lanes[model]:
+            rate_limiter.acquire()
+            result = invoke_model(model, prompt, client=client, stream=stream, system=system, keep_text=keep_text)
+        result['question'] = question[:30] + "..."
+        if repetitions > 1:
+            result['repetition'] = repetition
+        return result
+
+    # Submit question-major so the pool interleaves models instead of draining one lane first
+    futures = {}
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        for rep in range(repetitions):
+            for q_idx, question in enumerate(questions):
+                for m_idx, model in enumerate(models):
+                    futures[(m_idx, q_idx, rep)] = pool.submit(run_one, model, question, rep,
+                                                               systems[q_idx] if systems else None)
+
+    return [futures[key].result() for key in sorted(futures)]
+
+def cache_summary(results):
+    # Per-model prompt-cache effect: share of input tokens read from cache and
+    # the net cost saved versus sending every prefix uncached
+    summary = {}
+    for r in results:
+        if 'error' in r:
+            continue
+        entry = summary.setdefault(r['model'], {"input_tokens": 0, "cache_read_tokens": 0,
+                                                "cache_write_tokens": 0, "cache_savings": 0.0})
+        entry["input_tokens"] += r['input_tokens'] + r['cache_read_tokens'] + r['cache_write_tokens']
+        entry["cache_read_tokens"] += r['cache_read_tokens']
+        entry["cache_write_tokens"] += r['cache_write_tokens']
+        entry["cache_savings"] += r['cache_savings']
+    for entry in summary.values():
+        entry["cached_share"] = round(entry["cache_read_tokens"] / entry["input_tokens"], 4) if entry["input_tokens"] else 0.0
+        entry["cache_savings"] = round(entry["cache_savings"], 6)
+    return summary
+
+def run_benchmark(client=None, models=None, questions=None, report_path='benchmark_report.json',
+                  warmup=0, repetitions=1, stream=False, templates=None, req_type="general",
+                  store_path=DEFAULT_STORE, run_id=None, label=""):
+    # Default mode writes one sample per model/question as a flat list.
+    # Statistical mode (warmup > 0 or repetitions > 1) discards warmup calls and
+    # writes {"results": [...], "summary": {...}} with per-model percentiles.
+    # Every run is also appended to the result history at store_path (None skips it).
+    models = models or MODELS
+    questions = questions or QUESTIONS
+    statistical = warmup > 0 or repetitions > 1
+
     print("Starting Benchmark...")
     print("-" * 60)
-    
-    for model in MODELS:
-        for question in QUESTIONS:
-            result = invoke_model(model, question)
-            result['question'] = question[:30] + "..."
-            results.append(result)
-            time.sleep(1) # Rate limit nice-ness
-            
+
+    if warmup > 0:
+        # Warm connections and model endpoints; these samples are discarded
+        print(f"Warming up with {warmup} call(s) per model...")
+        run_matrix(models, questions[:1] * warmup, client=client, stream=stream, templates=templates, req_type=req_type)
+
+    start = time.perf_counter()
+    results = run_matrix(models, questions, client=client, repetitions=repetitions, stream=stream,
+                         templates=templates, req_type=req_type)
+    wall_clock = time.perf_counter() - start
+
     # Generate Report
     print("-" * 60)
     print(f"{'Model':<40} | {'Latency':<8} | {'Cost':<8} | {'Compliance':<10}")
@@ -141,11 +264,70 @@ def run_benchmark():
             print(f"{r['model']:<40} | ERROR    | -        | -")
         else:
             print(f"{r['model']:<40} | {r['latency']:<8} | ${r['cost']:<8} | {r['compliance']:<10}")
+            if 'ttft' in r:
+                print(f"{'':<40} | TTFT {r['ttft']}s, {r['tokens_per_sec']} tokens/s")
+            if 'compliance_findings' in r:
+                print(f"{'':<40} | Flagged: {json.dumps(r['compliance_findings'])}")
+
+    report = results
+    if statistical:
+        summary = summarize(results)
+        report = {
+            "warmup": warmup,
+            "repetitions": repetitions,
+            "results": results,
+            "summary": summary
+        }
+        print("-" * 60)
+        print(f"{'Model':<40} | {'p50':<8} | {'p90':<8} | {'p99':<8} | {'Stddev':<8}")
+        print("-" * 60)
+        for model, stats in summary.items():
+            if not stats["count"]:
+                print(f"{model:<40} | ERROR    | -        | -        | -")
+                continue
+            print(f"{model:<40} | {stats['p50']:<8} | {stats['p90']:<8} | {stats['p99']:<8} | {stats['stddev']:<8}")
+
+    if templates is not None:
+        savings = cache_summary(results)
+        if isinstance(report, list):
+            report = {"results": results}
+        report["prompt_cache"] = savings
+        print("-" * 60)
+        print(f"{'Model':<40} | {'Input tok':<9} | {'Cached %':<8} | {'Saved':<9}")
+        print("-" * 60)
+        for model, entry in savings.items():
+            print(f"{model:<40} | {entry['input_tokens']:<9} | {entry['cached_share'] * 100:<8.1f} | ${entry['cache_savings']:<9}")
 
     # Save to file
-    with open('benchmark_report.json', 'w') as f:
-        json.dump(results, f, indent=2)
-    print("\nBenchmark complete. Report saved to benchmark_report.json")
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nBenchmark complete in {wall_clock:.2f}s. Report saved to {report_path}")
+    if store_path:
+        run = ResultStore(store_path).append(
+            results, run_id=run_id, label=label, stream=stream, warmup=warmup, repetitions=repetitions,
+            req_type=req_type, wall_clock=round(wall_clock, 3)
+        )
+        print(f"Run {run['run_id']} appended to {store_path}")
+    return results
 
 if __name__ == "__main__":
-    run_benchmark()
+    parser = argparse.ArgumentParser(description="Benchmark Bedrock models on the customer-service question set")
+    parser.add_argument("--warmup", type=int, default=0, help="Discarded warmup calls per model")
+    parser.add_argument("--repetitions", type=int, default=1, help="Measured runs per model/question")
+    parser.add_argument("--stream", action="store_true", help="Use the response stream and record TTFT and tokens/sec")
+    parser.add_argument("--output", default="benchmark_report.json", help="Report path")
+    parser.add_argument("--templates", help="AppConfig document (JSON) whose prompt_templates are applied")
+    parser.add_argument("--type", default="general", help="Request type whose template is used")
+    parser.add_argument("--store", default=DEFAULT_STORE, help="Result history directory (see result_store.py)")
+    parser.add_argument("--no-store", action="store_true", help="Do not append this run to the history")
+    parser.add_argument("--run-id", help="Id for this run in the history (default: timestamp-based)")
+    parser.add_argument("--label", default="", help="Free-form label stored with the run")
+    args = parser.parse_args()
+
+    templates = None
+    if args.templates:
+        with open(args.templates) as f:
+            templates = prompt_templates.templates_for(json.load(f))
+    run_benchmark(report_path=args.output, warmup=args.warmup, repetitions=args.repetitions, stream=args.stream,
+                  templates=templates, req_type=args.type, store_path=None if args.no_store else args.store,
+                  run_id=args.run_id, label=args.label)
@@ -0,0 +1,122 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Measures cold-start cost of the Lambda handlers locally. Each sample is a
+# fresh interpreter, like a new Lambda container:
+#   import_ms - importing the handler module (Lambda "Init Duration")
+#   first_call_ms - first invocation against a stubbed Bedrock client
+#   client_init_ms - constructing the real bedrock-runtime client (boto3 import
+#                    plus client creation; no network), paid on the first real call
+# `-X importtime` output is aggregated to show which imports dominate.
+
+RUNTIME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+HANDLERS = {
+    "router": ("model_router", "handler", {"question": "What is the inflation rate?"}),
+    "fallback": ("workflow", "fallback_handler", {"question": "What is the inflation rate?"}),
+    "degradation": ("workflow", "degradation_handler", {})
+}
+
+# Runs inside the child interpreter; prints one JSON line
+PROBE = """
+import io, json, sys, time
+t0 = time.perf_counter()
+module = __import__(sys.argv[1])
+t1 = time.perf_counter()
+
+class StubBedrock:
+    def invoke_model(self, body, modelId, **kwargs):
+        if "titan" in modelId:
+            payload = {"results": [{"outputText": "ok", "tokenCount": 1}], "inputTextTokenCount": 1}
+        else:
+            payload = {"content": [{"text": "ok"}], "usage": {"input_tokens": 1, "output_tokens": 1}}
+        return {"body": io.BytesIO(json.dumps(payload).encode())}
+
+import aws_clients
+aws_clients.set_client("bedrock-runtime", StubBedrock())
+module.lambda_handler(json.loads(sys.argv[2]), None)
+t2 = time.perf_counter()
+aws_clients.get_client("bedrock-runtime", region_name="us-east-1")
+t3 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "first_call_ms": (t2 - t1) * 1000, "client_init_ms": (t3 - t2) * 1000}))
+"""
+
+
+def child_env(code_dir):
+    env = dict(os.environ)
+    paths = [os.path.join(RUNTIME_DIR, code_dir), os.path.join(RUNTIME_DIR, "shared", "python")]
+    env["PYTHONPATH"] = os.pathsep.join(paths + [env.get("PYTHONPATH", "")])
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    env["RESPONSE_CACHE_TABLE"] = "" # Keep the probe off the network
+    return env
+
+
+def measure(name, runs):
+    code_dir, module, event = HANDLERS[name]
+    env = child_env(code_dir)
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE, module, json.dumps(event)],
+            env=env, capture_output=True, text=True, check=True
+        )
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {
+        "import_ms": round(statistics.median(s["import_ms"] for s in samples), 2),
+        "first_call_ms": round(statistics.median(s["first_call_ms"] for s in samples), 2),
+        "client_init_ms": round(statistics.median(s["client_init_ms"] for s in samples), 2),
+        "runs": runs
+    }
+
+
+def top_imports(name, limit):
+    # Cumulative time of each module the handler imports, from `python -X importtime`
+    code_dir, module, _ = HANDLERS[name]
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=child_env(code_dir), capture_output=True, text=True, check=True
+    )
+    totals = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, package = line[len("import time:"):].split("|")
+        # Nesting is shown by two spaces per level; count the handler's direct
+        # imports (level 1) so nothing is double counted
+        package = package[1:]
+        name = package.lstrip()
+        if (len(package) - len(name)) // 2 == 1:
+            root = name.split(".")[0]
+            totals[root] = totals.get(root, 0) + int(cumulative)
+    ranked = sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+    return [{"module": m, "ms": round(us / 1000, 2)} for m, us in ranked]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure handler import time and first-call init cost")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per handler")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    parser.add_argument("--output", help="Optional JSON report path")
+    args = parser.parse_args()
+
+    report = {}
+    print(f"{'Handler':<12} | {'Import ms':<10} | {'First call ms':<13} | {'Client init ms':<14}")
+    print("-" * 59)
+    for name in HANDLERS:
+        result = measure(name, args.runs)
+        result["top_imports"] = top_imports(name, args.top)
+        report[name] = result
+        print(f"{name:<12} | {result['import_ms']:<10} | {result['first_call_ms']:<13} | {result['client_init_ms']:<14}")
+
+    for name, result in report.items():
+        print(f"\nSlowest imports ({name}):")
+        for entry in result["top_imports"]:
+            print(f"  {entry['module']:<30} {entry['ms']} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
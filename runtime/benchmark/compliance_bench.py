@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+from latency_stats import percentile
+
+# Throughput of the compliance scanner the router runs on every response,
+# one-shot and streamed in chunks, against the old substring check and a
+# naive loop of one regex per rule. Answers are synthetic banking prose of
+# each --sizes length with PII and flagged phrases planted at --plant-rate
+# per KB. The router budget is well under 1 ms per KB of answer.
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared", "python"))
+import compliance
+
+SENTENCES = [
+    "To dispute a transaction, sign in and select the charge from your statement.",
+    "If there is an error on your statement, contact us within 60 days.",
+    "A Roth IRA is funded with after-tax dollars, so qualified withdrawals are tax-free.",
+    "High-yield savings accounts pay a variable rate that can change at any time.",
+    "We will never ask for your password or one-time passcode by phone.",
+    "Your account statements are available for the last seven years.",
+    "Transfers made before 8 pm ET on business days post the same day.",
+    "Call 1-800-555-0199 if you suspect fraudulent activity."
+]
+
+PLANTS = [
+    "Your card 4111 1111 1111 1111 has been locked.",
+    "The SSN on file is 123-45-6789.",
+    "Funds went to account number 000123456789.",
+    "This fund offers guaranteed returns.",
+    "As an AI language model I cannot see your balance."
+]
+
+
+def make_answer(size, plant_rate, rng):
+    # Each sentence is swapped for a planted one with probability
+    # plant_rate * its length / 1 KB
+    parts = []
+    length = 0
+    planted = 0
+    while length < size:
+        text = rng.choice(SENTENCES)
+        if rng.random() < plant_rate * len(text) / 1024:
+            text = rng.choice(PLANTS)
+            planted += 1
+        parts.append(text)
+        length += len(text) + 1
+    return " ".join(parts)[:size], planted
+
+
+def substring_check(text):
+    # The benchmark's previous guardrail
+    lowered = text.lower()
+    return "error" in lowered or "sorry" in lowered
+
+
+def naive_patterns():
+    # One compiled regex per rule, run one after another
+    patterns = [re.compile(re.escape(p), re.IGNORECASE)
+                for phrases in compliance.DEFAULT_PHRASES.values() for p in phrases]
+    patterns.append(re.compile(r"(?<![\d-])[3-6](?:[ -]?\d){12,18}(?![\d-])"))
+    patterns.append(re.compile(r"(?<![\d-])\d{3}([- ])\d{2}\1\d{4}(?![\d-])"))
+    patterns.append(re.compile(r"(?i:\b(?:account|acct|a/c|routing|iban)(?:\s+(?:number|no\.?))?\s*[:#]?\s*)\d[\d -]{4,20}\d"))
+    return patterns
+
+
+def naive_check(patterns, text):
+    return [m.span() for p in patterns for m in p.finditer(text)]
+
+
+def stream_scan(scanner, text, chunk_chars):
+    scan = scanner.stream()
+    for i in range(0, len(text), chunk_chars):
+        scan.feed(text[i:i + chunk_chars])
+    scan.finish()
+    return scan.findings
+
+
+def measure(fn, texts, repeat):
+    # Microseconds per KB for each call, over `repeat` passes of the corpus
+    samples = []
+    for _ in range(repeat):
+        for text in texts:
+            start = time.perf_counter_ns()
+            fn(text)
+            samples.append((time.perf_counter_ns() - start) / 1000 / (len(text) / 1024))
+    samples.sort()
+    return {
+        "p50_us_per_kb": round(percentile(samples, 50), 2),
+        "p99_us_per_kb": round(percentile(samples, 99), 2),
+        "mb_per_s": round(1024 / percentile(samples, 50), 1) if samples[0] > 0 else None
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark compliance scanner throughput")
+    parser.add_argument("--sizes", default="256,1024,4096,16384", help="Comma-separated answer sizes in bytes")
+    parser.add_argument("--answers", type=int, default=50, help="Answers per size")
+    parser.add_argument("--repeat", type=int, default=20, help="Passes over the corpus per method")
+    parser.add_argument("--plant-rate", type=float, default=1.0, help="Planted findings per KB")
+    parser.add_argument("--chunk-chars", type=int, default=20, help="Chunk size for the streaming scan")
+    parser.add_argument("--budget-us", type=float, default=1000.0, help="Budget in microseconds per KB")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Optional JSON report path")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    scanner = compliance.Scanner()
+    patterns = naive_patterns()
+    methods = {
+        "substring": substring_check,
+        "naive_regex": lambda text: naive_check(patterns, text),
+        "scanner": scanner.scan,
+        "stream": lambda text: stream_scan(scanner, text, args.chunk_chars)
+    }
+
+    report = {"budget_us_per_kb": args.budget_us, "sizes": {}}
+    print(f"{'Size':<6} | {'Method':<11} | {'p50 us/KB':<10} | {'p99 us/KB':<10} | {'MB/s':<7} | Findings")
+    print("-" * 70)
+    for size in [int(x) for x in args.sizes.split(",")]:
+        texts = []
+        planted = 0
+        for _ in range(args.answers):
+            text, n = make_answer(size, args.plant_rate, rng)
+            texts.append(text)
+            planted += n
+        found = sum(len(scanner.scan(t)) for t in texts)
+        streamed = sum(len(stream_scan(scanner, t, args.chunk_chars)) for t in texts)
+        if streamed != found:
+            print(f"WARNING: streaming found {streamed} findings, one-shot {found}")
+        level = {"planted": planted, "findings": found, "stream_findings": streamed}
+        for name, fn in methods.items():
+            result = measure(fn, texts, args.repeat)
+            level[name] = result
+            count = found if name in ("scanner", "stream") else "-"
+            print(f"{size:<6} | {name:<11} | {result['p50_us_per_kb']:<10} | {result['p99_us_per_kb']:<10} | "
+                  f"{str(result['mb_per_s']):<7} | {count}")
+        report["sizes"][size] = level
+
+    worst = max(max(level["scanner"]["p99_us_per_kb"], level["stream"]["p99_us_per_kb"])
+                for level in report["sizes"].values())
+    report["within_budget"] = worst <= args.budget_us
+    print(f"\nWorst p99: {worst} us/KB ({'within' if report['within_budget'] else 'OVER'} the {args.budget_us:g} us/KB budget)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from bedrock_simulator import response_body, stream_chunk
+from latency_stats import percentile
+
+# Microbenchmark of the JSON work on the router's hot path, per stage, with
+# the stdlib json module and (when installed) orjson:
+#   log_event      json.dumps of the API Gateway event (LOG_EVENTS)
+#   parse_body     json.loads of the request body
+#   encode_request json.dumps of the Bedrock request body (adapter.build_body)
+#   decode_reply   json.loads of the Bedrock response body (adapter.parse_result)
+#   decode_stream  json.loads of every response-stream chunk
+#   emit_metrics   json.dumps of the two EMF records (model call, request)
+#   serialize      json.dumps of the response payload
+# orjson returns bytes; the str the router needs is decoded inside the timed
+# call. It also writes non-ASCII characters as UTF-8 where the stdlib
+# escapes them, so answers with such characters get shorter bodies.
+# `--invoke-ms` puts the per-request total next to a typical Bedrock call.
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared", "python"))
+from model_adapters import get_adapter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+WORDS = ("your account balance statement transfer savings rate fee card dispute "
+         "deposit interest payment credit limit fraud alert routing").split()
+
+
+def text_of(tokens, offset=0):
+    return " ".join(WORDS[(offset + i) % len(WORDS)] for i in range(tokens))
+
+
+def make_payloads(model_id, prompt_tokens, answer_tokens, chunk_tokens=10):
+    # One request's JSON documents, shaped like the router's
+    prompt = text_of(prompt_tokens)
+    answer = text_of(answer_tokens, 3)
+    body = {"question": prompt, "type": "general"}
+    event = {
+        "resource": "/ask", "path": "/ask", "httpMethod": "POST",
+        "headers": {"Content-Type": "application/json", "Host": "abc123.execute-api.us-east-1.amazonaws.com",
+                    "User-Agent": "python-requests/2.31.0", "X-Forwarded-For": "203.0.113.7"},
+        "requestContext": {"requestId": "c6af9ac6-7b61-11e6-9a41-93e8deadbeef", "stage": "prod",
+                           "identity": {"sourceIp": "203.0.113.7"}},
+        "body": json.dumps(body),
+        "isBase64Encoded": False
+    }
+    request = get_adapter(model_id).build_request(prompt, 512, "You are a helpful banking assistant.")
+    reply = json.dumps(response_body(model_id, answer, prompt_tokens, answer_tokens)).encode()
+    words = answer.split(" ")
+    chunks = [json.dumps(stream_chunk(model_id, " ".join(words[i:i + chunk_tokens]) + " ")).encode()
+              for i in range(0, len(words), chunk_tokens)]
+    emf = [{
+        "_aws": {"Timestamp": 1700000000000, "CloudWatchMetrics": [{
+            "Namespace": "GenAIModelRouter", "Dimensions": [[dimension]],
+            "Metrics": [{"Name": name, "Unit": "Milliseconds"} for name in names]}]},
+        dimension: value,
+        **{name: 12.34 for name in names}
+    } for dimension, value, names in (
+        ("Model", model_id, ("EncodeLatency", "InvokeLatency", "DecodeLatency", "InputTokens", "OutputTokens", "Cost")),
+        ("RequestType", "general", ("LogLatency", "ParseLatency", "ConfigLatency", "HandleLatency", "SerializeLatency",
+                                    "RequestLatency"))
+    )]
+    payload = {"answer": answer, "model_used": model_id}
+    return {
+        "log_event": ("dumps", [event]),
+        "parse_body": ("loads", [event["body"]]),
+        "encode_request": ("dumps", [request]),
+        "decode_reply": ("loads", [reply]),
+        "decode_stream": ("loads", chunks),
+        "emit_metrics": ("dumps", emf),
+        "serialize": ("dumps", [payload])
+    }
+
+
+def codecs():
+    available = {"stdlib": {"dumps": json.dumps, "loads": json.loads}}
+    if orjson is not None:
+        available["orjson"] = {"dumps": lambda obj: orjson.dumps(obj).decode(), "loads": orjson.loads}
+    return available
+
+
+def measure(fn, documents, number, repeat):
+    # Microseconds per stage (all documents once), p50 and p99 over `repeat`
+    # samples of `number` loops each
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            for document in documents:
+                fn(document)
+        samples.append((time.perf_counter_ns() - start) / number / 1000)
+    samples.sort()
+    return {"p50_us": round(percentile(samples, 50), 2), "p99_us": round(percentile(samples, 99), 2)}
+
+
+def check_roundtrip(codec, kind, documents):
+    # Both codecs must produce equivalent documents
+    for document in documents:
+        if kind == "dumps":
+            assert json.loads(codec["dumps"](document)) == document
+        else:
+            assert codec["loads"](document) == json.loads(document)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark JSON serialize/parse stages of a router request")
+    parser.add_argument("--model", default="anthropic.claude-3-sonnet-20240229-v1:0", help="Model whose body shapes are used")
+    parser.add_argument("--prompt-tokens", type=int, default=60)
+    parser.add_argument("--answer-tokens", type=int, default=300)
+    parser.add_argument("--number", type=int, default=200, help="Loops per sample")
+    parser.add_argument("--repeat", type=int, default=30, help="Samples per stage and codec")
+    parser.add_argument("--invoke-ms", type=float, default=800.0, help="Typical Bedrock call, for the share column")
+    parser.add_argument("--output", help="Optional JSON report path")
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.model, args.prompt_tokens, args.answer_tokens)
+    available = codecs()
+    if orjson is None:
+        print("orjson is not installed; measuring the stdlib only (pip install orjson)")
+
+    report = {"model": args.model, "codecs": list(available), "stages": {}, "totals": {}}
+    names = list(available)
+    print(f"{'Stage':<15} | {'Bytes':<6} | " + " | ".join(f"{n + ' p50 us':<14}" for n in names) +
+          (" | Speedup" if len(names) > 1 else ""))
+    print("-" * (28 + 17 * len(names) + 10))
+    for stage, (kind, documents) in payloads.items():
+        size = sum(len(d) for d in documents) if kind == "loads" else sum(len(json.dumps(d)) for d in documents)
+        entry = {"kind": kind, "documents": len(documents), "bytes": size}
+        for name, codec in available.items():
+            check_roundtrip(codec, kind, documents)
+            entry[name] = measure(codec[kind], documents, args.number, args.repeat)
+            report["totals"][name] = report["totals"].get(name, 0.0) + entry[name]["p50_us"]
+        if "orjson" in entry:
+            entry["speedup"] = round(entry["stdlib"]["p50_us"] / entry["orjson"]["p50_us"], 2)
+        report["stages"][stage] = entry
+        print(f"{stage:<15} | {size:<6} | " + " | ".join(f"{entry[n]['p50_us']:<14}" for n in names) +
+              (f" | {entry['speedup']}x" if "speedup" in entry else ""))
+
+    print("-" * (28 + 17 * len(names) + 10))
+    for name, total in report["totals"].items():
+        share = total / 1000 / args.invoke_ms
+        report["totals"][name] = {"p50_us": round(total, 2), "share_of_invoke": round(share, 6)}
+        print(f"{name}: {total:.1f} us of JSON work per request, {share:.3%} of a {args.invoke_ms:g} ms Bedrock call")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
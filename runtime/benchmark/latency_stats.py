@@ -0,0 +1,66 @@
+import math
+
+PERCENTILES = (50, 90, 99)
+
+def percentile(sorted_values, pct):
+    # Linear interpolation between closest ranks (same as numpy's default)
+    if not sorted_values:
+        return None
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * pct / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return sorted_values[low]
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+def describe(latencies_ns):
+    # Summary of a latency sample in seconds
+    values = sorted(latencies_ns)
+    count = len(values)
+    if not count:
+        return {"count": 0}
+
+    mean = sum(values) / count
+    variance = sum((v - mean) ** 2 for v in values) / (count - 1) if count > 1 else 0.0
+    summary = {
+        "count": count,
+        "mean": round(mean / 1e9, 4),
+        "stddev": round(math.sqrt(variance) / 1e9, 4),
+        "min": round(values[0] / 1e9, 4),
+        "max": round(values[-1] / 1e9, 4),
+    }
+    for pct in PERCENTILES:
+        summary[f"p{pct}"] = round(percentile(values, pct) / 1e9, 4)
+    return summary
+
+def summarize(results):
+    # Aggregates raw benchmark samples per model and per model/question.
+    # Failed samples are counted but excluded from the latency distribution.
+    by_model = {}
+    for r in results:
+        entry = by_model.setdefault(r['model'], {"latencies": [], "ttfts": [], "errors": 0, "questions": {}})
+        q_entry = entry["questions"].setdefault(r.get('question', ''), {"latencies": [], "errors": 0})
+        if 'error' in r:
+            entry["errors"] += 1
+            q_entry["errors"] += 1
+            continue
+        entry["latencies"].append(r['latency_ns'])
+        if r.get('ttft_ns') is not None:
+            entry["ttfts"].append(r['ttft_ns'])
+        q_entry["latencies"].append(r['latency_ns'])
+
+    summary = {}
+    for model, entry in by_model.items():
+        model_summary = describe(entry["latencies"])
+        model_summary["errors"] = entry["errors"]
+        if entry["ttfts"]:
+            model_summary["ttft"] = describe(entry["ttfts"])
+        model_summary["questions"] = {}
+        for question, q_entry in entry["questions"].items():
+            q_summary = describe(q_entry["latencies"])
+            q_summary["errors"] = q_entry["errors"]
+            model_summary["questions"][question] = q_summary
+        summary[model] = model_summary
+    return summary
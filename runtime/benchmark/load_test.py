@@ -0,0 +1,350 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from latency_stats import percentile
+from bedrock_simulator import BedrockSimulator, fit_profiles, load_report
+
+# Drives the router's lambda_handler in-process against BedrockSimulator and
+# sweeps the offered load to find where it saturates:
+#   open   - requests arrive at a fixed (or Poisson) rate whether or not earlier
+#            ones finished; latency counts from the scheduled arrival, so
+#            queueing is not hidden (no coordinated omission)
+#   closed - N virtual users, each sending its next request when the last returns
+# Every load level starts from a fresh router state (caches, breakers, limits).
+# Like Lambda, each in-flight request runs in its own simulated container with
+# its own concurrency limits, breakers and routing stats; idle containers are
+# reused and new ones are added when all are busy. Caches and single-flight
+# stand in for the shared DynamoDB tier and stay process-wide.
+# Throughput counts completions inside the measurement window (after
+# --warmup), and latency only requests that started in it, so ramp-up and the
+# drain at the end do not skew either.
+# All reported times and rates are in simulated time. --time-scale below 1
+# speeds up only the simulator; the router's own timings (backoff, breaker
+# reset, hedge delay, deadline reserve) stay real, so keep the default of 1
+# when those matter.
+
+RUNTIME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(RUNTIME_DIR, "shared", "python"))
+sys.path.insert(0, os.path.join(RUNTIME_DIR, "model_router"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ["RESPONSE_CACHE_TABLE"] = "" # In-process cache tier only
+
+import adaptive_router
+import aws_clients
+import bedrock_invoker
+import circuit_breaker
+import handler
+import response_cache
+import single_flight
+from benchmark_models import QUESTIONS
+
+DEFAULT_REPORT = os.path.join(RUNTIME_DIR, "..", "benchmark_report.json")
+
+
+class LambdaContext:
+    def __init__(self, timeout_ms):
+        self.expires_at = time.monotonic() + timeout_ms / 1000.0
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.expires_at - time.monotonic()) * 1000))
+
+
+class Container:
+    # Per-container router state; a Lambda container serves one request at a time
+    def __init__(self):
+        self.ROUTER = adaptive_router.AdaptiveRouter()
+        self.BREAKERS = circuit_breaker.BreakerRegistry()
+        self.INVOKER = bedrock_invoker.BedrockInvoker()
+
+
+class ContainerPool:
+    def __init__(self):
+        self.idle = []
+        self.created = 0
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def checkout(self):
+        with self.lock:
+            if self.idle:
+                container = self.idle.pop()
+            else:
+                container = Container()
+                self.created += 1
+        self.local.container = container
+        try:
+            yield container
+        finally:
+            self.local.container = None
+            with self.lock:
+                self.idle.append(container)
+
+
+class ContainerState:
+    # Stands in for one of handler's module globals and forwards to the
+    # calling thread's container, so concurrent requests never share it
+    def __init__(self, pool, name):
+        self.pool = pool
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(getattr(self.pool.local.container, self.name), attr)
+
+
+class ContainerExecutor:
+    # handler.HEDGE_POOL replacement: hedged calls run in the submitting
+    # request's container, on a pool sized for many containers rather than one
+    def __init__(self, pool, executor):
+        self.pool = pool
+        self.executor = executor
+
+    def submit(self, fn, *args, **kwargs):
+        container = self.pool.local.container
+
+        def run():
+            self.pool.local.container = container
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.pool.local.container = None
+        return self.executor.submit(run)
+
+
+CONTAINERS = ContainerPool()
+HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=256)
+
+
+def reset_router():
+    global CONTAINERS
+    CONTAINERS = ContainerPool()
+    handler.RESPONSE_CACHE = response_cache.from_env()
+    handler.SEMANTIC_CACHE = None
+    handler.SINGLE_FLIGHT = single_flight.from_env()
+    for name in ("ROUTER", "BREAKERS", "INVOKER"):
+        setattr(handler, name, ContainerState(CONTAINERS, name))
+    handler.HEDGE_POOL = ContainerExecutor(CONTAINERS, HEDGE_EXECUTOR)
+
+
+def classify(response):
+    if response.get("statusCode") != 200:
+        return "error"
+    model_used = json.loads(response["body"]).get("model_used", "")
+    if model_used == "DEGRADED_SERVICE":
+        return "degraded"
+    if model_used.startswith(("FALLBACK:", "HEDGED:")):
+        return "fallback"
+    if model_used.startswith(("CACHE:", "SEMANTIC_CACHE:")):
+        return "cached"
+    return "ok"
+
+
+class Workload:
+    # Request events: a share of questions is unique, the rest repeat (cacheable)
+    def __init__(self, unique_ratio, types, timeout_ms, seed=None):
+        self.unique_ratio = unique_ratio
+        self.types = types
+        self.timeout_ms = timeout_ms
+        self.rng = random.Random(seed)
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def next_event(self):
+        with self.lock:
+            self.counter += 1
+            question = self.rng.choice(QUESTIONS)
+            if self.rng.random() < self.unique_ratio:
+                question = f"{question} (ref {self.counter})"
+            req_type = self.types[self.counter % len(self.types)]
+        return {"question": question, "type": req_type}
+
+
+def send(workload, scheduled, samples, lock):
+    # scheduled: when the request should have started (open loop) or did start
+    event = workload.next_event()
+    with CONTAINERS.checkout():
+        try:
+            outcome = classify(handler.lambda_handler(event, LambdaContext(workload.timeout_ms)))
+        except Exception:
+            outcome = "error"
+    finished = time.perf_counter()
+    with lock:
+        samples.append((outcome, scheduled, finished))
+
+
+def run_open(workload, rps, duration, max_workers, poisson, rng):
+    samples = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+    sent = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        next_at = start
+        while next_at < start + duration:
+            now = time.perf_counter()
+            if next_at > now:
+                time.sleep(next_at - now)
+            pool.submit(send, workload, next_at, samples, lock)
+            sent += 1
+            next_at += rng.expovariate(rps) if poisson else 1.0 / rps
+    return samples, sent, start
+
+
+def run_closed(workload, users, duration, think_time):
+    samples = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+    stop_at = start + duration
+    counts = [0] * users
+
+    def user(index):
+        while time.perf_counter() < stop_at:
+            send(workload, time.perf_counter(), samples, lock)
+            counts[index] += 1
+            if think_time:
+                time.sleep(think_time)
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, sum(counts), start
+
+
+def summarize_level(samples, sent, start, warmup, duration, scale):
+    # Rates per simulated second and latencies in simulated ms
+    window_start = start + warmup * scale
+    window_end = start + duration * scale
+    measured = [s for s in samples if s[1] >= window_start]
+    outcomes = {}
+    for outcome, _, _ in measured:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    good = sorted((finished - scheduled) * 1000 / scale
+                  for outcome, scheduled, finished in measured if outcome in ("ok", "cached"))
+    served = sum(1 for outcome, _, finished in samples
+                 if outcome in ("ok", "cached") and window_start <= finished < window_end)
+    failed = outcomes.get("error", 0) + outcomes.get("degraded", 0)
+    return {
+        "sent": sent,
+        "completed": len(samples),
+        "throughput_rps": round(served / (duration - warmup), 2),
+        "p50_ms": round(percentile(good, 50), 1) if good else None,
+        "p90_ms": round(percentile(good, 90), 1) if good else None,
+        "p99_ms": round(percentile(good, 99), 1) if good else None,
+        "error_rate": round(failed / len(measured), 4) if measured else 0.0,
+        "fallback_rate": round(outcomes.get("fallback", 0) / len(measured), 4) if measured else 0.0,
+        "outcomes": outcomes
+    }
+
+
+def find_saturation(levels, mode, slo_ms, max_error_rate):
+    # Highest load level that still keeps up (open loop: >= 90% of the offered
+    # rate served; closed loop: >= 5% more throughput than the level below),
+    # meets the p99 SLO and stays under the error-rate limit
+    sustainable = None
+    saturated_at = None
+    for level in levels:
+        keeps_up = (level["throughput_rps"] >= 0.9 * level["load"] if mode == "open"
+                    else sustainable is None or level["throughput_rps"] >= 1.05 * sustainable["throughput_rps"])
+        healthy = (level["p99_ms"] is not None and level["p99_ms"] <= slo_ms
+                   and level["error_rate"] <= max_error_rate)
+        if not (keeps_up and healthy):
+            saturated_at = level["load"]
+            break
+        sustainable = level
+    return {
+        "max_sustainable_load": sustainable["load"] if sustainable else None,
+        "saturated_at": saturated_at,
+        "peak_throughput_rps": max((l["throughput_rps"] for l in levels), default=None)
+    }
+
+
+def sweep(args, simulator):
+    scale = args.time_scale
+    loads = [float(x) for x in args.loads.split(",")]
+    types = args.types.split(",")
+    levels = []
+    print(f"{'Load':<8} | {'Thru/s':<8} | {'p50 ms':<9} | {'p99 ms':<9} | {'Err %':<6} | {'Fallback %':<10} | {'Throttled':<9} | Containers")
+    print("-" * 93)
+    for load in loads:
+        reset_router()
+        workload = Workload(args.unique_ratio, types, args.timeout_ms * scale, args.seed)
+        before = simulator.stats()["throttled"]
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if args.mode == "open":
+                samples, sent, start = run_open(workload, load / scale, args.duration * scale,
+                                                args.max_workers, args.poisson, random.Random(args.seed))
+            else:
+                samples, sent, start = run_closed(workload, int(load), args.duration * scale, args.think_time * scale)
+        level = dict(load=load, **summarize_level(samples, sent, start, args.warmup, args.duration, scale))
+        level["throttled"] = simulator.stats()["throttled"] - before
+        level["containers"] = CONTAINERS.created
+        if handler.SINGLE_FLIGHT is not None:
+            level["collapse_ratio"] = handler.SINGLE_FLIGHT.stats()["collapse_ratio"]
+        levels.append(level)
+        print(f"{load:<8g} | {level['throughput_rps']:<8} | {str(level['p50_ms']):<9} | {str(level['p99_ms']):<9} | "
+              f"{level['error_rate'] * 100:<6.1f} | {level['fallback_rate'] * 100:<10.1f} | {level['throttled']:<9} | {level['containers']}")
+    return levels
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the model router against a local Bedrock simulator")
+    parser.add_argument("--mode", choices=("open", "closed"), default="open")
+    parser.add_argument("--loads", default="1,2,4,8,16,32",
+                        help="Comma-separated load levels: requests/sec (open) or virtual users (closed)")
+    parser.add_argument("--duration", type=float, default=60, help="Simulated seconds per load level")
+    parser.add_argument("--warmup", type=float, default=10, help="Simulated seconds excluded from the measurements")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="Real seconds per simulated second; below 1 the router's own timings are not scaled")
+    parser.add_argument("--poisson", action="store_true", help="Poisson arrivals instead of a fixed interval (open)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds between a user's requests (closed)")
+    parser.add_argument("--max-workers", type=int, default=512, help="Concurrent requests the generator can hold (open)")
+    parser.add_argument("--unique-ratio", type=float, default=1.0, help="Share of never-repeated questions")
+    parser.add_argument("--types", default="general", help="Comma-separated request types to cycle through")
+    parser.add_argument("--config", help="AppConfig document (JSON) to route with")
+    parser.add_argument("--report", default=DEFAULT_REPORT, help="Benchmark report to fit model latency profiles from")
+    parser.add_argument("--profiles", help="JSON of per-model profile overrides, e.g. max_concurrency or rps_quota")
+    parser.add_argument("--timeout-ms", type=float, default=60000, help="Simulated Lambda timeout")
+    parser.add_argument("--slo-ms", type=float, default=10000, help="p99 latency SLO for the saturation point")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--label", default="baseline", help="Name of this configuration in the report")
+    parser.add_argument("--output", help="Optional JSON report path")
+    args = parser.parse_args()
+
+    overrides = {}
+    if args.profiles:
+        with open(args.profiles) as f:
+            overrides = json.load(f)
+    results = load_report(args.report) if args.report and os.path.exists(args.report) else []
+    profiles = fit_profiles(results, overrides)
+    simulator = BedrockSimulator(profiles, time_scale=args.time_scale, seed=args.seed)
+    aws_clients.set_client("bedrock-runtime", simulator)
+
+    if args.config:
+        with open(args.config) as f:
+            handler.DEFAULT_CONFIG = json.load(f)
+
+    levels = sweep(args, simulator)
+    saturation = find_saturation(levels, args.mode, args.slo_ms, args.max_error_rate)
+    print(f"\nMax sustainable load: {saturation['max_sustainable_load']}, "
+          f"saturated at: {saturation['saturated_at']}, peak throughput: {saturation['peak_throughput_rps']}/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "label": args.label,
+                "mode": args.mode,
+                "time_scale": args.time_scale,
+                "config": handler.DEFAULT_CONFIG,
+                "profiles": profiles,
+                "levels": levels,
+                "saturation": saturation
+            }, f, indent=2)
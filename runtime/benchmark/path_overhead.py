@@ -0,0 +1,164 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+from latency_stats import percentile
+
+# Compares the request-path overhead of the two ServiceStack modes with a
+# stubbed Bedrock, so only our own code and the hops are measured:
+#   stepfunctions - API Gateway -> Express workflow -> router Lambda, with
+#                   failures caught into the fallback and degradation Lambdas
+#   direct        - API Gateway -> router Lambda, fallback/degradation in-process
+# Each hop JSON-serializes the payload as the service would. --hop-ms adds a
+# fixed delay per hop to model service latency; the Lambda invocation and
+# state-transition counts per request are reported as-is.
+
+RUNTIME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(RUNTIME_DIR, "shared", "python"))
+sys.path.insert(0, os.path.join(RUNTIME_DIR, "workflow"))
+sys.path.insert(0, os.path.join(RUNTIME_DIR, "model_router"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ["RESPONSE_CACHE_ENABLED"] = "false" # Every request reaches the stub
+
+import aws_clients
+import circuit_breaker
+import handler
+import fallback_handler
+import degradation_handler
+
+PRIMARY_MODEL = "anthropic.claude-3-sonnet-20240229-v1:0"
+QUESTION = "What is the current inflation rate?"
+
+# Scenario -> models whose calls fail
+SCENARIOS = {
+    "success": set(),
+    "fallback": {PRIMARY_MODEL},
+    "degraded": {PRIMARY_MODEL, handler.FALLBACK_MODEL}
+}
+
+
+class ModelError(Exception):
+    # Not retried by bedrock_invoker, so a failed call costs one attempt and
+    # the latency measured is the path's, not backoff sleep
+    def __init__(self, model_id):
+        super().__init__(f"Model error from {model_id}")
+        self.response = {"Error": {"Code": "ModelErrorException"}}
+
+
+class StubBedrock:
+    def __init__(self, model_ms=0.0):
+        self.model_ms = model_ms
+        self.failing = set()
+
+    def invoke_model(self, body, modelId, **kwargs):
+        if self.model_ms:
+            time.sleep(self.model_ms / 1000.0)
+        if modelId in self.failing:
+            raise ModelError(modelId)
+        if "titan" in modelId:
+            payload = {"results": [{"outputText": "ok", "tokenCount": 1}], "inputTextTokenCount": 1}
+        else:
+            payload = {"content": [{"text": "ok"}], "usage": {"input_tokens": 1, "output_tokens": 1}}
+        return {"body": io.BytesIO(json.dumps(payload).encode())}
+
+
+class Path:
+    # Counts hops for one request and applies the per-hop delay
+    def __init__(self, hop_ms):
+        self.hop_ms = hop_ms
+        self.invocations = 0
+        self.transitions = 0
+
+    def hop(self, payload):
+        if self.hop_ms:
+            time.sleep(self.hop_ms / 1000.0)
+        return json.loads(json.dumps(payload))
+
+    def invoke(self, fn, event):
+        # LambdaInvoke: serialize in, run, serialize the Payload out
+        self.invocations += 1
+        return self.hop(fn(self.hop(event), None))
+
+
+def stepfunctions_request(path, body):
+    state = path.hop(body) # StartSyncExecution input
+    for fn in (handler.lambda_handler, fallback_handler.lambda_handler, degradation_handler.lambda_handler):
+        path.transitions += 1
+        try:
+            return path.invoke(fn, state)
+        except Exception as e:
+            # Catch with result_path="$.error" keeps the input and adds the error
+            state = dict(state, error={"Error": type(e).__name__, "Cause": str(e)})
+
+
+def direct_request(path, body):
+    # Lambda proxy integration: the body arrives as a string
+    return path.invoke(handler.lambda_handler, {"body": json.dumps(body)})
+
+
+MODES = {
+    "stepfunctions": (stepfunctions_request, False),
+    "direct": (direct_request, True)
+}
+
+
+def run(mode, scenario, requests, hop_ms, stub):
+    request_fn, in_process = MODES[mode]
+    handler.IN_PROCESS_FALLBACK = in_process
+    # Breakers never open: every request takes the full failure path of its scenario
+    handler.BREAKERS = circuit_breaker.BreakerRegistry(failure_threshold=float("inf"))
+    stub.failing = SCENARIOS[scenario]
+    body = {"question": QUESTION, "type": "general"}
+
+    latencies_ms = []
+    invocations = transitions = 0
+    answers = set()
+    for _ in range(requests):
+        path = Path(hop_ms)
+        start = time.perf_counter_ns()
+        with contextlib.redirect_stdout(io.StringIO()): # Handler logs are not the subject here
+            result = request_fn(path, body)
+        latencies_ms.append((time.perf_counter_ns() - start) / 1e6)
+        invocations += path.invocations
+        transitions += path.transitions
+        answers.add(json.loads(result["body"])["model_used"])
+
+    latencies_ms.sort()
+    return {
+        "p50_ms": round(percentile(latencies_ms, 50), 3),
+        "p99_ms": round(percentile(latencies_ms, 99), 3),
+        "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 3),
+        "lambda_invocations": round(invocations / requests, 2),
+        "state_transitions": round(transitions / requests, 2),
+        "model_used": sorted(answers)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare request-path overhead of Step Functions vs direct invocation")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per mode and scenario")
+    parser.add_argument("--hop-ms", type=float, default=0.0, help="Simulated service latency added per hop")
+    parser.add_argument("--model-ms", type=float, default=0.0, help="Simulated Bedrock latency per call")
+    parser.add_argument("--output", help="Optional JSON report path")
+    args = parser.parse_args()
+
+    stub = StubBedrock(args.model_ms)
+    aws_clients.set_client("bedrock-runtime", stub)
+
+    report = {}
+    print(f"{'Mode':<14} | {'Scenario':<9} | {'p50 ms':<8} | {'p99 ms':<8} | {'Lambdas':<7} | {'States':<6} | Answered by")
+    print("-" * 90)
+    for scenario in SCENARIOS:
+        for mode in MODES:
+            result = run(mode, scenario, args.requests, args.hop_ms, stub)
+            report.setdefault(mode, {})[scenario] = result
+            print(f"{mode:<14} | {scenario:<9} | {result['p50_ms']:<8} | {result['p99_ms']:<8} | "
+                  f"{result['lambda_invocations']:<7} | {result['state_transitions']:<6} | {', '.join(result['model_used'])}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,304 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+import uuid
+
+# numpy is imported when a store is opened, so importing this module (as
+# benchmark_models does for DEFAULT_STORE) does not load it
+np = None
+
+# Append-only columnar history of benchmark samples. Each column is a raw
+# little-endian array in its own file, read back with np.memmap, so a query
+# only pages in the columns and row ranges it touches. A run's rows are
+# contiguous; manifest.json records them with the row count and the
+# dictionaries that encode string columns (model, question) as small ints:
+#
+#   <store>/manifest.json   {"rows", "runs": [{"run_id", "timestamp", "start", "end", ...}],
+#                            "dictionaries": {"model": [...], "question": [...]}}
+#   <store>/<column>.bin    one value per sample
+#
+# The manifest is replaced atomically after the column files are appended,
+# so a crashed append leaves bytes past `rows` that the next append drops.
+
+DEFAULT_STORE = os.environ.get(
+    "BENCHMARK_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "benchmark_history")
+)
+
+# name -> (dtype, value for missing fields)
+COLUMNS = {
+    "run": ("<i4", 0),
+    "model": ("<i2", 0),
+    "question": ("<i2", 0),
+    "repetition": ("<i2", 0),
+    "latency": ("<f8", float("nan")),
+    "ttft": ("<f8", float("nan")),
+    "tokens_per_sec": ("<f4", float("nan")),
+    "input_tokens": ("<i4", 0),
+    "output_tokens": ("<i4", 0),
+    "cache_read_tokens": ("<i4", 0),
+    "cache_write_tokens": ("<i4", 0),
+    "cost": ("<f8", float("nan")),
+    "error": ("<i1", 0),
+    "flagged": ("<i1", 0)
+}
+DICTIONARY_COLUMNS = ("model", "question")
+
+# Metrics the query CLI compares; True where lower is better, False where
+# higher is better, None where changes are shown but never a regression
+# (shorter answers can be the point of a token budget)
+METRICS = {
+    "latency": True,
+    "ttft": True,
+    "cost": True,
+    "tokens_per_sec": False,
+    "output_tokens": None
+}
+
+
+def new_run_id():
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ") + "-" + uuid.uuid4().hex[:6]
+
+
+def _load_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+
+
+class ResultStore:
+    def __init__(self, path=DEFAULT_STORE):
+        _load_numpy()
+        self.path = path
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.path, "manifest.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": 1, "rows": 0, "runs": [], "dictionaries": {c: [] for c in DICTIONARY_COLUMNS}}
+
+    def _column_path(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _encode(self, column, value):
+        values = self.manifest["dictionaries"][column]
+        if value not in values:
+            values.append(value)
+        return values.index(value)
+
+    def runs(self):
+        return list(self.manifest["runs"])
+
+    def find_run(self, run_id):
+        # Exact id, unique prefix, or an index such as -1 for the latest run
+        runs = self.manifest["runs"]
+        if run_id.lstrip("-").isdigit():
+            if not -len(runs) <= int(run_id) < len(runs):
+                raise KeyError(f"No run at index {run_id} ({len(runs)} stored)")
+            return runs[int(run_id)]
+        matches = [r for r in runs if r["run_id"].startswith(run_id)]
+        if len(matches) != 1:
+            raise KeyError(f"{len(matches)} runs match {run_id!r}")
+        return matches[0]
+
+    def append(self, results, run_id=None, timestamp=None, **metadata):
+        # Appends one run of benchmark result dicts; returns its manifest entry
+        run_id = run_id or new_run_id()
+        if any(r["run_id"] == run_id for r in self.manifest["runs"]):
+            raise ValueError(f"Run {run_id} is already stored")
+        os.makedirs(self.path, exist_ok=True)
+        run_index = len(self.manifest["runs"])
+        columns = {name: [] for name in COLUMNS}
+        for r in results:
+            row = {
+                "run": run_index,
+                "model": self._encode("model", r["model"]),
+                "question": self._encode("question", r.get("question", "")),
+                "repetition": r.get("repetition", 0),
+                "error": 1 if "error" in r else 0,
+                "flagged": 1 if r.get("compliance") == "FLAGGED" else 0
+            }
+            for name in ("latency", "ttft", "tokens_per_sec", "input_tokens", "output_tokens",
+                         "cache_read_tokens", "cache_write_tokens", "cost"):
+                if r.get(name) is not None:
+                    row[name] = r[name]
+            for name, (_, missing) in COLUMNS.items():
+                columns[name].append(row.get(name, missing))
+
+        start = self.manifest["rows"]
+        for name, (dtype, _) in COLUMNS.items():
+            path = self._column_path(name)
+            with open(path, "ab") as f:
+                # Drop bytes of an append that never reached the manifest
+                f.truncate(start * np.dtype(dtype).itemsize)
+                f.write(np.asarray(columns[name], dtype=dtype).tobytes())
+
+        run = dict(metadata, run_id=run_id, timestamp=timestamp or datetime.datetime.now(
+            datetime.timezone.utc).isoformat(timespec="seconds"), start=start, end=start + len(results))
+        self.manifest["runs"].append(run)
+        self.manifest["rows"] = run["end"]
+        tmp = os.path.join(self.path, "manifest.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, "manifest.json"))
+        return run
+
+    def column(self, name, start=0, end=None):
+        # Read-only memory-mapped view of rows [start, end)
+        rows = self.manifest["rows"]
+        end = rows if end is None else end
+        if not rows or end <= start:
+            return np.empty(0, dtype=COLUMNS[name][0])
+        data = np.memmap(self._column_path(name), dtype=COLUMNS[name][0], mode="r", shape=(rows,))
+        return data[start:end]
+
+    def run_summary(self, run, metrics=METRICS):
+        # {model: {"samples", "errors", "flagged", <metric>: {"p50", "mean"}}} for one run
+        start, end = run["start"], run["end"]
+        models = self.column("model", start, end)
+        errors = self.column("error", start, end)
+        flagged = self.column("flagged", start, end)
+        values = {m: np.asarray(self.column(m, start, end), dtype="f8") for m in metrics}
+        names = self.manifest["dictionaries"]["model"]
+        summary = {}
+        for code in np.unique(models):
+            rows = models == code
+            ok = rows & (errors == 0)
+            entry = {
+                "samples": int(rows.sum()),
+                "errors": int(errors[rows].sum()),
+                "flagged": int(flagged[rows].sum())
+            }
+            for metric, column in values.items():
+                sample = column[ok]
+                sample = sample[~np.isnan(sample)]
+                if sample.size:
+                    entry[metric] = {"p50": float(np.percentile(sample, 50)), "mean": float(sample.mean())}
+            summary[names[code]] = entry
+        return summary
+
+    def trend(self, model, metric="latency", last=20):
+        # [(run, p50)] for the model's last `last` runs
+        names = self.manifest["dictionaries"]["model"]
+        if model not in names:
+            raise KeyError(f"No stored samples for model {model!r}")
+        code = names.index(model)
+        points = []
+        for run in self.manifest["runs"][-last:]:
+            models = self.column("model", run["start"], run["end"])
+            rows = (models == code) & (self.column("error", run["start"], run["end"]) == 0)
+            sample = np.asarray(self.column(metric, run["start"], run["end"])[rows], dtype="f8")
+            sample = sample[~np.isnan(sample)]
+            if sample.size:
+                points.append((run, float(np.percentile(sample, 50))))
+        return points
+
+
+def compare(store, base, head, metrics=METRICS, threshold=0.1, stat="p50"):
+    # Per model and metric: base and head value, relative change, and whether
+    # it moved more than `threshold` in the bad direction
+    base_summary = store.run_summary(base, metrics)
+    head_summary = store.run_summary(head, metrics)
+    rows = []
+    for model in sorted(set(base_summary) & set(head_summary)):
+        for metric, lower_is_better in metrics.items():
+            if metric not in base_summary[model] or metric not in head_summary[model]:
+                continue
+            before = base_summary[model][metric][stat]
+            after = head_summary[model][metric][stat]
+            change = (after - before) / before if before else 0.0
+            if lower_is_better is None:
+                regressed = False
+            else:
+                regressed = change > threshold if lower_is_better else change < -threshold
+            rows.append({"model": model, "metric": metric, "base": before, "head": after,
+                         "change": round(change, 4), "regression": regressed})
+        base_errors = base_summary[model]["errors"] / base_summary[model]["samples"]
+        head_errors = head_summary[model]["errors"] / head_summary[model]["samples"]
+        if head_errors > base_errors:
+            rows.append({"model": model, "metric": "error_rate", "base": base_errors, "head": head_errors,
+                         "change": round(head_errors - base_errors, 4), "regression": True})
+    return rows
+
+
+def load_results(path):
+    with open(path) as f:
+        report = json.load(f)
+    return report["results"] if isinstance(report, dict) else report
+
+
+def print_runs(store):
+    print(f"{'#':<4} | {'Run':<26} | {'Timestamp':<25} | {'Samples':<7} | Label")
+    print("-" * 80)
+    for i, run in enumerate(store.runs()):
+        print(f"{i:<4} | {run['run_id']:<26} | {run['timestamp']:<25} | {run['end'] - run['start']:<7} | {run.get('label', '')}")
+
+
+def print_comparison(rows, base, head):
+    print(f"Base {base['run_id']} -> head {head['run_id']}")
+    print(f"{'Model':<40} | {'Metric':<14} | {'Base':<10} | {'Head':<10} | {'Change':<8} |")
+    print("-" * 96)
+    for row in rows:
+        print(f"{row['model']:<40} | {row['metric']:<14} | {row['base']:<10.4g} | {row['head']:<10.4g} | "
+              f"{row['change'] * 100:<+7.1f}% | {'REGRESSION' if row['regression'] else ''}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the benchmark result history")
+    parser.add_argument("--store", default=DEFAULT_STORE, help="Store directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("runs", help="List stored runs")
+
+    ingest = commands.add_parser("import", help="Append an existing benchmark_report.json as a run")
+    ingest.add_argument("report")
+    ingest.add_argument("--run-id")
+    ingest.add_argument("--timestamp", help="ISO timestamp of the run (default: the report's mtime)")
+    ingest.add_argument("--label", default="")
+
+    diff = commands.add_parser("compare", help="Per-model metric drift between two runs")
+    diff.add_argument("--base", default="-2", help="Run id, unique prefix or index (default: previous run)")
+    diff.add_argument("--head", default="-1", help="Run id, unique prefix or index (default: latest run)")
+    diff.add_argument("--metrics", default=",".join(METRICS), help="Comma-separated metrics")
+    diff.add_argument("--stat", choices=("p50", "mean"), default="p50")
+    diff.add_argument("--threshold", type=float, default=0.1, help="Relative change that counts as a regression")
+    diff.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on any regression")
+    diff.add_argument("--output", help="Optional JSON report path")
+
+    trend = commands.add_parser("trend", help="A model's p50 metric over recent runs")
+    trend.add_argument("--model", required=True)
+    trend.add_argument("--metric", choices=sorted(METRICS), default="latency")
+    trend.add_argument("--last", type=int, default=20)
+    args = parser.parse_args()
+
+    store = ResultStore(args.store)
+    try:
+        if args.command == "runs":
+            print_runs(store)
+        elif args.command == "import":
+            timestamp = args.timestamp or datetime.datetime.fromtimestamp(
+                os.path.getmtime(args.report), datetime.timezone.utc).isoformat(timespec="seconds")
+            run = store.append(load_results(args.report), run_id=args.run_id, timestamp=timestamp,
+                               label=args.label, source=os.path.basename(args.report))
+            print(f"Stored run {run['run_id']} ({run['end'] - run['start']} samples)")
+        elif args.command == "compare":
+            base, head = store.find_run(args.base), store.find_run(args.head)
+            metrics = {m: METRICS[m] for m in args.metrics.split(",")}
+            rows = compare(store, base, head, metrics, args.threshold, args.stat)
+            print_comparison(rows, base, head)
+            if args.output:
+                with open(args.output, "w") as f:
+                    json.dump({"base": base, "head": head, "rows": rows}, f, indent=2)
+            if args.fail_on_regression and any(r["regression"] for r in rows):
+                sys.exit(1)
+        elif args.command == "trend":
+            for run, value in store.trend(args.model, args.metric, args.last):
+                print(f"{run['run_id']:<26} | {run['timestamp']:<25} | {value:.4g}")
+    except KeyError as e:
+        # Unknown run or model
+        parser.error(e.args[0])
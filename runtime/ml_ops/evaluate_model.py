@@ -0,0 +1,327 @@
+import argparse
+import json
+import os
+import re
+import sys
+
+# Promotion gate for a fine-tuned (or any new) model: runs the benchmark
+# harness concurrently on a held-out question set against the candidate and
+# the incumbent the AppConfig document routes the request type to, scores
+# latency, cost, answer quality and compliance, and accepts the candidate
+# only if it is no worse on quality, compliance and errors and improves the
+# speed/cost trade-off: not worse than the tolerances on either p50 latency
+# or cost per answer, and better by --min-gain on at least one. An accepted
+# candidate comes with an AppConfig merge patch (RFC 7396) routing the type
+# to it.
+#
+# Quality is the mean token F1 of each answer against the reference answer
+# of its question, so held-out sets need references: validation shards from
+# prepare_dataset.py work as-is (prompt/completion or messages records), as
+# does JSONL with {"question", "reference"}.
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmark")
+sys.path.insert(0, BENCHMARK_DIR)
+from benchmark_models import run_matrix, BEDROCK_REGION
+from latency_stats import describe
+from result_store import ResultStore, DEFAULT_STORE
+
+# benchmark_models puts the shared runtime code on sys.path
+from aws_clients import get_client
+import model_adapters
+import pricing
+import prompt_templates
+
+DEFAULT_LIMIT = 50
+DEFAULT_REPETITIONS = 1
+
+# Gate thresholds (relative, candidate vs incumbent)
+LATENCY_TOLERANCE = 0.05 # p50 latency may be this much worse if cost improves
+COST_TOLERANCE = 0.05 # cost per answer may be this much worse if latency improves
+MIN_GAIN = 0.05 # required improvement in latency or cost
+MAX_QUALITY_DROP = 0.02 # absolute drop in mean token F1
+MAX_ERROR_RATE_INCREASE = 0.0
+MAX_FLAGGED_RATE_INCREASE = 0.0
+
+_TOKENS = re.compile(r"\w+")
+
+
+def load_questions(path, limit=DEFAULT_LIMIT):
+    # [(question, system, reference)] from held-out JSONL; lines that are not
+    # JSON objects, records without a question (messages with no user turn)
+    # and records whose question, system or reference is not a string are
+    # skipped and counted
+    questions = []
+    skipped = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            if not isinstance(record, dict):
+                skipped += 1
+                continue
+            if "messages" in record:
+                messages = [m for m in record["messages"] if isinstance(m, dict)] if isinstance(record["messages"], list) else []
+                user = next((m.get("content") for m in messages if m.get("role") == "user"), None)
+                answers = [m.get("content") for m in messages if m.get("role") == "assistant"]
+                entry = (user, record.get("system"), answers[-1] if answers else None)
+            else:
+                question = record.get("question", record.get("prompt"))
+                entry = (question, record.get("system"), record.get("reference", record.get("completion")))
+            if not entry[0] or not all(v is None or isinstance(v, str) for v in entry):
+                skipped += 1
+                continue
+            questions.append(entry)
+            if limit and len(questions) >= limit:
+                break
+    if skipped:
+        print(f"Skipped {skipped} held-out records that are not valid or have no question")
+    return questions
+
+
+def token_f1(answer, reference):
+    # Bag-of-words F1, as in SQuAD answer scoring
+    answer_tokens = _TOKENS.findall(answer.lower())
+    reference_tokens = _TOKENS.findall(reference.lower())
+    if not answer_tokens or not reference_tokens:
+        return 0.0
+    counts = {}
+    for token in reference_tokens:
+        counts[token] = counts.get(token, 0) + 1
+    common = 0
+    for token in answer_tokens:
+        if counts.get(token):
+            counts[token] -= 1
+            common += 1
+    if not common:
+        return 0.0
+    precision = common / len(answer_tokens)
+    recall = common / len(reference_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+
+def incumbent_for(config, req_type):
+    # The model the router uses for req_type in static mode
+    return config.get("overrides", {}).get(req_type, config.get("default_model", "anthropic.claude-3-sonnet-20240229-v1:0"))
+
+
+def score(results, references, fixed_cost=0.0, priced=True):
+    # Per-model scores for one model's results (in question order, repetitions
+    # adjacent); fixed_cost is added to each answer (amortized provisioned
+    # throughput). An unpriced model has no cost per answer: its token cost
+    # would read as free.
+    ok = [r for r in results if "error" not in r]
+    latency = describe([r["latency_ns"] for r in ok])
+    f1 = [token_f1(r["output_text"], references[r["index"]]) for r in ok if references[r["index"]]]
+    entry = {
+        "samples": len(results),
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 1.0,
+        "flagged_rate": round(sum(1 for r in ok if r["compliance"] == "FLAGGED") / len(ok), 4) if ok else 0.0,
+        "latency_p50": latency.get("p50"),
+        "latency_p90": latency.get("p90"),
+        "cost_per_answer": round(sum(r["cost"] + fixed_cost for r in ok) / len(ok), 8) if ok and priced else None,
+        "output_tokens_mean": round(sum(r["output_tokens"] for r in ok) / len(ok), 1) if ok else None,
+        "quality": round(sum(f1) / len(f1), 4) if f1 else None
+    }
+    ttfts = [r["ttft_ns"] for r in ok if r.get("ttft_ns") is not None]
+    if ttfts:
+        entry["ttft_p50"] = describe(ttfts)["p50"]
+    return entry
+
+
+def relative(after, before):
+    return (after - before) / before if before else 0.0
+
+
+def decide(candidate, incumbent, latency_tolerance=LATENCY_TOLERANCE, cost_tolerance=COST_TOLERANCE,
+           min_gain=MIN_GAIN, max_quality_drop=MAX_QUALITY_DROP):
+    # Returns (accepted, reasons); reasons explain every failed check, or the
+    # improvement that earned acceptance
+    reasons = []
+    if candidate["latency_p50"] is None:
+        return False, ["candidate produced no successful answers"]
+    if incumbent["latency_p50"] is None:
+        return False, ["incumbent produced no successful answers to compare against"]
+    if candidate["error_rate"] > incumbent["error_rate"] + MAX_ERROR_RATE_INCREASE:
+        reasons.append(f"error rate {candidate['error_rate']:.2%} vs {incumbent['error_rate']:.2%}")
+    if candidate["flagged_rate"] > incumbent["flagged_rate"] + MAX_FLAGGED_RATE_INCREASE:
+        reasons.append(f"compliance flagged rate {candidate['flagged_rate']:.2%} vs {incumbent['flagged_rate']:.2%}")
+    if candidate["quality"] is None or incumbent["quality"] is None:
+        reasons.append("no reference answers to score quality")
+    elif candidate["quality"] < incumbent["quality"] - max_quality_drop:
+        reasons.append(f"quality {candidate['quality']:.3f} vs {incumbent['quality']:.3f} (max drop {max_quality_drop})")
+    unpriced = [role for role, s in (("candidate", candidate), ("incumbent", incumbent)) if s["cost_per_answer"] is None]
+    if unpriced:
+        # An unknown price costs nothing, so the cost comparison would be a false gain or loss
+        reasons.append(f"no known price for the {' and '.join(unpriced)} "
+                       "(add it to pricing.PRICING or pass --candidate-price/--candidate-hourly)")
+        return False, reasons
+
+    latency_change = relative(candidate["latency_p50"], incumbent["latency_p50"])
+    cost_change = relative(candidate["cost_per_answer"], incumbent["cost_per_answer"])
+    if latency_change > latency_tolerance:
+        reasons.append(f"p50 latency {latency_change:+.1%} (tolerance {latency_tolerance:.0%})")
+    if cost_change > cost_tolerance:
+        reasons.append(f"cost per answer {cost_change:+.1%} (tolerance {cost_tolerance:.0%})")
+    if latency_change > -min_gain and cost_change > -min_gain:
+        reasons.append(f"no gain of {min_gain:.0%} in latency ({latency_change:+.1%}) or cost ({cost_change:+.1%})")
+    if reasons:
+        return False, reasons
+    return True, [f"p50 latency {latency_change:+.1%}, cost per answer {cost_change:+.1%}"]
+
+
+def override_patch(config, req_type, incumbent, candidate):
+    # Merge patch routing req_type to the candidate; adaptive routing
+    # candidates for the type swap the incumbent for it too
+    patch = {"overrides": {req_type: candidate}}
+    routing_candidates = config.get("routing", {}).get("candidates", {}).get(req_type)
+    if routing_candidates:
+        swapped = [candidate if m == incumbent else m for m in routing_candidates]
+        if candidate not in swapped:
+            swapped.append(candidate)
+        patch["routing"] = {"candidates": {req_type: swapped}}
+    return patch
+
+
+def merge_patch(document, patch):
+    # RFC 7396
+    if not isinstance(patch, dict):
+        return patch
+    merged = dict(document) if isinstance(document, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            merged.pop(key, None)
+        else:
+            merged[key] = merge_patch(merged.get(key), value)
+    return merged
+
+
+def evaluate(candidate, questions, config=None, req_type="general", incumbent=None, client=None,
+             repetitions=DEFAULT_REPETITIONS, stream=False, fixed_costs=None, store_path=None, label="",
+             **thresholds):
+    config = config or {}
+    incumbent = incumbent or incumbent_for(config, req_type)
+    if incumbent == candidate:
+        raise SystemExit(f"{candidate} is already the incumbent for {req_type}")
+    fixed_costs = fixed_costs or {}
+    models = [candidate, incumbent]
+    prompts = [q for q, _, _ in questions]
+    # Records' own system prompts, as the model was fine-tuned with them
+    systems = [s for _, s, _ in questions]
+    references = [r for _, _, r in questions]
+    templates = prompt_templates.templates_for(config) if config.get("prompt_templates") else None
+
+    print(f"Evaluating {candidate} against {incumbent} on {len(prompts)} held-out questions ({req_type})...")
+    results = run_matrix(models, prompts, client=client, repetitions=repetitions, stream=stream,
+                         templates=templates, req_type=req_type, keep_text=True,
+                         systems=systems if any(systems) else None)
+    # run_matrix returns model-major, question, repetition order
+    per_model = len(prompts) * repetitions
+    for i, r in enumerate(results):
+        r["index"] = (i % per_model) // repetitions
+
+    scores = {}
+    for m_idx, model in enumerate(models):
+        priced = pricing.price_for(model) is not pricing.UNKNOWN_PRICE or bool(fixed_costs.get(model))
+        scores[model] = score(results[m_idx * per_model:(m_idx + 1) * per_model], references,
+                              fixed_costs.get(model, 0.0), priced)
+    accepted, reasons = decide(scores[candidate], scores[incumbent], **thresholds)
+    report = {
+        "candidate": candidate,
+        "incumbent": incumbent,
+        "type": req_type,
+        "questions": len(prompts),
+        "repetitions": repetitions,
+        "scores": scores,
+        "decision": "ACCEPT" if accepted else "REJECT",
+        "reasons": reasons,
+        "patch": override_patch(config, req_type, incumbent, candidate) if accepted else None
+    }
+    if store_path:
+        for r in results:
+            r.pop("output_text", None)
+        run = ResultStore(store_path).append(results, label=label or f"eval {candidate} vs {incumbent}",
+                                             req_type=req_type, stream=stream, repetitions=repetitions,
+                                             decision=report["decision"])
+        report["run_id"] = run["run_id"]
+    return report
+
+
+def print_report(report):
+    print("-" * 96)
+    print(f"{'Model':<44} | {'p50 s':<7} | {'$/answer':<10} | {'Quality':<7} | {'Errors':<6} | Flagged")
+    print("-" * 96)
+    for role in ("candidate", "incumbent"):
+        model = report[role]
+        s = report["scores"][model]
+        quality = f"{s['quality']:.3f}" if s["quality"] is not None else "-"
+        cost = f"{s['cost_per_answer']:.6f}" if s["cost_per_answer"] is not None else "-"
+        print(f"{model[-44:]:<44} | {str(s['latency_p50']):<7} | {cost:<10} | {quality:<7} | "
+              f"{s['error_rate']:<6.1%} | {s['flagged_rate']:.1%}")
+    print("-" * 96)
+    print(f"Decision: {report['decision']}")
+    for reason in report["reasons"]:
+        print(f"  - {reason}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark a candidate model against the incumbent and gate its promotion")
+    parser.add_argument("--candidate", required=True, help="Model id, custom model or provisioned throughput ARN")
+    parser.add_argument("--questions", required=True, help="Held-out JSONL (e.g. validation shards from prepare_dataset.py)")
+    parser.add_argument("--config", help="AppConfig document (JSON): incumbent, prompt templates and patch base")
+    parser.add_argument("--type", default="general", help="Request type to evaluate and patch")
+    parser.add_argument("--incumbent", help="Model to compare against (default: the config's model for --type)")
+    parser.add_argument("--candidate-family", choices=sorted(model_adapters.ADAPTERS),
+                        help="Adapter for a candidate id the model prefix cannot classify (custom model ARNs)")
+    parser.add_argument("--candidate-price", help="Candidate on-demand price 'input,output' in USD per 1M tokens")
+    parser.add_argument("--candidate-hourly", type=float, default=0.0,
+                        help="Provisioned throughput USD/hour, amortized over --requests-per-hour")
+    parser.add_argument("--requests-per-hour", type=float, default=1000.0, help="Expected traffic for the amortization")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="Held-out questions to use (0 for all)")
+    parser.add_argument("--repetitions", type=int, default=DEFAULT_REPETITIONS, help="Runs per model/question")
+    parser.add_argument("--stream", action="store_true", help="Use the response stream and record TTFT")
+    parser.add_argument("--latency-tolerance", type=float, default=LATENCY_TOLERANCE)
+    parser.add_argument("--cost-tolerance", type=float, default=COST_TOLERANCE)
+    parser.add_argument("--min-gain", type=float, default=MIN_GAIN)
+    parser.add_argument("--max-quality-drop", type=float, default=MAX_QUALITY_DROP)
+    parser.add_argument("--output", default="evaluation_report.json", help="Report path")
+    parser.add_argument("--patch-output", help="Where to write the AppConfig patch (or the patched document with --config)")
+    parser.add_argument("--store", default=DEFAULT_STORE, help="Result history directory (see result_store.py)")
+    parser.add_argument("--no-store", action="store_true", help="Do not append this evaluation to the history")
+    parser.add_argument("--fail-on-reject", action="store_true", help="Exit with status 1 unless the candidate is accepted")
+    args = parser.parse_args()
+
+    config = {}
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+    if args.candidate_family:
+        model_adapters.register(args.candidate, args.candidate_family)
+    if args.candidate_price:
+        input_price, output_price = (float(x) for x in args.candidate_price.split(","))
+        pricing.PRICING[args.candidate] = {"input": input_price, "output": output_price}
+    fixed_costs = {args.candidate: args.candidate_hourly / args.requests_per_hour} if args.candidate_hourly else {}
+
+    report = evaluate(
+        args.candidate, load_questions(args.questions, args.limit), config=config, req_type=args.type,
+        incumbent=args.incumbent, client=get_client('bedrock-runtime', region_name=BEDROCK_REGION),
+        repetitions=args.repetitions, stream=args.stream, fixed_costs=fixed_costs,
+        store_path=None if args.no_store else args.store,
+        latency_tolerance=args.latency_tolerance, cost_tolerance=args.cost_tolerance,
+        min_gain=args.min_gain, max_quality_drop=args.max_quality_drop
+    )
+    print_report(report)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to {args.output}")
+    if report["patch"] is not None and args.patch_output:
+        with open(args.patch_output, "w") as f:
+            json.dump(merge_patch(config, report["patch"]) if args.config else report["patch"], f, indent=2)
+        print(f"AppConfig {'document' if args.config else 'patch'} saved to {args.patch_output}")
+    if args.fail_on_reject and report["decision"] != "ACCEPT":
+        sys.exit(1)
@@ -0,0 +1,452 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Token estimates are the same ones the router uses
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared", "python"))
+import token_budget
+from aws_clients import get_client
+
+# Local prep stage for Bedrock model customization data. Streams any number
+# of JSONL files through a process pool in line batches (at most
+# 2 x workers batches in flight, so memory does not grow with the input):
+# - validates each record against the base model's customization schema,
+#   converting between prompt/completion and messages records where needed
+# - estimates tokens per record, rejects records over the model's limit,
+#   and estimates the training cost
+# - drops exact duplicates (hash of the normalized text) and, with
+#   --near-dup, near duplicates (MinHash signatures with LSH banding)
+# - writes size-bounded train/validation shards, rejects.jsonl with the
+#   reason per bad line, and manifest.json with counts, tokens, cost and a
+#   sha256 per shard
+# Dedup runs in the parent in input order, so the output is deterministic.
+# The output is a local directory, or s3://bucket/prefix to upload there.
+
+# Base models that support customization. Prices are approximate USD per
+# 1K training tokens (per epoch); override with --price-per-1k.
+BASE_MODELS = {
+    "amazon.titan-text-express-v1": {"schema": "prompt_completion", "family": "titan",
+                                     "max_record_tokens": 4096, "price_per_1k": 0.008},
+    "amazon.titan-text-lite-v1": {"schema": "prompt_completion", "family": "titan",
+                                  "max_record_tokens": 4096, "price_per_1k": 0.001},
+    "meta.llama3-1-8b-instruct-v1:0": {"schema": "prompt_completion", "family": "llama3",
+                                       "max_record_tokens": 16384, "price_per_1k": 0.00149},
+    "meta.llama3-1-70b-instruct-v1:0": {"schema": "prompt_completion", "family": "llama3",
+                                        "max_record_tokens": 16384, "price_per_1k": 0.00799},
+    "anthropic.claude-3-haiku-20240307-v1:0": {"schema": "messages", "family": "claude",
+                                               "max_record_tokens": 32000, "price_per_1k": 0.004}
+}
+DEFAULT_BASE_MODEL = "amazon.titan-text-express-v1"
+
+DEFAULT_SHARD_BYTES = 256 * 1024 * 1024
+DEFAULT_BATCH_SIZE = 1000
+
+# MinHash over 3-word shingles; 16 bands of 4 rows make pairs above ~0.5
+# Jaccard candidates, which are then checked against --near-dup-threshold
+NUM_PERM = 64
+LSH_BANDS = 16
+SHINGLE_WORDS = 3
+
+# Multiply-shift parameters, drawn once from a fixed seed so every worker
+# process computes comparable signatures
+_PERM_RNG = random.Random(1)
+PERM_A = [_PERM_RNG.randrange(1, 2 ** 63) | 1 for _ in range(NUM_PERM)]
+PERM_B = [_PERM_RNG.randrange(0, 2 ** 63) for _ in range(NUM_PERM)]
+_PERM_ARRAYS = None # (a, b) as uint64 arrays, built on first use (numpy is optional)
+
+
+class InvalidRecord(Exception):
+    pass
+
+
+def text_of(content):
+    # Message content as a string; content-block lists are flattened
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        parts = [b.get("text") for b in content if isinstance(b, dict) and b.get("type", "text") == "text"]
+        if all(isinstance(p, str) for p in parts) and parts:
+            return "".join(parts)
+    raise InvalidRecord("bad_content: content must be a string or text blocks")
+
+
+def check_messages(messages):
+    if not isinstance(messages, list) or len(messages) < 2:
+        raise InvalidRecord("bad_messages: need at least one user and one assistant turn")
+    turns = []
+    for i, message in enumerate(messages):
+        if not isinstance(message, dict):
+            raise InvalidRecord(f"bad_messages: turn {i} is not an object")
+        role = message.get("role")
+        expected = "user" if i % 2 == 0 else "assistant"
+        if role != expected:
+            raise InvalidRecord(f"bad_role_order: turn {i} is {role!r}, expected {expected!r}")
+        content = text_of(message.get("content"))
+        if not content.strip():
+            raise InvalidRecord(f"empty_content: turn {i}")
+        turns.append({"role": role, "content": content})
+    if turns[-1]["role"] != "assistant":
+        raise InvalidRecord("bad_role_order: last turn must be the assistant's")
+    return turns
+
+
+def normalize_record(record, schema, fields):
+    # The record in the base model's customization schema, or InvalidRecord
+    if not isinstance(record, dict):
+        raise InvalidRecord("not_an_object")
+    if "messages" in record:
+        turns = check_messages(record["messages"])
+        system = record.get("system")
+        if system is not None and not isinstance(system, str):
+            raise InvalidRecord("bad_system: system must be a string")
+        if schema == "messages":
+            return dict({"system": system} if system else {}, messages=turns)
+        if len(turns) != 2:
+            raise InvalidRecord("multi_turn: prompt/completion models take one exchange per record")
+        prompt = f"{system}\n\n{turns[0]['content']}" if system else turns[0]["content"]
+        return {"prompt": prompt, "completion": turns[1]["content"]}
+
+    prompt = record.get(fields["prompt"])
+    completion = record.get(fields["completion"])
+    for name, value in (("prompt", prompt), ("completion", completion)):
+        if value is None:
+            raise InvalidRecord(f"missing_field: {fields[name]}")
+        if not isinstance(value, str) or not value.strip():
+            raise InvalidRecord(f"empty_content: {fields[name]}")
+    if schema == "messages":
+        return {"messages": [{"role": "user", "content": prompt}, {"role": "assistant", "content": completion}]}
+    return {"prompt": prompt, "completion": completion}
+
+
+def record_text(record):
+    if "messages" in record:
+        return "\n".join([record.get("system", "")] + [m["content"] for m in record["messages"]])
+    return record["prompt"] + "\n" + record["completion"]
+
+
+def normalized_words(text):
+    return text.lower().split()
+
+
+def minhash(words, np):
+    # NUM_PERM minimums of multiply-shift hashes of the word shingles
+    global _PERM_ARRAYS
+    if _PERM_ARRAYS is None:
+        _PERM_ARRAYS = (np.asarray(PERM_A, dtype=np.uint64), np.asarray(PERM_B, dtype=np.uint64))
+    a, b = _PERM_ARRAYS
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") for s in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+    with np.errstate(over="ignore"):
+        permuted = (hashes[:, None] * a[None, :] + b[None, :]) >> np.uint64(32)
+    return permuted.min(axis=0).astype(np.uint32).tobytes()
+
+
+def process_batch(batch, spec, fields, near_dup):
+    # Runs in a worker process. batch: [(source, line_no, line)]. Returns
+    # (source, line_no, error, json_line, tokens, digest, signature) per line;
+    # error is None for valid records
+    np = None
+    if near_dup:
+        import numpy as np
+    results = []
+    for source, line_no, line in batch:
+        try:
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise InvalidRecord(f"invalid_json: {e}")
+            record = normalize_record(record, spec["schema"], fields)
+            text = record_text(record)
+            tokens = token_budget.estimate_tokens(text, spec["family"])
+            if tokens > spec["max_record_tokens"]:
+                raise InvalidRecord(f"too_long: ~{tokens} tokens, limit {spec['max_record_tokens']}")
+        except InvalidRecord as e:
+            results.append((source, line_no, str(e), None, 0, None, None))
+            continue
+        words = normalized_words(text)
+        digest = hashlib.blake2b(" ".join(words).encode(), digest_size=16).digest()
+        signature = minhash(words, np) if near_dup else None
+        results.append((source, line_no, None, json.dumps(record, ensure_ascii=False), tokens, digest, signature))
+    return results
+
+
+def read_batches(paths, batch_size):
+    # Yields [(source, line_no, line)] lists; blank lines are skipped
+    batch = []
+    for path in paths:
+        source = os.path.basename(path)
+        with open(path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                batch.append((source, line_no, line))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+class NearDupIndex:
+    # LSH buckets over MinHash signatures of the records kept so far
+    def __init__(self, threshold, np):
+        self.threshold = threshold
+        self.np = np
+        self.rows = NUM_PERM // LSH_BANDS
+        self.buckets = {}
+        self.signatures = []
+
+    def seen(self, signature):
+        # True if a kept record is estimated at >= threshold Jaccard; else keeps this one
+        np = self.np
+        values = np.frombuffer(signature, dtype=np.uint32)
+        keys = [(band, values[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(LSH_BANDS)]
+        candidates = set()
+        for key in keys:
+            candidates.update(self.buckets.get(key, ()))
+        for index in candidates:
+            if (np.frombuffer(self.signatures[index], dtype=np.uint32) == values).mean() >= self.threshold:
+                return True
+        index = len(self.signatures)
+        self.signatures.append(signature)
+        for key in keys:
+            self.buckets.setdefault(key, []).append(index)
+        return False
+
+
+class LocalSink:
+    def __init__(self, directory):
+        self.directory = directory
+        self.staging = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def uri(self, name):
+        return os.path.join(self.directory, name)
+
+    def put(self, path, name):
+        if os.path.abspath(path) != os.path.abspath(self.uri(name)):
+            shutil.move(path, self.uri(name))
+
+    def close(self):
+        pass
+
+
+class S3Sink:
+    # Stages files locally and uploads each one once it is complete
+    def __init__(self, uri):
+        bucket, _, prefix = uri[len("s3://"):].partition("/")
+        self.bucket = bucket
+        self.prefix = prefix.rstrip("/")
+        self.staging = tempfile.mkdtemp(prefix="dataset-")
+        self.client = get_client("s3")
+
+    def uri(self, name):
+        return f"s3://{self.bucket}/{self.prefix}/{name}" if self.prefix else f"s3://{self.bucket}/{name}"
+
+    def put(self, path, name):
+        key = f"{self.prefix}/{name}" if self.prefix else name
+        self.client.upload_file(path, self.bucket, key)
+        os.remove(path)
+
+    def close(self):
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+
+def sink_for(output):
+    return S3Sink(output) if output.startswith("s3://") else LocalSink(output)
+
+
+class ShardWriter:
+    # <split>-00000.jsonl, <split>-00001.jsonl, ... each at most max_bytes
+    def __init__(self, sink, split, max_bytes):
+        self.sink = sink
+        self.split = split
+        self.max_bytes = max_bytes
+        self.shards = []
+        self.file = None
+
+    def _open(self):
+        self.name = f"{self.split}-{len(self.shards):05d}.jsonl"
+        self.file = open(os.path.join(self.sink.staging, self.name), "wb")
+        self.entry = {"name": self.name, "split": self.split, "records": 0, "bytes": 0, "tokens": 0}
+        self.sha256 = hashlib.sha256()
+
+    def _close(self):
+        self.file.close()
+        self.sink.put(self.file.name, self.name)
+        self.entry["sha256"] = self.sha256.hexdigest()
+        self.entry["uri"] = self.sink.uri(self.name)
+        self.shards.append(self.entry)
+        self.file = None
+
+    def write(self, json_line, tokens):
+        data = (json_line + "\n").encode("utf-8")
+        if self.file is not None and self.entry["bytes"] + len(data) > self.max_bytes:
+            self._close()
+        if self.file is None:
+            self._open()
+        self.file.write(data)
+        self.sha256.update(data)
+        self.entry["records"] += 1
+        self.entry["bytes"] += len(data)
+        self.entry["tokens"] += tokens
+
+    def close(self):
+        if self.file is not None:
+            self._close()
+        return self.shards
+
+
+def is_validation(digest, ratio):
+    # Deterministic split on the content hash
+    return ratio > 0 and int.from_bytes(digest[:4], "big") < ratio * 2 ** 32
+
+
+def prepare(inputs, output, base_model=DEFAULT_BASE_MODEL, workers=None, batch_size=DEFAULT_BATCH_SIZE,
+            shard_bytes=DEFAULT_SHARD_BYTES, validation_ratio=0.0, near_dup=False, near_dup_threshold=0.85,
+            epochs=1, price_per_1k=None, fields=None):
+    if base_model not in BASE_MODELS:
+        raise SystemExit(f"Unknown base model {base_model}; choose one of {', '.join(BASE_MODELS)}")
+    spec = BASE_MODELS[base_model]
+    fields = dict({"prompt": "prompt", "completion": "completion"}, **(fields or {}))
+    workers = workers or os.cpu_count() or 1
+    price_per_1k = spec["price_per_1k"] if price_per_1k is None else price_per_1k
+
+    np = None
+    near_dups = None
+    if near_dup:
+        import numpy as np
+        near_dups = NearDupIndex(near_dup_threshold, np)
+
+    sink = sink_for(output)
+    writers = {"train": ShardWriter(sink, "train", shard_bytes)}
+    if validation_ratio > 0:
+        writers["validation"] = ShardWriter(sink, "validation", shard_bytes)
+    rejects_path = os.path.join(sink.staging, "rejects.jsonl")
+    counts = {"read": 0, "valid": 0, "invalid": 0, "exact_duplicates": 0, "near_duplicates": 0}
+    reasons = {}
+    max_tokens = 0
+    seen = set()
+
+    with open(rejects_path, "w", encoding="utf-8") as rejects, ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+
+        def drain_one():
+            nonlocal max_tokens
+            for source, line_no, error, json_line, tokens, digest, signature in pending.popleft().result():
+                counts["read"] += 1
+                if error is not None:
+                    counts["invalid"] += 1
+                    reason = error.split(":", 1)[0]
+                    reasons[reason] = reasons.get(reason, 0) + 1
+                    rejects.write(json.dumps({"source": source, "line": line_no, "reason": error}) + "\n")
+                    continue
+                counts["valid"] += 1
+                if digest in seen:
+                    counts["exact_duplicates"] += 1
+                    continue
+                seen.add(digest)
+                if near_dups is not None and near_dups.seen(signature):
+                    counts["near_duplicates"] += 1
+                    continue
+                max_tokens = max(max_tokens, tokens)
+                split = "validation" if is_validation(digest, validation_ratio) else "train"
+                writers[split].write(json_line, tokens)
+
+        for batch in read_batches(inputs, batch_size):
+            if len(pending) >= workers * 2:
+                drain_one()
+            pending.append(pool.submit(process_batch, batch, spec, fields, near_dup))
+        while pending:
+            drain_one()
+
+    shards = []
+    for writer in writers.values():
+        shards.extend(writer.close())
+    sink.put(rejects_path, "rejects.jsonl")
+
+    tokens = {split: sum(s["tokens"] for s in shards if s["split"] == split) for split in writers}
+    records = {split: sum(s["records"] for s in shards if s["split"] == split) for split in writers}
+    kept = sum(records.values())
+    warnings = []
+    if not records["train"]:
+        warnings.append("No training records were written")
+    if counts["invalid"]:
+        warnings.append(f"{counts['invalid']} invalid records, see rejects.jsonl")
+    manifest = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "base_model": base_model,
+        "schema": spec["schema"],
+        "inputs": [os.path.abspath(p) for p in inputs],
+        "counts": dict(counts, **{f"{split}_records": n for split, n in records.items()}),
+        "rejects_by_reason": reasons,
+        "tokens": dict(tokens, max_record=max_tokens, mean_record=round(sum(tokens.values()) / kept, 1) if kept else 0),
+        "cost": {
+            "epochs": epochs,
+            "price_per_1k_tokens": price_per_1k,
+            # Training is billed on training tokens x epochs
+            "estimated_usd": round(tokens["train"] / 1000 * price_per_1k * epochs, 4)
+        },
+        "shards": shards,
+        "rejects": sink.uri("rejects.jsonl"),
+        "warnings": warnings
+    }
+    manifest_path = os.path.join(sink.staging, "manifest.json")
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    sink.put(manifest_path, "manifest.json")
+    sink.close()
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate, deduplicate and shard a fine-tuning dataset")
+    parser.add_argument("inputs", nargs="+", help="Input JSONL files")
+    parser.add_argument("--output", required=True, help="Output directory, or s3://bucket/prefix")
+    parser.add_argument("--base-model", default=DEFAULT_BASE_MODEL, choices=sorted(BASE_MODELS))
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Lines per worker task")
+    parser.add_argument("--shard-mb", type=float, default=DEFAULT_SHARD_BYTES / 1024 / 1024, help="Maximum shard size")
+    parser.add_argument("--validation-ratio", type=float, default=0.0, help="Share of records for validation shards")
+    parser.add_argument("--near-dup", action="store_true", help="Also drop near duplicates (MinHash; needs numpy)")
+    parser.add_argument("--near-dup-threshold", type=float, default=0.85, help="Estimated Jaccard similarity")
+    parser.add_argument("--epochs", type=int, default=1, help="Epochs for the cost estimate")
+    parser.add_argument("--price-per-1k", type=float, help="Override the training price per 1K tokens")
+    parser.add_argument("--prompt-field", default="prompt", help="Prompt field of prompt/completion input")
+    parser.add_argument("--completion-field", default="completion", help="Completion field of prompt/completion input")
+    args = parser.parse_args()
+
+    manifest = prepare(
+        args.inputs, args.output,
+        base_model=args.base_model,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        shard_bytes=int(args.shard_mb * 1024 * 1024),
+        validation_ratio=args.validation_ratio,
+        near_dup=args.near_dup,
+        near_dup_threshold=args.near_dup_threshold,
+        epochs=args.epochs,
+        price_per_1k=args.price_per_1k,
+        fields={"prompt": args.prompt_field, "completion": args.completion_field}
+    )
+    counts = manifest["counts"]
+    print(f"Read {counts['read']} records: {counts['valid']} valid, {counts['invalid']} invalid, "
+          f"{counts['exact_duplicates']} exact and {counts['near_duplicates']} near duplicates dropped")
+    for shard in manifest["shards"]:
+        print(f"  {shard['uri']}: {shard['records']} records, {shard['bytes']} bytes, ~{shard['tokens']} tokens")
+    print(f"Estimated training cost: ${manifest['cost']['estimated_usd']} "
+          f"(~{manifest['tokens']['train']} tokens x {args.epochs} epoch(s))")
+    for warning in manifest["warnings"]:
+        print(f"WARNING: {warning}")
@@ -3,12 +3,34 @@ import sagemaker
 from sagemaker.estimator import Estimator
 import os
 import datetime
+import json
 
 # Placeholder configuration - in real usage these would come from CDK outputs or ENV
 # For now, we assume user fills these or they are passed in
 ROLE_ARN = os.environ.get("SAGEMAKER_ROLE_ARN", "arn:aws:iam::ACCOUNT_ID:role/service-role/AmazonSageMaker-ExecutionRole-20200101T000001")
 BUCKET_NAME = os.environ.get("S3_BUCKET_NAME", "my-sagemaker-bucket")
 BASE_MODEL_ID = "meta-textgeneration-llama-3-8b" # SageMaker JumpStart ID equivalent
+# Shards written by prepare_dataset.py are found through its manifest.json
+# (local path or s3://); TRAINING_DATA_URI / VALIDATION_DATA_URI override it
+DATASET_MANIFEST = os.environ.get("DATASET_MANIFEST", f"s3://{BUCKET_NAME}/train/manifest.json")
+TRAINING_DATA_URI = os.environ.get("TRAINING_DATA_URI")
+VALIDATION_DATA_URI = os.environ.get("VALIDATION_DATA_URI")
+
+def load_manifest(uri):
+    if uri.startswith("s3://"):
+        bucket, _, key = uri[len("s3://"):].partition("/")
+        body = boto3.client('s3').get_object(Bucket=bucket, Key=key)['Body'].read()
+        return json.loads(body)
+    with open(uri) as f:
+        return json.load(f)
+
+def shard_uri(manifest, split):
+    # A customization job takes one file per split, so the split must fit one shard
+    shards = [s["uri"] for s in manifest["shards"] if s["split"] == split]
+    if len(shards) > 1:
+        raise SystemExit(f"{len(shards)} {split} shards in {DATASET_MANIFEST}; rerun prepare_dataset.py "
+                         f"with a larger --shard-mb or combine them and set {split.upper()}_DATA_URI")
+    return shards[0] if shards else None
 
 def start_finetuning():
     print(f"Starting Fine-Tuning Job for {BASE_MODEL_ID}...")
@@ -16,8 +38,14 @@ def start_finetuning():
     # Initialize SageMaker Session
     sess = sagemaker.Session()
     
-    # Define Training Input (Mock path)
-    training_data_uri = f"s3://{BUCKET_NAME}/train/dataset.jsonl"
+    # Define Training Input
+    training_data_uri, validation_data_uri = TRAINING_DATA_URI, VALIDATION_DATA_URI
+    if not training_data_uri:
+        manifest = load_manifest(DATASET_MANIFEST)
+        training_data_uri = shard_uri(manifest, "train")
+        validation_data_uri = validation_data_uri or shard_uri(manifest, "validation")
+    if not training_data_uri:
+        raise SystemExit(f"No training shard in {DATASET_MANIFEST}")
     
     # Define Hyperparameters
     hyperparameters = {
@@ -36,6 +64,10 @@ def start_finetuning():
     
     job_name = f"finance-finetune-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}"
     
+    extra = {}
+    if validation_data_uri:
+        extra["validationDataConfig"] = {"validators": [{"s3Uri": validation_data_uri}]}
+
     try:
         response = bedrock.create_model_customization_job(
             jobName=job_name,
@@ -52,7 +84,8 @@ def start_finetuning():
                 "epochCount": "1",
                 "batchSize": "1",
                 "learningRate": "0.0001"
-            }
+            },
+            **extra
         )
         print(f"Job started: {response['jobArn']}")
         return response['jobArn']
@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import deque
+
+from pricing import price_for
+
+DEFAULT_SLO_MS = 5000
+DEFAULT_MAX_ERROR_RATE = 0.2
+
+
+def blended_price(model_id):
+    price_cfg = price_for(model_id)
+    return price_cfg['input'] + price_cfg['output']
+
+
+class ModelStats:
+    # Rolling view of one model: EWMA of latency and error rate plus a small
+    # ring buffer of recent latencies for percentiles. Memory is bounded by
+    # `window` no matter how much traffic the model sees.
+    def __init__(self, alpha=0.3, window=50):
+        self.alpha = alpha
+        self.latency_ms = None
+        self.error_rate = 0.0
+        self.recent = deque(maxlen=window)
+        self.samples = 0
+        self.updated_at = 0.0
+
+    def record(self, latency_ms, ok, now):
+        a = self.alpha
+        if ok:
+            self.latency_ms = latency_ms if self.latency_ms is None else a * latency_ms + (1 - a) * self.latency_ms
+            self.recent.append(latency_ms)
+        self.error_rate = a * (0.0 if ok else 1.0) + (1 - a) * self.error_rate
+        self.samples += 1
+        self.updated_at = now
+
+    def percentile(self, pct):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class AdaptiveRouter:
+    # Picks the cheapest candidate whose recent latency meets the SLO and whose
+    # error rate is acceptable. Stats older than `stale_after` seconds are
+    # ignored, so a model that was shed gets retried once it has been idle.
+    def __init__(self, alpha=0.3, window=50, stale_after=60, clock=time.monotonic):
+        self.alpha = alpha
+        self.window = window
+        self.stale_after = stale_after
+        self.clock = clock
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def _stats(self, model_id):
+        stats = self.models.get(model_id)
+        if stats is None:
+            stats = self.models[model_id] = ModelStats(self.alpha, self.window)
+        return stats
+
+    def record(self, model_id, latency_ms, ok=True):
+        with self.lock:
+            self._stats(model_id).record(latency_ms, ok, self.clock())
+
+    def percentile(self, model_id, pct):
+        with self.lock:
+            stats = self.models.get(model_id)
+            return stats.percentile(pct) if stats else None
+
+    def choose(self, candidates, slo_ms=DEFAULT_SLO_MS, max_error_rate=DEFAULT_MAX_ERROR_RATE):
+        now = self.clock()
+        eligible = []
+        measured = []
+        with self.lock:
+            for model_id in candidates:
+                stats = self.models.get(model_id)
+                if stats is None or stats.samples == 0 or now - stats.updated_at > self.stale_after:
+                    # No fresh data: optimistic, so the model gets (re)probed
+                    eligible.append(model_id)
+                    continue
+                latency = stats.latency_ms if stats.latency_ms is not None else float("inf")
+                measured.append((stats.error_rate, latency, model_id))
+                if latency <= slo_ms and stats.error_rate <= max_error_rate:
+                    eligible.append(model_id)
+
+        if eligible:
+            # Blended price as the cost key; candidate order breaks ties
+            return min(eligible, key=lambda m: (blended_price(m), candidates.index(m)))
+        # Nobody meets the SLO: fastest model with an acceptable error rate,
+        # otherwise the one failing least
+        healthy = [m for m in measured if m[0] <= max_error_rate]
+        if healthy:
+            return min(healthy, key=lambda m: m[1])[2]
+        return min(measured)[2]
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                model_id: {
+                    "ewma_latency_ms": round(s.latency_ms, 1) if s.latency_ms is not None else None,
+                    "error_rate": round(s.error_rate, 3),
+                    "p95_ms": s.percentile(95),
+                    "samples": s.samples
+                }
+                for model_id, s in self.models.items()
+            }
@@ -0,0 +1,106 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    # closed -> open after `failure_threshold` consecutive failures.
+    # open -> half_open once `reset_timeout` seconds have passed; up to
+    # `half_open_max_calls` probes are let through. A successful probe closes
+    # the breaker, a failed one re-opens it.
+    def __init__(self, failure_threshold=5, reset_timeout=30, half_open_max_calls=1, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == OPEN:
+                if self.clock() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = HALF_OPEN
+                self.probes = 0
+            if self.state == HALF_OPEN:
+                if self.probes >= self.half_open_max_calls:
+                    return False
+                self.probes += 1
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = self.clock()
+
+
+class BreakerRegistry:
+    # One breaker per model id, created on first use
+    def __init__(self, **breaker_kwargs):
+        self.breaker_kwargs = breaker_kwargs
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def get(self, model_id):
+        with self.lock:
+            breaker = self.breakers.get(model_id)
+            if breaker is None:
+                breaker = self.breakers[model_id] = CircuitBreaker(**self.breaker_kwargs)
+            return breaker
+
+    def configure(self, failure_threshold=None, reset_timeout=None):
+        # Applies AppConfig values to existing and future breakers
+        with self.lock:
+            if failure_threshold is not None:
+                self.breaker_kwargs['failure_threshold'] = failure_threshold
+            if reset_timeout is not None:
+                self.breaker_kwargs['reset_timeout'] = reset_timeout
+            for breaker in self.breakers.values():
+                breaker.failure_threshold = self.breaker_kwargs.get('failure_threshold', breaker.failure_threshold)
+                breaker.reset_timeout = self.breaker_kwargs.get('reset_timeout', breaker.reset_timeout)
+
+    def states(self):
+        with self.lock:
+            return {model_id: b.state for model_id, b in self.breakers.items()}
+
+
+def hedged_call(primary, hedge, delay, executor):
+    # Runs primary(); if it has not succeeded within `delay` seconds (or fails
+    # sooner), also runs hedge(). Returns (result, hedged) from whichever
+    # succeeds first; raises the first error if both fail, except that a
+    # CircuitOpenError gives way to the hedge's real error (the caller would
+    # otherwise retry the hedge model as its fallback). The losing call is
+    # left to finish in the background.
+    futures = {executor.submit(primary): False}
+    done, _ = wait(futures, timeout=delay)
+    if not done or next(iter(done)).exception() is not None:
+        futures[executor.submit(hedge)] = True
+
+    errors = []
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result(), futures[future]
+            errors.append(future.exception())
+    raise next((e for e in errors if not isinstance(e, CircuitOpenError)), errors[0])
@@ -1,128 +1,594 @@
 import json
-import boto3
 import os
+import threading
 import time
-from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 
-appconfig = boto3.client('appconfigdata')
-bedrock = boto3.client('bedrock-runtime')
+from aws_clients import get_client
+from model_adapters import get_adapter
+import model_adapters
+import pricing
+import prompt_templates
+import telemetry
+import token_budget
+import workflow_steps
+import compliance
+import adaptive_router
+import bedrock_invoker
+import circuit_breaker
+import profiling
+import region_router
+import response_cache
+import semantic_cache
+import single_flight
+
+# Response cache (module level so it survives warm invocations); None when disabled
+RESPONSE_CACHE = response_cache.from_env()
+
+# Rolling per-model latency/error stats for adaptive routing (per container)
+ROUTER = adaptive_router.AdaptiveRouter()
+
+# Identical in-flight Bedrock calls share one upstream call; None when disabled
+SINGLE_FLIGHT = single_flight.from_env()
+
+# Per-model circuit breakers and the pool hedged requests run on
+BREAKERS = circuit_breaker.BreakerRegistry()
+HEDGE_POOL = ThreadPoolExecutor(max_workers=8)
+FALLBACK_MODEL = workflow_steps.FALLBACK_MODEL
+DEFAULT_HEDGE_DELAY_MS = 2000
+
+# Active-active Bedrock regions, ranked by probe latency with in-request
+# failover on throttling. AppConfig `regions` overrides BEDROCK_REGIONS.
+PROBE_MODEL = os.environ.get('REGION_PROBE_MODEL', FALLBACK_MODEL)
+ENV_REGIONS = region_router.regions_from_env()
+REGION_ROUTER = region_router.RegionRouter(ENV_REGIONS, probe=region_router.make_probe(PROBE_MODEL))
+
+# Direct API Gateway mode: with no Step Functions around the router, a failed
+# request runs the workflow's fallback and degradation steps in-process
+IN_PROCESS_FALLBACK = os.environ.get('IN_PROCESS_FALLBACK', 'false').lower() == 'true'
+# The primary attempt stops this much earlier so the fallback still fits
+FALLBACK_RESERVE_MS = float(os.environ.get('FALLBACK_RESERVE_MS', '8000')) if IN_PROCESS_FALLBACK else 0.0
+
+# Per-model AIMD concurrency limits and throttling-only retries for every Bedrock call
+INVOKER = bedrock_invoker.BedrockInvoker()
+
+# Batch requests fan out over this pool inside one invocation
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '50'))
+BATCH_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get('BATCH_CONCURRENCY', '8')))
+
+# Full request events are logged only while debugging (they can be large and carry user text)
+LOG_EVENTS = os.environ.get('LOG_EVENTS', 'true').lower() == 'true'
+
+# Semantic cache, built on first use once AppConfig has a `semantic_cache` section
+SEMANTIC_CACHE = None
+SEMANTIC_CACHE_LOCK = threading.Lock()
 
 # Cache configuration
 CONFIG_CACHE = {
     "data": None,
     "token": None,
-    "last_updated": 0
+    "last_updated": 0,
+    "last_attempt": 0,
+    "refreshing": False,
+    "refreshes": 0,
+    "refresh_failures": 0,
+    "last_refresh_ms": None
 }
 CACHE_TTL = 60 # seconds
+CONFIG_RETRY_INTERVAL = 5 # seconds between blocking attempts while no config has loaded
+DEFAULT_CONFIG = {"default_model": "anthropic.claude-3-sonnet-20240229-v1:0"}
+
+# Serializes AppConfig polls (the session token must not be used concurrently)
+CONFIG_REFRESH_LOCK = threading.Lock()
+
+# Read config from the AppConfig Lambda extension's local endpoint instead of the API
+USE_APPCONFIG_EXTENSION = os.environ.get('APPCONFIG_USE_EXTENSION', 'false').lower() == 'true'
+APPCONFIG_EXTENSION_PORT = os.environ.get('AWS_APPCONFIG_EXTENSION_HTTP_PORT', '2772')
+
+def fetch_config(app_id, env_id, profile_id):
+    # Returns the new configuration, or None when AppConfig reports no change
+    if USE_APPCONFIG_EXTENSION:
+        import urllib.request # Only this path needs it; it pulls in http and email
+        url = (f"http://localhost:{APPCONFIG_EXTENSION_PORT}/applications/{app_id}"
+               f"/environments/{env_id}/configurations/{profile_id}")
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    if not CONFIG_CACHE['token']:
+        # Initial session
+        response = get_client('appconfigdata').start_configuration_session(
+            ApplicationIdentifier=app_id,
+            EnvironmentIdentifier=env_id,
+            ConfigurationProfileIdentifier=profile_id,
+            RequiredMinimumPollIntervalInSeconds=60
+        )
+        CONFIG_CACHE['token'] = response['InitialConfigurationToken']
+
+    # Get latest config
+    response = get_client('appconfigdata').get_latest_configuration(
+        ConfigurationToken=CONFIG_CACHE['token']
+    )
+
+    CONFIG_CACHE['token'] = response['NextPollConfigurationToken']
+
+    if 'Configuration' in response:
+        content = response['Configuration'].read().decode('utf-8')
+        if content:
+            return json.loads(content)
+    return None
+
+def refresh_config(app_id, env_id, profile_id, blocking=True):
+    # Polls AppConfig once. A failed poll keeps the last-known-good config.
+    try:
+        if not CONFIG_REFRESH_LOCK.acquire(blocking=blocking):
+            return # Another refresh is already polling
+        try:
+            failed = poll_config(app_id, env_id, profile_id)
+        finally:
+            CONFIG_REFRESH_LOCK.release()
+    finally:
+        # Cleared on every exit, including losing the lock to a cold-start load
+        CONFIG_CACHE['refreshing'] = False
+    telemetry.emit({'Stage': 'config_refresh'}, {
+        'ConfigRefreshLatency': (CONFIG_CACHE['last_refresh_ms'], telemetry.MILLISECONDS),
+        'ConfigRefreshFailures': (failed, telemetry.COUNT)
+    })
+
+def poll_config(app_id, env_id, profile_id):
+    # Caller holds CONFIG_REFRESH_LOCK; returns 1 on failure, 0 on success
+    start = time.perf_counter()
+    CONFIG_CACHE['last_attempt'] = time.time()
+    try:
+        data = fetch_config(app_id, env_id, profile_id)
+        if data is not None:
+            CONFIG_CACHE['data'] = data
+        CONFIG_CACHE['last_updated'] = time.time()
+        CONFIG_CACHE['refreshes'] += 1
+        return 0
+    except Exception as e:
+        print(f"Error fetching config: {e}")
+        CONFIG_CACHE['token'] = None # Start a fresh session next time
+        CONFIG_CACHE['refresh_failures'] += 1
+        CONFIG_CACHE['last_attempt'] = time.time() # Retries back off from the failure
+        return 1
+    finally:
+        CONFIG_CACHE['last_refresh_ms'] = round((time.perf_counter() - start) * 1000, 1)
 
 def get_config():
-    global CONFIG_CACHE
-    now = time.time()
-    
+    # Stale-while-revalidate: once a config is loaded it is returned without
+    # waiting, and an expired copy triggers a background refresh. Only the
+    # first load (cold start) blocks on AppConfig.
     app_id = os.environ.get('APPCONFIG_APP_ID')
     env_id = os.environ.get('APPCONFIG_ENV_ID')
     profile_id = os.environ.get('APPCONFIG_PROFILE_ID')
     
     if not (app_id and env_id and profile_id):
         # Fallback if env vars missing
-        return {"default_model": "anthropic.claude-3-sonnet-20240229-v1:0"}
+        return dict(DEFAULT_CONFIG)
+
+    data = CONFIG_CACHE['data']
+    if data is None:
+        if time.time() - CONFIG_CACHE['last_attempt'] >= CONFIG_RETRY_INTERVAL:
+            refresh_config(app_id, env_id, profile_id)
+        return CONFIG_CACHE['data'] or dict(DEFAULT_CONFIG)
+
+    now = time.time()
+    if (now - CONFIG_CACHE['last_updated'] >= CACHE_TTL
+            and now - CONFIG_CACHE['last_attempt'] >= CONFIG_RETRY_INTERVAL
+            and not CONFIG_CACHE['refreshing']):
+        CONFIG_CACHE['refreshing'] = True
+        threading.Thread(
+            target=refresh_config,
+            args=(app_id, env_id, profile_id, False),
+            daemon=True
+        ).start()
+    return data
+
+def config_metrics():
+    return {
+        'config_age_s': round(time.time() - CONFIG_CACHE['last_updated'], 1) if CONFIG_CACHE['last_updated'] else None,
+        'config_refresh_ms': CONFIG_CACHE['last_refresh_ms'],
+        'config_refreshes': CONFIG_CACHE['refreshes'],
+        'config_refresh_failures': CONFIG_CACHE['refresh_failures']
+    }
+
+def get_semantic_cache(config):
+    global SEMANTIC_CACHE
+    settings = config.get('semantic_cache')
+    if not settings or not semantic_cache.available():
+        return None
+
+    if SEMANTIC_CACHE is None:
+        with SEMANTIC_CACHE_LOCK:
+            if SEMANTIC_CACHE is None:
+                SEMANTIC_CACHE = semantic_cache.from_settings(settings, invoke_embedding)
+    # Thresholds can change with every config deployment
+    SEMANTIC_CACHE.thresholds = settings.get('thresholds', {})
+    SEMANTIC_CACHE.default_threshold = settings.get('default_threshold', semantic_cache.DEFAULT_THRESHOLD)
+    return SEMANTIC_CACHE
+
+def configure_regions(config):
+    settings = config.get('regions', {})
+    REGION_ROUTER.configure(
+        settings.get('names') or ENV_REGIONS,
+        settings.get('cooldown_s'),
+        settings.get('probe_interval_s')
+    )
+
+def select_model(config, req_type):
+    # Static mode: overrides[type] or default_model.
+    # Adaptive mode: cheapest of routing.candidates[type] meeting the latency SLO.
+    overrides = config.get('overrides', {})
+    static_model = overrides.get(req_type, config.get('default_model', 'anthropic.claude-3-sonnet-20240229-v1:0'))
+
+    routing = config.get('routing', {})
+    candidates = routing.get('candidates', {}).get(req_type)
+    if routing.get('mode') != 'adaptive' or not candidates:
+        return static_model
+
+    slo_ms = routing.get('type_slo_ms', {}).get(req_type, routing.get('latency_slo_ms', adaptive_router.DEFAULT_SLO_MS))
+    max_error_rate = routing.get('max_error_rate', adaptive_router.DEFAULT_MAX_ERROR_RATE)
+    return ROUTER.choose(candidates, slo_ms, max_error_rate)
+
+def invoke_coalesced(model_id, prompt, max_tokens=None, deadline=None, system=None):
+    # invoke_bedrock behind the single-flight layer: concurrent calls with the
+    # same model, normalized prompt and parameters wait for the first one
+    if SINGLE_FLIGHT is None:
+        return invoke_bedrock(model_id, prompt, max_tokens, deadline, system)
+    key = response_cache.make_key(model_id, prompt, {'max_tokens': max_tokens, 'system': system})
+    start = time.perf_counter()
+    answer, collapsed = SINGLE_FLIGHT.do(
+        key, lambda: invoke_bedrock(model_id, prompt, max_tokens, deadline, system), deadline
+    )
+    # Collapsed is 0/1 per call, so its Average is the collapse ratio and its Sum the saved calls
+    telemetry.emit({'Model': model_id}, {
+        'Collapsed': (1 if collapsed else 0, telemetry.COUNT),
+        'CollapsedWaitLatency': (round((time.perf_counter() - start) * 1000, 2) if collapsed else None, telemetry.MILLISECONDS)
+    })
+    return answer
+
+def invoke_bedrock_tracked(model_id, prompt, max_tokens=None, deadline=None, system=None):
+    # invoke_coalesced, feeding latency and failures into the adaptive router
+    start = time.perf_counter()
+    try:
+        answer = invoke_coalesced(model_id, prompt, max_tokens, deadline, system)
+    except Exception:
+        ROUTER.record(model_id, (time.perf_counter() - start) * 1000, ok=False)
+        raise
+    ROUTER.record(model_id, (time.perf_counter() - start) * 1000)
+    return answer
+
+def invoke_guarded(model_id, prompt, max_tokens=None, deadline=None, system=None):
+    # Skips the call entirely while the model's breaker is open
+    breaker = BREAKERS.get(model_id)
+    if not breaker.allow():
+        raise circuit_breaker.CircuitOpenError(f"Circuit open for {model_id}")
+    try:
+        answer = invoke_bedrock_tracked(model_id, prompt, max_tokens, deadline, system)
+    except Exception:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return answer
+
+def answer_question(model_id, prompt, config, max_tokens=None, deadline=None, system=None):
+    # Returns (answer, model_used). An open breaker on the primary sends the
+    # request straight to the fallback model. With hedging on, the fallback is
+    # also started if the primary has not answered within its recent p95.
+    resilience = config.get('resilience', {})
+    fallback = resilience.get('fallback_model', FALLBACK_MODEL)
+    BREAKERS.configure(resilience.get('failure_threshold'), resilience.get('reset_timeout_s'))
 
-    if CONFIG_CACHE['data'] and (now - CONFIG_CACHE['last_updated'] < CACHE_TTL):
-        return CONFIG_CACHE['data']
-        
     try:
-        if not CONFIG_CACHE['token']:
-            # Initial session
-            response = appconfig.start_configuration_session(
-                ApplicationIdentifier=app_id,
-                EnvironmentIdentifier=env_id,
-                ConfigurationProfileIdentifier=profile_id,
-                RequiredMinimumPollIntervalInSeconds=60
+        if resilience.get('hedging') and fallback != model_id:
+            p95_ms = ROUTER.percentile(model_id, 95)
+            delay_ms = p95_ms if p95_ms is not None else resilience.get('hedge_delay_ms', DEFAULT_HEDGE_DELAY_MS)
+            answer, hedged = circuit_breaker.hedged_call(
+                lambda: invoke_guarded(model_id, prompt, max_tokens, deadline, system),
+                lambda: invoke_guarded(fallback, prompt, max_tokens, deadline, system),
+                delay_ms / 1000.0,
+                HEDGE_POOL
             )
-            CONFIG_CACHE['token'] = response['InitialConfigurationToken']
-            
-        # Get latest config
-        response = appconfig.get_latest_configuration_profile(
-            ConfigurationToken=CONFIG_CACHE['token']
-        )
-        
-        CONFIG_CACHE['token'] = response['NextPollConfigurationToken']
-        
-        if 'Configuration' in response:
-            content = response['Configuration'].read().decode('utf-8')
-            if content:
-                CONFIG_CACHE['data'] = json.loads(content)
-                CONFIG_CACHE['last_updated'] = now
-                
-        return CONFIG_CACHE['data'] or {}
-        
-    except Exception as e:
-        print(f"Error fetching config: {e}")
-        return {"default_model": "anthropic.claude-3-sonnet-20240229-v1:0"}
+            return answer, (f"HEDGED:{fallback}" if hedged else model_id)
+        return invoke_guarded(model_id, prompt, max_tokens, deadline, system), model_id
+    except circuit_breaker.CircuitOpenError as e:
+        if fallback == model_id:
+            raise
+        print(f"{e}, using {fallback}")
+        return invoke_guarded(fallback, prompt, max_tokens, deadline, system), f"FALLBACK:{fallback}"
 
-def invoke_bedrock(model_id, prompt):
-    print(f"Invoking {model_id}")
-    
-    # Simple adapter logic for different models
-    body = ""
-    if "claude" in model_id:
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 512,
-            "messages": [{"role": "user", "content": prompt}]
-        })
-    elif "llama3" in model_id:
-        body = json.dumps({
-            "prompt": prompt,
-            "max_gen_len": 512,
-            "temperature": 0.5,
-            "top_p": 0.9
-        })
-    elif "mistral" in model_id:
-        body = json.dumps({
-            "prompt": f"<s>[INST] {prompt} [/INST]",
-            "max_tokens": 512,
-            "temperature": 0.5
-        })
-    else:
-        # Default fallback (Titan or generic)
-        body = json.dumps({
-            "inputText": prompt
-        })
-
-    response = bedrock.invoke_model(
+def emit_invocation(model_id, timer, usage, properties, extra_metrics=None):
+    # One EMF record per model call: stage latencies, token usage (including
+    # prompt-cache reads/writes) and cost
+    input_tokens = usage.get('input_tokens')
+    output_tokens = usage.get('output_tokens')
+    cache_read = usage.get('cache_read_tokens') or 0
+    cache_write = usage.get('cache_write_tokens') or 0
+    cost = pricing.estimate_cost(model_id, input_tokens or 0, output_tokens or 0, cache_read, cache_write)
+    metrics = timer.metrics()
+    metrics.update(extra_metrics or {})
+    metrics.update({
+        'InputTokens': (input_tokens, telemetry.COUNT),
+        'OutputTokens': (output_tokens, telemetry.COUNT),
+        'CacheReadTokens': (cache_read, telemetry.COUNT),
+        'CacheWriteTokens': (cache_write, telemetry.COUNT),
+        'Cost': (round(cost, 8), telemetry.NONE)
+    })
+    telemetry.emit({'Model': model_id}, metrics, properties)
+
+def invoke_embedding(model_id, body):
+    # Semantic cache embeddings share the concurrency limits, retries and
+    # region failover of every other Bedrock call
+    response, _ = INVOKER.call(model_id, lambda: REGION_ROUTER.call(lambda client: client.invoke_model(
         body=body,
         modelId=model_id,
         accept='application/json',
         contentType='application/json'
+    )))
+    return response
+
+def invoke_bedrock(model_id, prompt, max_tokens=None, deadline=None, system=None):
+    adapter = get_adapter(model_id)
+    timer = telemetry.StageTimer()
+
+    with timer.stage('encode'):
+        body = adapter.build_body(prompt, max_tokens, system, prompt_templates.use_cache(model_id, system))
+    with timer.stage('invoke'):
+        response, region = INVOKER.call(model_id, lambda: REGION_ROUTER.call(lambda client: client.invoke_model(
+            body=body,
+            modelId=model_id,
+            accept='application/json',
+            contentType='application/json'
+        )), deadline)
+
+    with timer.stage('decode'):
+        result = adapter.parse_result(response, prompt)
+    text = result['text']
+
+    # Estimates ride along so actual vs. estimated usage can be compared in Logs Insights
+    emit_invocation(model_id, timer, result, {
+        'estimated_input_tokens': adapter.estimate_tokens(prompt) + adapter.estimate_tokens(system),
+        'estimated_output_tokens': adapter.estimate_tokens(text),
+        'max_output_tokens': max_tokens or model_adapters.DEFAULT_MAX_TOKENS,
+        'region': region or os.environ.get('AWS_REGION')
+    })
+    return text
+
+def invoke_bedrock_stream(model_id, prompt, max_tokens=None, deadline=None, system=None):
+    # Yields (text_delta, usage) as Bedrock produces them
+    adapter = get_adapter(model_id)
+    body = adapter.build_body(prompt, max_tokens, system, prompt_templates.use_cache(model_id, system))
+
+    # Failover covers opening the stream; once chunks flow the region is fixed
+    response, _ = INVOKER.call(model_id, lambda: REGION_ROUTER.call(lambda client: client.invoke_model_with_response_stream(
+        body=body,
+        modelId=model_id,
+        accept='application/json',
+        contentType='application/json'
+    )), deadline)
+
+    for event in response.get('body'):
+        chunk = event.get('chunk')
+        if chunk:
+            yield adapter.decode_chunk(json.loads(chunk['bytes']))
+
+def stream_answer(model_id, prompt, max_tokens=None, deadline=None, system=None, scanner=None):
+    # Generator of stream events: {"delta": text} per chunk, then one final
+    # {"done": true, ...} event with time-to-first-token and token usage.
+    # A response-streaming transport can write each event as it is produced.
+    # Chunks already sent cannot be redacted, so streams are only flagged.
+    # Like invoke_guarded, an open breaker skips the call and the outcome
+    # feeds the breaker and the adaptive router.
+    breaker = BREAKERS.get(model_id)
+    if not breaker.allow():
+        raise circuit_breaker.CircuitOpenError(f"Circuit open for {model_id}")
+    timer = telemetry.StageTimer()
+    ttft = None
+    usage = {}
+    scan = scanner.stream() if scanner is not None else None
+    try:
+        for text, chunk_usage in invoke_bedrock_stream(model_id, prompt, max_tokens, deadline, system):
+            usage.update(chunk_usage)
+            if text:
+                if ttft is None:
+                    ttft = timer.elapsed_ms()
+                if scan is not None:
+                    scan.feed(text)
+                yield {'delta': text}
+    except Exception:
+        breaker.record_failure()
+        ROUTER.record(model_id, timer.elapsed_ms(), ok=False)
+        raise
+
+    latency_ms = timer.elapsed_ms()
+    breaker.record_success()
+    ROUTER.record(model_id, latency_ms)
+    timer.add('invoke', latency_ms)
+    emit_invocation(
+        model_id, timer, usage, {'stream': True},
+        {'TimeToFirstToken': (round(ttft, 2) if ttft is not None else None, telemetry.MILLISECONDS)}
     )
-    
-    response_body = json.loads(response.get('body').read())
-    
-    # Extract text
-    if "claude" in model_id:
-        return response_body['content'][0]['text']
-    elif "llama3" in model_id:
-        return response_body['generation']
-    elif "mistral" in model_id:
-        return response_body['outputs'][0]['text']
-    else:
-        return str(response_body)
+
+    done = {
+        'done': True,
+        'model_used': model_id,
+        'ttft_ms': round(ttft, 1) if ttft is not None else None,
+        'latency_ms': round(latency_ms, 1),
+        'usage': usage
+    }
+    if scan is not None:
+        scan.finish()
+        if scan.findings:
+            done['compliance'] = compliance.summarize(scan.findings)
+            print(f"Compliance: {json.dumps(done['compliance'])} in stream from {model_id}")
+    yield done
+
+def apply_budget(question, req_type, config, model_id):
+    # Returns (prompt, max_output_tokens) under the type's AppConfig token budget;
+    # oversized prompts are trimmed before they are sent
+    max_output_tokens, max_input_tokens = token_budget.resolve_budget(config, req_type)
+    prompt, estimated, truncated = token_budget.truncate_prompt(
+        question, max_input_tokens, get_adapter(model_id).family
+    )
+    if truncated:
+        print(f"Prompt trimmed to ~{estimated} tokens (limit {max_input_tokens}) for type {req_type}")
+    return prompt, max_output_tokens
+
+def check_compliance(payload, config):
+    # Scans the answer of a response payload (cache hits included) and adds a
+    # `compliance` summary when something matched; with the "redact" action
+    # PII in the answer is masked
+    if not compliance.ENABLED or not payload.get('answer'):
+        return payload
+    payload['answer'], findings = compliance.scanner_for(config).check(payload['answer'])
+    if findings:
+        payload['compliance'] = compliance.summarize(findings)
+        print(f"Compliance: {json.dumps(payload['compliance'])} in answer from {payload['model_used']}")
+    return payload
+
+def handle_question(question, req_type, config, model_id=None, deadline=None):
+    # Cache lookups, model invocation and cache fill for one question.
+    # Returns the response payload: {"answer", "model_used"[, "compliance"]}.
+    if model_id is None:
+        model_id = select_model(config, req_type)
+    configure_regions(config)
+    question, max_tokens = apply_budget(question, req_type, config, model_id)
+    # Type's shared system prefix plus the question wrapped in its template
+    templates = prompt_templates.templates_for(config)
+    system, prompt = templates.render(req_type, question)
+
+    # Serve repeated questions from cache
+    params = None
+    if RESPONSE_CACHE is not None:
+        params = response_cache.params_from_body(get_adapter(model_id).build_request(prompt, max_tokens, system))
+        params['system'] = system # Part of the key for families that inline it into the prompt
+        cached = RESPONSE_CACHE.get(model_id, prompt, params)
+        if cached is not None:
+            return check_compliance({'answer': cached, 'model_used': f"CACHE:{model_id}"}, config)
+
+    # Near-duplicate questions: nearest stored answer above the type's threshold
+    semantic = get_semantic_cache(config)
+    vector = None
+    if semantic is not None:
+        semantic_key = semantic_cache.index_key(model_id, templates.fingerprint(req_type), max_tokens)
+        similar, score, vector = semantic.lookup(semantic_key, question, req_type)
+        if similar is not None:
+            return check_compliance({'answer': similar, 'model_used': f"SEMANTIC_CACHE:{model_id}"}, config)
+
+    # Invoke
+    answer, model_used = answer_question(model_id, prompt, config, max_tokens, deadline, system)
+    # Scanned before the cache fill so redacted PII is never stored
+    payload = check_compliance({'answer': answer, 'model_used': model_used}, config)
+
+    # Only the primary model's answers are cached under its key
+    if RESPONSE_CACHE is not None and model_used == model_id:
+        RESPONSE_CACHE.set(model_id, prompt, payload['answer'], params)
+    if semantic is not None and model_used == model_id:
+        semantic.add(semantic_key, vector, payload['answer'])
+
+    return payload
+
+def handle_batch(body, event, deadline=None):
+    # {"questions": [...]} where each item is a question string or
+    # {"question", "type"}. Items run concurrently on BATCH_POOL; results keep
+    # the request order and a failed item carries its own error.
+    items = body.get('questions')
+    if not isinstance(items, list) or not items:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'questions must be a non-empty list', 'received': event})
+        }
+    if len(items) > MAX_BATCH_SIZE:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': f"Batch exceeds {MAX_BATCH_SIZE} questions"})
+        }
+
+    config = get_config()
+    default_type = body.get('type', 'general')
+
+    def run_item(item):
+        if isinstance(item, str):
+            item = {'question': item}
+        question = item.get('question') if isinstance(item, dict) else None
+        if not question:
+            return {'error': 'Missing question'}
+        try:
+            return handle_question(question, item.get('type', default_type), config, deadline=deadline)
+        except Exception as e:
+            print(f"Batch item failed: {e}")
+            return {'error': str(e)}
+
+    results = list(BATCH_POOL.map(run_item, items))
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'results': results})
+    }
+
+def emit_request(timer, req_type, properties):
+    # One EMF record per Lambda request: parse/config/handle stages and total latency
+    metrics = timer.metrics()
+    metrics['RequestLatency'] = (round(timer.elapsed_ms(), 2), telemetry.MILLISECONDS)
+    if properties.get('compliance'):
+        metrics['ComplianceFindings'] = (sum(properties['compliance'].values()), telemetry.COUNT)
+    properties = dict(config_metrics(), bedrock=INVOKER.snapshot(), **properties)
+    if len(REGION_ROUTER.regions) > 1:
+        properties['regions'] = REGION_ROUTER.snapshot()
+    if SINGLE_FLIGHT is not None:
+        properties['single_flight'] = SINGLE_FLIGHT.stats()
+    if RESPONSE_CACHE is not None:
+        properties['response_cache'] = RESPONSE_CACHE.stats()
+    if SEMANTIC_CACHE is not None:
+        properties['semantic_cache'] = SEMANTIC_CACHE.stats()
+    telemetry.emit({'RequestType': req_type}, metrics, properties)
 
 def lambda_handler(event, context):
-    print("Event:", json.dumps(event))
+    # Profiled requests get a Server-Timing header with the stage breakdown
+    timer = telemetry.StageTimer()
+    mode = profiling.mode_for(event)
+    if mode is None:
+        return handle_event(event, context, timer)
+    name = getattr(context, 'aws_request_id', None) or f"request-{int(time.time() * 1000)}"
+    response, _ = profiling.run(mode, name, lambda: handle_event(event, context, timer))
+    response['headers'] = dict(response.get('headers') or {}, **{'Server-Timing': profiling.server_timing(timer.stages)})
+    return response
+
+def handle_event(event, context, timer):
+    if LOG_EVENTS:
+        with timer.stage('log'):
+            print("Event:", json.dumps(event))
+    # Bedrock waits and retries stop short of the Lambda timeout
+    deadline = bedrock_invoker.Deadline.from_context(
+        context, bedrock_invoker.DEADLINE_RESERVE_MS + FALLBACK_RESERVE_MS)
+    question = None
+    config = {}
+    fallback = FALLBACK_MODEL
     
     try:
         # Parse input
-        body = event
-        if 'body' in event:
-            if isinstance(event['body'], str):
-                body = json.loads(event['body'])
-            elif isinstance(event['body'], dict):
-                body = event['body']
-        
+        with timer.stage('parse'):
+            body = event
+            if 'body' in event:
+                if isinstance(event['body'], str):
+                    body = json.loads(event['body'])
+                elif isinstance(event['body'], dict):
+                    body = event['body']
+
+        if not isinstance(body, dict):
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'Request body must be a JSON object', 'received': event})
+            }
+
         question = body.get('question')
         req_type = body.get('type', 'general')
+
+        if 'questions' in body:
+            with timer.stage('handle'):
+                response = handle_batch(body, event, deadline)
+            items = body.get('questions')
+            emit_request(timer, 'batch', {'batch_size': len(items) if isinstance(items, list) else 0})
+            return response
         
         if not question:
             return {
@@ -131,24 +597,46 @@ def lambda_handler(event, context):
             }
 
         # Get Config
-        config = get_config()
+        with timer.stage('config'):
+            config = get_config()
+        fallback = config.get('resilience', {}).get('fallback_model', FALLBACK_MODEL)
         
         # Determine Model
-        overrides = config.get('overrides', {})
-        model_id = overrides.get(req_type, config.get('default_model', 'anthropic.claude-3-sonnet-20240229-v1:0'))
-        
-        # Invoke
-        answer = invoke_bedrock(model_id, question)
+        model_id = select_model(config, req_type)
         
+        if body.get('stream'):
+            # Newline-delimited JSON events, in the order they were produced
+            with timer.stage('handle'):
+                configure_regions(config)
+                question, max_tokens = apply_budget(question, req_type, config, model_id)
+                system, prompt = prompt_templates.templates_for(config).render(req_type, question)
+                scanner = compliance.scanner_for(config) if compliance.ENABLED else None
+                events = list(stream_answer(model_id, prompt, max_tokens, deadline, system, scanner))
+            with timer.stage('serialize'):
+                response_body = "\n".join(json.dumps(e) for e in events) + "\n"
+            emit_request(timer, req_type, {'model_used': model_id, 'stream': True, 'compliance': events[-1].get('compliance')})
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/x-ndjson'},
+                'body': response_body
+            }
+
+        with timer.stage('handle'):
+            result = handle_question(question, req_type, config, model_id, deadline)
+        with timer.stage('serialize'):
+            response_body = json.dumps(result)
+        emit_request(timer, req_type, {'model_used': result['model_used'], 'compliance': result.get('compliance')})
         return {
             'statusCode': 200,
-            'body': json.dumps({
-                'answer': answer,
-                'model_used': model_id
-            })
+            'body': response_body
         }
         
     except Exception as e:
         print(f"Error: {e}")
-        raise e
-
+        if not IN_PROCESS_FALLBACK or not question:
+            # Step Functions catches this and moves on to the fallback state
+            raise e
+        fallback_deadline = bedrock_invoker.Deadline.from_context(context)
+        result = check_compliance(workflow_steps.fallback_or_degrade(question, fallback, INVOKER, fallback_deadline), config)
+        emit_request(timer, req_type, {'model_used': result['model_used'], 'compliance': result.get('compliance'), 'error': str(e)})
+        return workflow_steps.response(result)
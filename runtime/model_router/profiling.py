@@ -0,0 +1,184 @@
+import json
+import os
+import sys
+import threading
+import time
+
+# Opt-in profiling of single router requests. The stage timers in the EMF
+# records always run; this adds one of:
+#   cprofile - deterministic: every function call is timed (a few x slower)
+#   sample   - a thread snapshots the handler thread's stack every
+#              PROFILING_INTERVAL_MS; low overhead, wall-clock based, so time
+#              blocked on Bedrock shows up under the socket/ssl frames
+# Enabled for every request with PROFILING_MODE, or per request with the
+# X-Profile header (value: the mode) when PROFILING_ALLOW_HEADER=true.
+# Each profile writes <id>.prof (cprofile; open with pstats or snakeviz) or
+# <id>.collapsed (sample; one "frame;frame;... count" line per stack, the
+# input of flamegraph.pl and speedscope) to PROFILING_DIR, and logs a summary
+# line with the top functions or stacks and the share spent in JSON and
+# network code. cProfile and pstats (and the modules they pull in) are only
+# imported when a request is actually profiled, so the handler's cold start
+# does not pay for them.
+
+MODES = ("cprofile", "sample")
+MODE = os.environ.get('PROFILING_MODE', '').lower() or None
+ALLOW_HEADER = os.environ.get('PROFILING_ALLOW_HEADER', 'false').lower() == 'true'
+HEADER = "x-profile"
+OUTPUT_DIR = os.environ.get('PROFILING_DIR', '/tmp/profiles')
+INTERVAL_MS = float(os.environ.get('PROFILING_INTERVAL_MS', '2'))
+TOP_N = int(os.environ.get('PROFILING_TOP_N', '10'))
+
+# Frame substrings (file path or function name) per category for the summary
+CATEGORIES = {
+    "json": ("json/", "_json", "orjson"),
+    "network": ("ssl.py", "socket.py", "http/client.py", "urllib3/", "selectors.py")
+}
+
+
+def mode_for(event):
+    # Profiling mode for this request, or None
+    if ALLOW_HEADER and isinstance(event, dict):
+        headers = event.get('headers') or {}
+        for name, value in headers.items():
+            if name.lower() == HEADER and value:
+                value = value.lower()
+                return value if value in MODES else MODES[0]
+    return MODE if MODE in MODES else None
+
+
+def short_path(filename):
+    # Package directory and file name, e.g. json/encoder.py
+    return os.path.join(os.path.basename(os.path.dirname(filename)), os.path.basename(filename))
+
+
+def frame_label(code):
+    return f"{code.co_name} ({short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+def category_of(labels):
+    # First category any of the labels (innermost first) falls in
+    for label in labels:
+        for category, markers in CATEGORIES.items():
+            if any(marker in label for marker in markers):
+                return category
+    return "other"
+
+
+class Sampler:
+    # Samples one thread's stack from a background thread
+    def __init__(self, thread_id, interval_ms=INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000.0
+        self.stacks = {}
+        self.samples = 0
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def _run(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.done.set()
+        self.thread.join()
+
+
+class Profile:
+    def __init__(self, mode, name, directory=OUTPUT_DIR, interval_ms=INTERVAL_MS):
+        self.mode = mode
+        self.name = name
+        self.directory = directory
+        self.interval_ms = interval_ms
+        self.profiler = None
+        self.sampler = None
+        self.elapsed_ms = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.mode == "cprofile":
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.sampler = Sampler(threading.get_ident(), self.interval_ms)
+            self.sampler.start()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        self.elapsed_ms = round((time.perf_counter() - self.started) * 1000, 2)
+
+    def write(self):
+        # Writes the profile file; returns its path
+        os.makedirs(self.directory, exist_ok=True)
+        if self.profiler is not None:
+            path = os.path.join(self.directory, f"{self.name}.prof")
+            self.profiler.dump_stats(path)
+            return path
+        path = os.path.join(self.directory, f"{self.name}.collapsed")
+        with open(path, "w") as f:
+            for stack, count in sorted(self.sampler.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def summary(self, top=TOP_N):
+        summary = {"mode": self.mode, "name": self.name, "elapsed_ms": self.elapsed_ms}
+        shares = {category: 0.0 for category in CATEGORIES}
+        shares["other"] = 0.0
+        if self.profiler is not None:
+            # Self time per function; the categories split the total self time
+            import pstats
+            stats = pstats.Stats(self.profiler).stats
+            rows = []
+            for (filename, line, function), (_, calls, self_s, cumulative_s, _) in stats.items():
+                label = f"{function} ({short_path(filename)}:{line})" if line else function
+                shares[category_of([label])] += self_s
+                rows.append((self_s, cumulative_s, calls, label))
+            rows.sort(reverse=True)
+            summary["top"] = [{"function": label, "calls": calls, "self_ms": round(s * 1000, 3),
+                               "cumulative_ms": round(c * 1000, 3)} for s, c, calls, label in rows[:top]]
+            total = sum(shares.values())
+        else:
+            for stack, count in self.sampler.stacks.items():
+                shares[category_of(reversed(stack.split(";")))] += count
+            ranked = sorted(self.sampler.stacks.items(), key=lambda item: item[1], reverse=True)[:top]
+            summary["samples"] = self.sampler.samples
+            summary["top"] = [{"stack": stack, "samples": count} for stack, count in ranked]
+            total = self.sampler.samples
+        summary["shares"] = {category: round(value / total, 4) if total else 0.0 for category, value in shares.items()}
+        return summary
+
+
+def server_timing(stages):
+    # Server-Timing header value from StageTimer.stages
+    return ", ".join(f"{name};dur={ms:.2f}" for name, ms in stages.items())
+
+
+def run(mode, name, fn):
+    # Calls fn under a profile; returns (result, summary). The summary is
+    # logged as one JSON line with the file it was written to.
+    profile = Profile(mode, name)
+    profile.start()
+    try:
+        result = fn()
+    finally:
+        profile.stop()
+        try:
+            summary = dict(profile.summary(), file=profile.write())
+        except Exception as e:
+            summary = {"mode": mode, "name": name, "error": str(e)}
+        print("Profile:", json.dumps(summary))
+    return result, summary
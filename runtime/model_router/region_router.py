@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+
+from aws_clients import get_client
+from adaptive_router import ModelStats
+from bedrock_invoker import error_code
+
+# Bedrock error codes that mean "this region cannot take the request right
+# now" rather than "the request is wrong"; they move the call to the next region
+FAILOVER_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceQuotaExceededException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+# botocore connection failures happen before the model runs, so retrying elsewhere is safe
+FAILOVER_ERRORS = {"EndpointConnectionError", "ConnectTimeoutError"}
+
+DEFAULT_COOLDOWN_S = 30
+DEFAULT_PROBE_INTERVAL_S = 60
+
+
+def is_failover_error(exc):
+    return error_code(exc) in FAILOVER_CODES or type(exc).__name__ in FAILOVER_ERRORS
+
+
+class RegionRouter:
+    # Active-active Bedrock routing: requests go to the healthy region with the
+    # lowest EWMA latency, and a throttled region is skipped for `cooldown_s`
+    # while the same request is retried in the next region. Clients come from
+    # aws_clients, so each region's connection pool stays warm across
+    # invocations. With a probe, every region gets the same tiny request in the
+    # background every `probe_interval_s`; probe latency is the ranking signal
+    # because real calls vary with output length. Without one, the EWMA of real
+    # calls is used. regions=[None] means the function's own region only.
+    def __init__(self, regions=None, probe=None, cooldown_s=DEFAULT_COOLDOWN_S,
+                 probe_interval_s=DEFAULT_PROBE_INTERVAL_S, alpha=0.3, clock=time.monotonic):
+        self.regions = list(regions or [None])
+        self.probe = probe
+        self.cooldown_s = cooldown_s
+        self.probe_interval_s = probe_interval_s
+        self.alpha = alpha
+        self.clock = clock
+        self.stats = {}
+        self.probes = {}
+        self.cooldown_until = {}
+        self.probing = set()
+        self.counters = {"failovers": 0, "probes": 0, "probe_failures": 0}
+        self.lock = threading.Lock()
+
+    def configure(self, regions, cooldown_s=None, probe_interval_s=None):
+        with self.lock:
+            self.regions = list(regions or [None])
+            if cooldown_s is not None:
+                self.cooldown_s = cooldown_s
+            if probe_interval_s is not None:
+                self.probe_interval_s = probe_interval_s
+
+    def client(self, region):
+        return get_client("bedrock-runtime", region_name=region)
+
+    def record(self, region, latency_ms, ok=True, throttled=False, probe=False):
+        table = self.probes if probe else self.stats
+        with self.lock:
+            now = self.clock()
+            stats = table.get(region)
+            if stats is None:
+                stats = table[region] = ModelStats(self.alpha)
+            stats.record(latency_ms, ok, now)
+            if throttled:
+                self.cooldown_until[region] = now + self.cooldown_s
+
+    def _latency(self, region):
+        for table in (self.probes, self.stats):
+            stats = table.get(region)
+            if stats and stats.latency_ms is not None:
+                return stats.latency_ms
+        return float("inf")
+
+    def order(self):
+        # Regions to try, best first: healthy regions by latency (unmeasured
+        # ones after measured ones, in configured order), then cooling-down ones
+        now = self.clock()
+        ranked = []
+        with self.lock:
+            for position, region in enumerate(self.regions):
+                cooling = self.cooldown_until.get(region, 0) > now
+                ranked.append((cooling, self._latency(region), position, region))
+        ranked.sort()
+        return [region for _, _, _, region in ranked]
+
+    def call(self, fn):
+        # fn(client) -> result. Returns (result, region). Failover errors move
+        # on to the next region; anything else is raised immediately.
+        self.refresh()
+        last_error = None
+        for attempt, region in enumerate(self.order()):
+            if attempt:
+                with self.lock:
+                    self.counters["failovers"] += 1
+                print(f"Failing over to {region}: {last_error}")
+            start = time.perf_counter()
+            try:
+                result = fn(self.client(region))
+            except Exception as e:
+                # Request errors (validation, access) say nothing about the region
+                if not is_failover_error(e):
+                    raise
+                self.record(region, (time.perf_counter() - start) * 1000, ok=False, throttled=True)
+                last_error = e
+                continue
+            self.record(region, (time.perf_counter() - start) * 1000)
+            return result, region
+        raise last_error
+
+    def refresh(self):
+        # Starts a background probe for each region whose stats are stale
+        if self.probe is None or len(self.regions) < 2 or not self.probe_interval_s:
+            return
+        now = self.clock()
+        stale = []
+        with self.lock:
+            for region in self.regions:
+                stats = self.probes.get(region)
+                if region in self.probing or (stats and now - stats.updated_at < self.probe_interval_s):
+                    continue
+                self.probing.add(region)
+                stale.append(region)
+        for region in stale:
+            threading.Thread(target=self._probe, args=(region,), daemon=True).start()
+
+    def _probe(self, region):
+        start = time.perf_counter()
+        try:
+            self.probe(self.client(region))
+            self.record(region, (time.perf_counter() - start) * 1000, probe=True)
+            ok = True
+        except Exception as e:
+            print(f"Region probe failed for {region}: {e}")
+            self.record(region, (time.perf_counter() - start) * 1000, ok=False,
+                        throttled=is_failover_error(e), probe=True)
+            ok = False
+        with self.lock:
+            self.probing.discard(region)
+            self.counters["probes"] += 1
+            if not ok:
+                self.counters["probe_failures"] += 1
+
+    def snapshot(self):
+        now = self.clock()
+        with self.lock:
+            regions = {}
+            for region in self.regions:
+                calls = self.stats.get(region)
+                probes = self.probes.get(region)
+                regions[str(region)] = {
+                    "ewma_latency_ms": round(calls.latency_ms, 1) if calls and calls.latency_ms is not None else None,
+                    "probe_latency_ms": round(probes.latency_ms, 1) if probes and probes.latency_ms is not None else None,
+                    "error_rate": round(calls.error_rate, 3) if calls else None,
+                    "cooling_down": self.cooldown_until.get(region, 0) > now
+                }
+            return dict(self.counters, regions=regions)
+
+
+def make_probe(model_id):
+    # Health/latency probe: a one-token generation on a cheap model
+    from model_adapters import get_adapter
+    body = get_adapter(model_id).build_body("ping", 1)
+
+    def probe(client):
+        client.invoke_model(body=body, modelId=model_id, accept='application/json', contentType='application/json')
+    return probe
+
+
+def regions_from_env():
+    # BEDROCK_REGIONS="us-east-1,us-west-2" (preferred order); unset means the function's region only
+    names = [r.strip() for r in os.environ.get('BEDROCK_REGIONS', '').split(',') if r.strip()]
+    return names or [None]
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from aws_clients import get_client
+
+# Request-body fields that carry the prompt; everything else is a generation parameter
+PROMPT_FIELDS = ("prompt", "messages", "inputText")
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_prompt(prompt):
+    # Case, surrounding whitespace, runs of whitespace and trailing punctuation
+    # do not change the answer, so they should not change the cache key
+    return _WHITESPACE.sub(" ", prompt).strip().lower().rstrip("?.! ")
+
+def params_from_body(body):
+    # Generation parameters of a serialized Bedrock request body
+    data = json.loads(body) if isinstance(body, str) else dict(body)
+    return {k: v for k, v in data.items() if k not in PROMPT_FIELDS}
+
+def make_key(model_id, prompt, params=None):
+    raw = json.dumps([model_id, normalize_prompt(prompt), params or {}], sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    # In-process LRU with a per-entry TTL. Lives at module level so it survives
+    # warm Lambda invocations.
+    def __init__(self, max_entries=1024, ttl=300, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= self.clock():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = (value, self.clock() + (ttl or self.ttl))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class InMemoryBackend:
+    # Local stand-in for the shared backend (same interface as DynamoDBBackend)
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+        if item is None or item["expires_at"] <= self.clock():
+            return None
+        return item["value"]
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.items[key] = {"value": value, "expires_at": self.clock() + ttl}
+
+
+class DynamoDBBackend:
+    # Shared cache across Lambda containers. The table uses `cache_key` as
+    # partition key and `expires_at` as its TTL attribute. DynamoDB deletes
+    # expired items lazily, so expiry is also checked on read. The client is
+    # resolved on first use so importing the router stays cheap.
+    def __init__(self, table_name, client=None, clock=time.time):
+        self.table_name = table_name
+        self.client = client
+        self.clock = clock
+
+    def _client(self):
+        return self.client or get_client("dynamodb")
+
+    def get(self, key):
+        response = self._client().get_item(
+            TableName=self.table_name,
+            Key={"cache_key": {"S": key}},
+            ConsistentRead=False
+        )
+        item = response.get("Item")
+        if not item or float(item["expires_at"]["N"]) <= self.clock():
+            return None
+        return item["value"]["S"]
+
+    def set(self, key, value, ttl):
+        self._client().put_item(
+            TableName=self.table_name,
+            Item={
+                "cache_key": {"S": key},
+                "value": {"S": value},
+                "expires_at": {"N": str(int(self.clock() + ttl))}
+            }
+        )
+
+
+class ResponseCache:
+    # Two-tier cache: in-process LRU first, then the optional shared backend.
+    # Shared-backend errors are logged and treated as misses so the cache can
+    # never fail a request.
+    def __init__(self, local=None, shared=None, ttl=300):
+        self.local = local or LRUCache(ttl=ttl)
+        self.shared = shared
+        self.ttl = ttl
+        self.counters = {"hits": 0, "local_hits": 0, "shared_hits": 0, "misses": 0}
+        self.lock = threading.Lock()
+
+    def _count(self, *names):
+        with self.lock:
+            for name in names:
+                self.counters[name] += 1
+
+    def get(self, model_id, prompt, params=None):
+        key = make_key(model_id, prompt, params)
+        value = self.local.get(key)
+        if value is not None:
+            self._count("hits", "local_hits")
+            return value
+
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception as e:
+                print(f"Response cache read failed: {e}")
+                value = None
+            if value is not None:
+                self.local.set(key, value, self.ttl)
+                self._count("hits", "shared_hits")
+                return value
+
+        self._count("misses")
+        return None
+
+    def set(self, model_id, prompt, value, params=None):
+        key = make_key(model_id, prompt, params)
+        self.local.set(key, value, self.ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, self.ttl)
+            except Exception as e:
+                print(f"Response cache write failed: {e}")
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["local_entries"] = len(self.local)
+        return stats
+
+
+def from_env():
+    # RESPONSE_CACHE_ENABLED=false turns caching off; RESPONSE_CACHE_TABLE adds
+    # the shared DynamoDB tier on top of the in-process LRU
+    if os.environ.get("RESPONSE_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    ttl = int(os.environ.get("RESPONSE_CACHE_TTL", "300"))
+    max_entries = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+    table_name = os.environ.get("RESPONSE_CACHE_TABLE")
+    shared = DynamoDBBackend(table_name) if table_name else None
+    return ResponseCache(local=LRUCache(max_entries=max_entries, ttl=ttl), shared=shared, ttl=ttl)
@@ -0,0 +1,169 @@
+import json
+import re
+import threading
+import zlib
+
+# numpy is imported on first use (it is slow to import and comes from a
+# Lambda layer); without it the semantic cache stays off
+np = None
+
+DEFAULT_EMBEDDING_MODEL = "amazon.titan-embed-text-v2:0"
+DEFAULT_THRESHOLD = 0.95
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+def available():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+        np = numpy
+    return True
+
+
+class HashingEmbedder:
+    # Deterministic local embedder: words, word bigrams and character trigrams
+    # hashed into a fixed-size signed vector. No network calls, so it backs
+    # tests and offline runs.
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def _features(self, text):
+        words = _TOKEN.findall(text.lower())
+        features = list(words)
+        features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class BedrockEmbedder:
+    # Titan text embeddings, requested already normalized. invoke(model_id,
+    # body) makes the call, so the router can run it through its invoker and
+    # region router like any other Bedrock call.
+    def __init__(self, invoke, model_id=DEFAULT_EMBEDDING_MODEL, dim=256):
+        self.invoke = invoke
+        self.model_id = model_id
+        self.dim = dim
+
+    def embed(self, text):
+        response = self.invoke(self.model_id, json.dumps({"inputText": text, "dimensions": self.dim, "normalize": True}))
+        embedding = json.loads(response.get('body').read())['embedding']
+        return np.asarray(embedding, dtype=np.float32)
+
+
+class VectorIndex:
+    # Brute-force cosine index over one contiguous float32 matrix. Vectors are
+    # stored unit-length, so similarity is a single matrix-vector product.
+    # When full, the oldest slot is overwritten (ring buffer), so memory stays
+    # bounded at capacity x dim.
+    def __init__(self, dim, capacity=4096):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.values = [None] * capacity
+        self.capacity = capacity
+        self.size = 0
+        self.next_slot = 0
+
+    def add(self, vector, value):
+        slot = self.next_slot
+        self.vectors[slot] = vector
+        self.values[slot] = value
+        self.next_slot = (slot + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def search(self, vector):
+        # Returns (similarity, value) of the nearest entry, or (None, None) when empty
+        if not self.size:
+            return None, None
+        scores = self.vectors[:self.size] @ vector
+        best = int(np.argmax(scores))
+        return float(scores[best]), self.values[best]
+
+
+def index_key(model_id, template=None, max_tokens=None):
+    # Answers are only reused for the model, prompt template (system prefix
+    # included) and output limit that produced them
+    return (model_id, template, max_tokens)
+
+
+class SemanticCache:
+    # Nearest-neighbour answer cache, one index per index_key(). Embedding
+    # errors are logged and treated as misses so the cache can never fail a
+    # request.
+    def __init__(self, embedder, capacity=4096, default_threshold=DEFAULT_THRESHOLD, thresholds=None):
+        self.embedder = embedder
+        self.capacity = capacity
+        self.default_threshold = default_threshold
+        self.thresholds = thresholds or {}
+        self.indexes = {}
+        self.counters = {"hits": 0, "misses": 0, "errors": 0}
+        self.lock = threading.Lock()
+
+    def threshold_for(self, req_type):
+        return self.thresholds.get(req_type, self.default_threshold)
+
+    def lookup(self, key, question, req_type):
+        # Returns (answer, similarity, vector); answer is None on a miss.
+        # The vector is handed back so add() does not embed the question twice;
+        # it is None when embedding failed.
+        try:
+            vector = self.embedder.embed(question)
+        except Exception as e:
+            print(f"Semantic cache embedding failed: {e}")
+            with self.lock:
+                self.counters["errors"] += 1
+                self.counters["misses"] += 1
+            return None, None, None
+        with self.lock:
+            index = self.indexes.get(key)
+            score, answer = index.search(vector) if index else (None, None)
+            if score is not None and score >= self.threshold_for(req_type):
+                self.counters["hits"] += 1
+                return answer, score, vector
+            self.counters["misses"] += 1
+        return None, score, vector
+
+    def add(self, key, vector, answer):
+        if vector is None:
+            return # The lookup could not embed the question
+        with self.lock:
+            index = self.indexes.get(key)
+            if index is None:
+                index = self.indexes[key] = VectorIndex(len(vector), self.capacity)
+            index.add(vector, answer)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["entries"] = sum(index.size for index in self.indexes.values())
+        return stats
+
+
+def from_settings(settings, invoke):
+    # Builds the cache from the AppConfig `semantic_cache` section; invoke is
+    # the Bedrock call BedrockEmbedder uses
+    if settings.get("embedder") == "hashing":
+        embedder = HashingEmbedder(dim=settings.get("dimensions", 512))
+    else:
+        embedder = BedrockEmbedder(
+            invoke,
+            model_id=settings.get("embedding_model", DEFAULT_EMBEDDING_MODEL),
+            dim=settings.get("dimensions", 256)
+        )
+    return SemanticCache(
+        embedder,
+        capacity=settings.get("capacity", 4096),
+        default_threshold=settings.get("default_threshold", DEFAULT_THRESHOLD),
+        thresholds=settings.get("thresholds", {})
+    )
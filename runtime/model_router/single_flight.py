@@ -0,0 +1,280 @@
+import os
+import threading
+import time
+import uuid
+
+from aws_clients import get_client
+from bedrock_invoker import error_code
+
+# Request coalescing: concurrent calls with the same key share one upstream
+# call and all get its result (or its exception).
+# - in-process: the first caller is the leader, later ones wait on its Event
+# - across containers (optional store): the leader takes a lease on the key
+#   and publishes the result; callers in other containers that find the lease
+#   held poll for the result. A lease that expires or is released after a
+#   failure is taken over, so a crashed leader only costs one lease period.
+# Waiting never outlives the request's deadline; after SINGLE_FLIGHT_WAIT_MS
+# a caller gives up on the shared call and makes its own.
+
+ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+WAIT_MS = float(os.environ.get('SINGLE_FLIGHT_WAIT_MS', '30000'))
+POLL_MS = float(os.environ.get('SINGLE_FLIGHT_POLL_MS', '100'))
+LEASE_S = int(os.environ.get('SINGLE_FLIGHT_LEASE_S', '60'))
+RESULT_TTL_S = int(os.environ.get('SINGLE_FLIGHT_RESULT_TTL_S', '30'))
+
+# Store items share the response cache table under their own key prefix
+KEY_PREFIX = "flight#"
+
+
+class InMemoryStore:
+    # Local stand-in for the shared store (same interface as DynamoDBStore);
+    # share one instance between SingleFlight objects to simulate containers
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key, owner, lease_s):
+        # True if the caller now holds the lease on key
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None and item["lease_expires"] > self.clock():
+                return False
+            self.items[key] = {"owner": owner, "lease_expires": self.clock() + lease_s}
+            return True
+
+    def get(self, key):
+        # {"owner", "lease_expires"[, "result"]} or None
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None and item.get("expires_at", float("inf")) <= self.clock():
+                return None
+            return dict(item) if item is not None else None
+
+    def publish(self, key, owner, result, ttl):
+        # Stores the result and ends the lease so the next miss starts a new flight
+        with self.lock:
+            self.items[key] = {"owner": owner, "lease_expires": 0, "result": result,
+                               "expires_at": self.clock() + ttl}
+
+    def release(self, key, owner):
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None and item["owner"] == owner and "result" not in item:
+                del self.items[key]
+
+
+class DynamoDBStore:
+    # Leases and results as items of a DynamoDB table keyed on `cache_key`
+    # (the response cache table). Leases are conditional puts; `expires_at`
+    # is the table's TTL attribute.
+    def __init__(self, table_name, client=None, clock=time.time):
+        self.table_name = table_name
+        self.client = client
+        self.clock = clock
+
+    def _client(self):
+        return self.client or get_client("dynamodb")
+
+    def _key(self, key):
+        return {"cache_key": {"S": KEY_PREFIX + key}}
+
+    def acquire(self, key, owner, lease_s):
+        now = self.clock()
+        try:
+            self._client().put_item(
+                TableName=self.table_name,
+                Item=dict(self._key(key), owner={"S": owner},
+                          lease_expires={"N": str(now + lease_s)},
+                          expires_at={"N": str(int(now + lease_s + RESULT_TTL_S))}),
+                ConditionExpression="attribute_not_exists(cache_key) OR lease_expires < :now",
+                ExpressionAttributeValues={":now": {"N": str(now)}}
+            )
+        except Exception as e:
+            if error_code(e) == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    def get(self, key):
+        response = self._client().get_item(TableName=self.table_name, Key=self._key(key), ConsistentRead=True)
+        item = response.get("Item")
+        if not item or float(item["expires_at"]["N"]) <= self.clock():
+            return None
+        result = {"owner": item["owner"]["S"], "lease_expires": float(item["lease_expires"]["N"])}
+        if "result" in item:
+            result["result"] = item["result"]["S"]
+        return result
+
+    def publish(self, key, owner, result, ttl):
+        self._client().put_item(
+            TableName=self.table_name,
+            Item=dict(self._key(key), owner={"S": owner}, lease_expires={"N": "0"},
+                      result={"S": result}, expires_at={"N": str(int(self.clock() + ttl))})
+        )
+
+    def release(self, key, owner):
+        try:
+            self._client().delete_item(
+                TableName=self.table_name,
+                Key=self._key(key),
+                ConditionExpression="#o = :owner AND attribute_not_exists(#r)",
+                ExpressionAttributeNames={"#o": "owner", "#r": "result"},
+                ExpressionAttributeValues={":owner": {"S": owner}}
+            )
+        except Exception as e:
+            if error_code(e) != "ConditionalCheckFailedException":
+                raise
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Results must be strings when a store is configured (they are stored as-is).
+    # Store errors are logged and fall back to in-process coalescing only.
+    def __init__(self, store=None, wait_ms=WAIT_MS, poll_ms=POLL_MS, lease_s=LEASE_S,
+                 result_ttl_s=RESULT_TTL_S, clock=time.monotonic, sleep=time.sleep):
+        self.store = store
+        self.wait_ms = wait_ms
+        self.poll_ms = poll_ms
+        self.lease_s = lease_s
+        self.result_ttl_s = result_ttl_s
+        self.clock = clock
+        self.sleep = sleep
+        self._owner = None
+        self.flights = {}
+        self.counters = {"calls": 0, "upstream": 0, "local_collapsed": 0, "shared_collapsed": 0,
+                         "takeovers": 0, "wait_timeouts": 0, "store_errors": 0}
+        self.lock = threading.Lock()
+
+    @property
+    def owner(self):
+        # Identifies this container's leases. Generated on first use, not at
+        # import, so SnapStart containers restored from one snapshot differ.
+        if self._owner is None:
+            with self.lock:
+                if self._owner is None:
+                    self._owner = uuid.uuid4().hex
+        return self._owner
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _wait_s(self, deadline):
+        wait_s = self.wait_ms / 1000.0
+        if deadline is not None:
+            wait_s = min(wait_s, deadline.remaining())
+        return wait_s
+
+    def do(self, key, fn, deadline=None):
+        # Returns (result, collapsed); collapsed is True when another call's
+        # upstream result was reused
+        with self.lock:
+            self.counters["calls"] += 1
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+        if not leader:
+            if not flight.done.wait(self._wait_s(deadline)):
+                # Leader is too slow for this request's budget; call on our own
+                self._count("wait_timeouts")
+                return self._call(fn), False
+            self._count("local_collapsed")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result, collapsed = self._lead(key, fn, deadline)
+            return flight.result, collapsed
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+    def _call(self, fn):
+        self._count("upstream")
+        return fn()
+
+    def _lead(self, key, fn, deadline):
+        # Leader within this container: coordinate with other containers
+        if self.store is None:
+            return self._call(fn), False
+        try:
+            acquired = self.store.acquire(key, self.owner, self.lease_s)
+        except Exception as e:
+            print(f"Single-flight store failed: {e}")
+            self._count("store_errors")
+            return self._call(fn), False
+        if not acquired:
+            result = self._await_shared(key, deadline)
+            if result is not None:
+                self._count("shared_collapsed")
+                return result, True
+        return self._run_and_publish(key, fn), False
+
+    def _await_shared(self, key, deadline):
+        # Polls for another container's result. None means: no result is
+        # coming in time (or this call now holds the lease), call upstream.
+        end = self.clock() + self._wait_s(deadline)
+        while True:
+            try:
+                item = self.store.get(key)
+                if item is not None and "result" in item:
+                    return item["result"]
+                if item is None or item["lease_expires"] <= self.store.clock():
+                    # Leader failed or vanished; take the lease over
+                    if self.store.acquire(key, self.owner, self.lease_s):
+                        self._count("takeovers")
+                        return None
+            except Exception as e:
+                print(f"Single-flight store failed: {e}")
+                self._count("store_errors")
+                return None
+            if self.clock() + self.poll_ms / 1000.0 > end:
+                self._count("wait_timeouts")
+                return None
+            self.sleep(self.poll_ms / 1000.0)
+
+    def _run_and_publish(self, key, fn):
+        try:
+            result = self._call(fn)
+        except Exception:
+            self._store_op(self.store.release, key, self.owner)
+            raise
+        self._store_op(self.store.publish, key, self.owner, result, self.result_ttl_s)
+        return result
+
+    def _store_op(self, op, *args):
+        try:
+            op(*args)
+        except Exception as e:
+            print(f"Single-flight store failed: {e}")
+            self._count("store_errors")
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["in_flight"] = len(self.flights)
+        collapsed = stats["local_collapsed"] + stats["shared_collapsed"]
+        stats["collapse_ratio"] = round(collapsed / stats["calls"], 4) if stats["calls"] else 0.0
+        return stats
+
+
+def from_env():
+    # SINGLE_FLIGHT_ENABLED=false turns coalescing off; SINGLE_FLIGHT_TABLE
+    # adds cross-container coalescing through DynamoDB
+    if not ENABLED:
+        return None
+    table_name = os.environ.get('SINGLE_FLIGHT_TABLE')
+    return SingleFlight(store=DynamoDBStore(table_name) if table_name else None)
@@ -0,0 +1,59 @@
+import os
+import threading
+
+# Lazily constructed, process-wide boto3 clients. Nothing AWS-related is
+# imported or built at module import, so a cold start only pays for the
+# clients a request actually uses. Clients share one tuned botocore Config:
+# TCP keep-alive, a connection pool sized for the router's thread pools and
+# adaptive client-side retries. bedrock-runtime is the exception: its
+# throttling retries live in bedrock_invoker, so botocore makes one attempt
+# and the two retry loops do not multiply.
+
+MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '32'))
+MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '3'))
+CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', '2'))
+READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT', '60'))
+
+# Per-service retry overrides
+SERVICE_RETRIES = {
+    'bedrock-runtime': {'mode': 'standard', 'total_max_attempts': 1}
+}
+
+_CLIENTS = {}
+_LOCK = threading.Lock()
+_CONFIGS = {}
+
+
+def client_config(service_name=None):
+    config = _CONFIGS.get(service_name)
+    if config is None:
+        from botocore.config import Config
+        config = Config(
+            tcp_keepalive=True,
+            max_pool_connections=MAX_POOL_CONNECTIONS,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            retries=SERVICE_RETRIES.get(service_name, {'mode': 'adaptive', 'max_attempts': MAX_ATTEMPTS})
+        )
+        _CONFIGS[service_name] = config
+    return config
+
+
+def get_client(service_name, region_name=None):
+    key = (service_name, region_name)
+    client = _CLIENTS.get(key)
+    if client is not None:
+        return client
+    with _LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            import boto3
+            client = boto3.client(service_name, region_name=region_name, config=client_config(service_name))
+            _CLIENTS[key] = client
+    return client
+
+
+def set_client(service_name, client, region_name=None):
+    # Injects a client (e.g. a stub in tests or local benchmarks)
+    with _LOCK:
+        _CLIENTS[(service_name, region_name)] = client
@@ -0,0 +1,177 @@
+import os
+import random
+import threading
+import time
+
+# Shared Bedrock invocation layer:
+# - an AIMD concurrency limit per model: +1 slot per limit's worth of
+#   successes, halved on throttling, so bursts queue briefly instead of
+#   failing over to a weaker model
+# - retries with full-jitter exponential backoff, for throttling and
+#   model-not-ready only; every other error is raised on the first attempt
+# - a deadline taken from the Lambda context, so waiting and backoff never
+#   outlive the invocation
+
+RETRYABLE_CODES = {"ThrottlingException", "ModelNotReadyException"}
+THROTTLE_CODES = {"ThrottlingException"}
+
+MAX_RETRIES = int(os.environ.get('BEDROCK_MAX_RETRIES', '3'))
+BACKOFF_BASE_MS = float(os.environ.get('BEDROCK_BACKOFF_BASE_MS', '100'))
+BACKOFF_MAX_MS = float(os.environ.get('BEDROCK_BACKOFF_MAX_MS', '2000'))
+INITIAL_CONCURRENCY = int(os.environ.get('BEDROCK_INITIAL_CONCURRENCY', '8'))
+MAX_CONCURRENCY = int(os.environ.get('BEDROCK_MAX_CONCURRENCY', '64'))
+# Time left for building the response (and the in-process fallback) after the last call
+DEADLINE_RESERVE_MS = float(os.environ.get('DEADLINE_RESERVE_MS', '500'))
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def error_code(exc):
+    # botocore ClientErrors carry the code; other exceptions (or a None response) have none
+    response = getattr(exc, "response", None) or {}
+    return (response.get("Error") or {}).get("Code")
+
+
+def is_retryable(exc):
+    return error_code(exc) in RETRYABLE_CODES
+
+
+class Deadline:
+    # Absolute end of the time budget for one request
+    def __init__(self, budget_ms, clock=time.monotonic):
+        self.clock = clock
+        self.expires_at = clock() + budget_ms / 1000.0
+
+    @classmethod
+    def from_context(cls, context, reserve_ms=DEADLINE_RESERVE_MS):
+        # None when there is no Lambda context (local runs, tests)
+        if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+            return None
+        return cls(max(0.0, context.get_remaining_time_in_millis() - reserve_ms))
+
+    def remaining(self):
+        return max(0.0, self.expires_at - self.clock())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+class AIMDLimiter:
+    # Adaptive concurrency limit for one model
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=1, maximum=MAX_CONCURRENCY,
+                 backoff_ratio=0.5, clock=time.monotonic):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff_ratio = backoff_ratio
+        self.clock = clock
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.counters = {"throttles": 0, "decreases": 0, "waits": 0}
+        self.cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        # Returns False if no slot freed up within `timeout` seconds
+        with self.cond:
+            if self.in_flight >= int(self.limit):
+                self.counters["waits"] += 1
+                end = None if timeout is None else self.clock() + timeout
+                while self.in_flight >= int(self.limit):
+                    wait = None if end is None else end - self.clock()
+                    if wait is not None and wait <= 0:
+                        return False
+                    self.cond.wait(wait)
+            self.in_flight += 1
+            return True
+
+    def release(self, throttled=False, succeeded=True):
+        # Only successes grow the limit; other errors free the slot unchanged
+        with self.cond:
+            self.in_flight -= 1
+            if throttled:
+                self.counters["throttles"] += 1
+                # One decrease per burst: throttles from calls already in
+                # flight when the limit was cut do not cut it again
+                now = self.clock()
+                if now - self.last_decrease >= 1.0:
+                    self.limit = max(self.minimum, self.limit * self.backoff_ratio)
+                    self.last_decrease = now
+                    self.counters["decreases"] += 1
+            elif succeeded:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self.cond.notify_all()
+
+    def snapshot(self):
+        with self.cond:
+            return dict(self.counters, limit=round(self.limit, 2), in_flight=self.in_flight)
+
+
+class BedrockInvoker:
+    def __init__(self, max_retries=MAX_RETRIES, base_ms=BACKOFF_BASE_MS, max_backoff_ms=BACKOFF_MAX_MS,
+                 limiter_factory=AIMDLimiter, sleep=time.sleep, rng=random.random):
+        self.max_retries = max_retries
+        self.base_ms = base_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.limiter_factory = limiter_factory
+        self.sleep = sleep
+        self.rng = rng
+        self.limiters = {}
+        self.counters = {"calls": 0, "retries": 0, "deadline_exceeded": 0}
+        self.lock = threading.Lock()
+
+    def limiter(self, model_id):
+        with self.lock:
+            limiter = self.limiters.get(model_id)
+            if limiter is None:
+                limiter = self.limiters[model_id] = self.limiter_factory()
+            return limiter
+
+    def backoff_ms(self, attempt):
+        # Full jitter: uniform in [0, min(cap, base * 2^attempt)]
+        return self.rng() * min(self.max_backoff_ms, self.base_ms * (2 ** attempt))
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _expire(self, model_id):
+        self._count("deadline_exceeded")
+        return DeadlineExceeded(f"Deadline exceeded calling {model_id}")
+
+    def call(self, model_id, fn, deadline=None):
+        # Runs fn() under the model's concurrency limit, retrying throttling
+        # and model-not-ready errors until the retries or the deadline run out
+        limiter = self.limiter(model_id)
+        self._count("calls")
+        attempt = 0
+        while True:
+            if deadline is not None and deadline.expired():
+                raise self._expire(model_id)
+            if not limiter.acquire(deadline.remaining() if deadline is not None else None):
+                raise self._expire(model_id)
+            try:
+                result = fn()
+            except Exception as e:
+                retryable = is_retryable(e)
+                limiter.release(throttled=error_code(e) in THROTTLE_CODES, succeeded=False)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_ms(attempt) / 1000.0
+                if deadline is not None and delay >= deadline.remaining():
+                    raise
+                print(f"{error_code(e)} from {model_id}, retry {attempt + 1} in {delay * 1000:.0f} ms")
+                self._count("retries")
+                self.sleep(delay)
+                attempt += 1
+                continue
+            limiter.release()
+            return result
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.counters)
+            limiters = dict(self.limiters)
+        stats["models"] = {model_id: limiter.snapshot() for model_id, limiter in limiters.items()}
+        return stats
@@ -0,0 +1,337 @@
+import os
+import re
+import threading
+import time
+
+# Compliance scanner for model answers, run on every router response:
+# - PII: card numbers (13-19 digits, Luhn-checked), SSNs, and account,
+#   routing or IBAN numbers that follow an account keyword
+# - phrase rules by category (refusals, leaked errors, advice the bank must
+#   not give), matched case-insensitively on word boundaries
+# A scan is two passes of compiled regexes over the lowercased text: every
+# phrase and account keyword folded into one trie-shaped alternation, and
+# one pattern for digit runs. Both start with a literal or digit, which lets
+# the regex engine skip non-candidate positions in C, so the cost per KB
+# does not grow with the number of phrases. Rules come from the AppConfig
+# `compliance` section and are compiled once per config document:
+#
+#   "compliance": {
+#     "action": "flag",                      # or "redact" to mask PII spans
+#     "pii": ["card", "ssn", "account"],
+#     "phrases": {"advice": ["guaranteed returns", ...], ...}
+#   }
+
+ENABLED = os.environ.get('COMPLIANCE_ENABLED', 'true').lower() == 'true'
+
+PII_KINDS = ("card", "ssn", "account")
+
+DEFAULT_PHRASES = {
+    "refusal": [
+        "as an ai language model",
+        "i'm sorry, but i can't",
+        "i am unable to provide",
+        "i cannot assist with that"
+    ],
+    "error": [
+        "internal server error",
+        "an error occurred while",
+        "traceback (most recent call last)",
+        "something went wrong on our end"
+    ],
+    "advice": [
+        "guaranteed returns",
+        "guaranteed return",
+        "risk-free investment",
+        "you cannot lose money",
+        "insider information"
+    ]
+}
+
+ACCOUNT_KEYWORDS = ("account", "acct", "a/c", "routing", "iban")
+_ACCOUNT = "\0account" # Marks account keywords among the trie's phrases
+
+# Runs of 9-19 digits with single space/dash separators (SSNs and cards)
+NUMBER_PATTERN = re.compile(r"\d(?:[ -]?\d){8,18}")
+SSN_PATTERN = re.compile(r"(?!000|666|9\d\d)\d{3}(?P<sep>[- ])(?!00)\d{2}(?P=sep)(?!0000)\d{4}")
+# Applied right after an account keyword
+ACCOUNT_NUMBER_PATTERN = re.compile(
+    r"(?:\s+(?:number|no\.?|num))?\s*[:#]?\s*"
+    r"(?P<number>\d[\d -]{4,20}\d|[a-z]{2}\d{2}(?: ?[a-z0-9]{4}){2,7}(?: ?[a-z0-9]{1,3})?)",
+    re.IGNORECASE
+)
+_SEPARATORS = re.compile(r"[ -]")
+_WHITESPACE = re.compile(r"\s+")
+
+# Longest text a single finding can span; the stream scanner holds back this
+# much so a match split across chunks is found once the rest arrives
+MAX_MATCH_CHARS = 64
+STREAM_BATCH_CHARS = 256
+
+
+def luhn_valid(digits):
+    total = 0
+    for i, ch in enumerate(reversed(digits)):
+        d = ord(ch) - 48
+        if i % 2:
+            d *= 2
+            if d > 9:
+                d -= 9
+        total += d
+    return total % 10 == 0
+
+
+def normalize_phrase(text):
+    return _WHITESPACE.sub(" ", text.lower()).replace("’", "'")
+
+
+def trie_pattern(phrases):
+    # One alternation with shared prefixes factored out, so each position is
+    # tested against one branch per distinct next character, not per phrase
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def emit(node):
+        branches = []
+        for ch in sorted(k for k in node if k):
+            if ch == " ":
+                head = r"\s+"
+            elif ch == "'":
+                head = "['’]"
+            else:
+                head = re.escape(ch)
+            branches.append(head + emit(node[ch]))
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(trie)
+
+
+def word_bounded(text, start, end):
+    return ((start == 0 or not text[start - 1].isalnum() or not text[start].isalnum())
+            and (end == len(text) or not text[end].isalnum() or not text[end - 1].isalnum()))
+
+
+def summarize(findings):
+    counts = {}
+    for kind, _, _ in findings:
+        counts[kind] = counts.get(kind, 0) + 1
+    return counts
+
+
+def verdict(findings):
+    return "FLAGGED" if findings else "PASS"
+
+
+class Scanner:
+    def __init__(self, phrases=None, pii=PII_KINDS, action="flag"):
+        self.action = action
+        self.pii = set(pii)
+        self.categories = {}
+        phrases = DEFAULT_PHRASES if phrases is None else phrases
+        for category, items in phrases.items():
+            for phrase in items:
+                self.categories[normalize_phrase(phrase)] = category
+        if "account" in self.pii:
+            for keyword in ACCOUNT_KEYWORDS:
+                self.categories.setdefault(keyword, _ACCOUNT)
+        self.keywords = None
+        self.keywords_ignorecase = None
+        if self.categories:
+            pattern = trie_pattern(self.categories)
+            self.keywords = re.compile(pattern)
+            self.keywords_ignorecase = re.compile(pattern, re.IGNORECASE)
+        self.counters = {"scans": 0, "bytes": 0, "flagged": 0, "findings": 0, "scan_ms": 0.0}
+        self.lock = threading.Lock()
+
+    def _number_kind(self, text, start, end):
+        # "ssn", "card" or None for a digit run at text[start:end]
+        if start and (text[start - 1].isdigit() or text[start - 1] == "-"):
+            return None
+        if end < len(text) and (text[end].isdigit() or text[end] == "-"):
+            return None
+        run = text[start:end]
+        if "ssn" in self.pii and len(run) == 11 and SSN_PATTERN.fullmatch(run):
+            return "ssn"
+        if "card" in self.pii and run[0] in "3456":
+            digits = _SEPARATORS.sub("", run)
+            if 13 <= len(digits) <= 19 and luhn_valid(digits):
+                return "card"
+        return None
+
+    def _findings(self, text, offset=0, limit=None):
+        # (kind, start, end) per finding, in text order. With `limit` set only
+        # matches ending before it are returned: text after it could still
+        # extend them.
+        lowered = text.lower()
+        keywords = self.keywords
+        if len(lowered) != len(text):
+            # A few non-ASCII letters change length when lowercased
+            lowered, keywords = text, self.keywords_ignorecase
+        if limit is None:
+            limit = len(text) + 1
+        found = []
+        if keywords is not None:
+            for m in keywords.finditer(lowered):
+                start, end = m.span()
+                if end >= limit:
+                    break
+                if not word_bounded(lowered, start, end):
+                    continue
+                category = self.categories.get(normalize_phrase(m.group()))
+                if category != _ACCOUNT:
+                    found.append((start, 1, category, end))
+                    continue
+                number = ACCOUNT_NUMBER_PATTERN.match(lowered, end)
+                if number is None:
+                    continue
+                n_start, n_end = number.span("number")
+                if n_end >= limit or (n_end < len(lowered) and (lowered[n_end].isalnum() or lowered[n_end] == "-")):
+                    continue
+                found.append((n_start, 0, "account", n_end))
+        if self.pii & {"card", "ssn"}:
+            for m in NUMBER_PATTERN.finditer(lowered):
+                start, end = m.span()
+                if end >= limit:
+                    break
+                kind = self._number_kind(lowered, start, end)
+                if kind:
+                    found.append((start, 1, kind, end))
+        # Overlaps keep the earliest match; an account number wins over the same digits as a card
+        findings = []
+        last_end = 0
+        for start, _, kind, end in sorted(found):
+            if start < last_end:
+                continue
+            findings.append((kind, offset + start, offset + end))
+            last_end = end
+        return findings
+
+    def _count(self, nbytes, findings, elapsed_ms):
+        with self.lock:
+            self.counters["scans"] += 1
+            self.counters["bytes"] += nbytes
+            self.counters["findings"] += len(findings)
+            self.counters["flagged"] += 1 if findings else 0
+            self.counters["scan_ms"] += elapsed_ms
+
+    def scan(self, text):
+        text = text or ""
+        start = time.perf_counter()
+        findings = self._findings(text)
+        self._count(len(text), findings, (time.perf_counter() - start) * 1000)
+        return findings
+
+    def redact(self, text, findings):
+        # Masks PII spans; phrase findings are reported, not rewritten
+        parts = []
+        last = 0
+        for kind, start, end in findings:
+            if kind not in PII_KINDS:
+                continue
+            parts.append(text[last:start])
+            parts.append(f"[REDACTED {kind.upper()}]")
+            last = end
+        parts.append(text[last:])
+        return "".join(parts)
+
+    def check(self, text):
+        # Returns (text, findings); text is redacted when the action says so
+        findings = self.scan(text)
+        if findings and self.action == "redact":
+            text = self.redact(text, findings)
+        return text, findings
+
+    def stream(self):
+        return StreamScanner(self)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["scan_ms"] = round(stats["scan_ms"], 3)
+        return stats
+
+
+class StreamScanner:
+    # Scans a response as its chunks arrive. Text is scanned in batches of
+    # `batch_chars` (a rescan per small chunk would cost more than the whole
+    # one-shot scan); findings ending in the last
+    # MAX_MATCH_CHARS are held back until more text (or finish()) settles
+    # them, and that much context before them is kept for the rescan.
+    def __init__(self, scanner, window=MAX_MATCH_CHARS, batch_chars=STREAM_BATCH_CHARS):
+        self.scanner = scanner
+        self.window = window
+        self.batch_chars = batch_chars
+        self.buffer = ""
+        self.offset = 0 # Position of buffer[0] in the whole response
+        self.scanned = 0 # Buffer length at the last scan
+        self.reported_until = 0
+        self.findings = []
+        self.nbytes = 0
+        self.elapsed_ms = 0.0
+
+    def _scan(self, limit):
+        start = time.perf_counter()
+        new = []
+        for kind, s, e in self.scanner._findings(self.buffer, self.offset, limit):
+            if s >= self.reported_until:
+                new.append((kind, s, e))
+                self.reported_until = e
+        self.findings.extend(new)
+        self.scanned = len(self.buffer)
+        self.elapsed_ms += (time.perf_counter() - start) * 1000
+        return new
+
+    def feed(self, chunk):
+        # Findings completed by this chunk (usually none)
+        self.nbytes += len(chunk)
+        self.buffer += chunk
+        if len(self.buffer) - self.scanned < self.batch_chars:
+            return []
+        settled = len(self.buffer) - self.window
+        new = self._scan(settled)
+        # Keep one window of context before the unsettled tail, cut at
+        # whitespace so the kept text never starts mid-number or mid-word
+        cut = settled - self.window
+        if cut > 0:
+            space = self.buffer.find(" ", cut, settled)
+            cut = space if space != -1 else cut
+            self.buffer = self.buffer[cut:]
+            self.offset += cut
+            self.scanned -= cut
+        return new
+
+    def finish(self):
+        new = self._scan(None)
+        self.scanner._count(self.nbytes, self.findings, self.elapsed_ms)
+        return new
+
+
+DEFAULT = Scanner()
+
+# (section, compiled) for the config document currently in use
+_COMPILED = (None, DEFAULT)
+_LOCK = threading.Lock()
+
+
+def scanner_for(config):
+    global _COMPILED
+    section = config.get("compliance")
+    if not section:
+        return DEFAULT
+    source, compiled = _COMPILED
+    if source is section:
+        return compiled
+    with _LOCK:
+        if _COMPILED[0] is not section:
+            _COMPILED = (section, Scanner(
+                phrases=section.get("phrases"),
+                pii=section.get("pii", PII_KINDS),
+                action=section.get("action", "flag")
+            ))
+        return _COMPILED[1]
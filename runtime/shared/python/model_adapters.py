@@ -0,0 +1,261 @@
+import json
+
+import token_budget
+
+# One adapter per Bedrock model family: request body construction, response
+# parsing and stream-chunk decoding. The router, the workflow functions and the
+# benchmark all go through this module, so they send identical requests.
+
+DEFAULT_MAX_TOKENS = token_budget.DEFAULT_MAX_OUTPUT_TOKENS
+
+# Cross-region inference profile prefixes, e.g. "us.anthropic.claude-3-..."
+REGION_PREFIXES = ("us.", "eu.", "apac.")
+
+# Claude models with Bedrock prompt caching; others reject cache_control
+PROMPT_CACHE_MODELS = (
+    "anthropic.claude-3-5-haiku",
+    "anthropic.claude-3-7-sonnet",
+    "anthropic.claude-sonnet-4",
+    "anthropic.claude-opus-4"
+)
+# Prefixes shorter than this are not cached by Bedrock, so they get no marker
+MIN_CACHEABLE_TOKENS = 1024
+
+
+def base_model_id(model_id):
+    for region in REGION_PREFIXES:
+        if model_id.startswith(region):
+            return model_id[len(region):]
+    return model_id
+
+
+def supports_prompt_cache(model_id):
+    return base_model_id(model_id).startswith(PROMPT_CACHE_MODELS)
+
+
+def estimate_tokens(text, family=None):
+    # Local estimate for responses that do not report token counts
+    return token_budget.estimate_tokens(text, family)
+
+
+class PromptTemplate:
+    # Precompiled "{prompt}" template: split once into a prefix and a suffix so
+    # formatting is plain concatenation (and braces in user text are harmless)
+    def __init__(self, template):
+        self.prefix, _, self.suffix = template.partition("{prompt}")
+
+    def render(self, prompt):
+        return self.prefix + prompt + self.suffix
+
+
+class ModelAdapter:
+    family = None
+    template = PromptTemplate("{prompt}")
+    params = {}
+
+    def build_request(self, prompt, max_tokens=None, system=None, cache_prefix=False):
+        # system: shared instructions sent ahead of the prompt. Families
+        # without a system field get it prepended to the prompt; cache_prefix
+        # only applies where Bedrock prompt caching exists.
+        raise NotImplementedError
+
+    def with_system(self, prompt, system):
+        return f"{system}\n\n{prompt}" if system else prompt
+
+    def estimate_tokens(self, text):
+        return token_budget.estimate_tokens(text, self.family)
+
+    def build_body(self, prompt, max_tokens=None, system=None, cache_prefix=False):
+        return json.dumps(self.build_request(prompt, max_tokens, system, cache_prefix))
+
+    def parse_body(self, response_body):
+        # Returns (text, input_tokens, output_tokens); counts are None when absent
+        raise NotImplementedError
+
+    def cache_usage(self, response_body):
+        # Returns (cache_read_tokens, cache_write_tokens)
+        return 0, 0
+
+    def decode_chunk(self, chunk):
+        # Returns (text_delta, usage) for one decoded response-stream chunk
+        raise NotImplementedError
+
+    def parse_result(self, response, prompt=""):
+        # Full invoke_model response -> {"text", "input_tokens", "output_tokens",
+        # "cache_read_tokens", "cache_write_tokens"}. Missing counts fall back
+        # to the Bedrock token-count headers, then to an estimate.
+        response_body = json.loads(response.get('body').read())
+        text, input_tokens, output_tokens = self.parse_body(response_body)
+        headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+        if input_tokens is None:
+            input_tokens = int(headers.get('x-amzn-bedrock-input-token-count', self.estimate_tokens(prompt)))
+        if output_tokens is None:
+            output_tokens = int(headers.get('x-amzn-bedrock-output-token-count', self.estimate_tokens(text)))
+        cache_read, cache_write = self.cache_usage(response_body)
+        return {
+            'text': text,
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'cache_read_tokens': cache_read,
+            'cache_write_tokens': cache_write
+        }
+
+    def parse_response(self, response, prompt=""):
+        # Full invoke_model response -> (text, input_tokens, output_tokens)
+        result = self.parse_result(response, prompt)
+        return result['text'], result['input_tokens'], result['output_tokens']
+
+
+def invocation_usage(chunk):
+    # Token counts Bedrock attaches to the final stream chunk
+    metrics = chunk.get('amazon-bedrock-invocationMetrics')
+    if not metrics:
+        return {}
+    usage = {
+        'input_tokens': metrics.get('inputTokenCount'),
+        'output_tokens': metrics.get('outputTokenCount')
+    }
+    if 'cacheReadInputTokenCount' in metrics:
+        usage['cache_read_tokens'] = metrics['cacheReadInputTokenCount']
+        usage['cache_write_tokens'] = metrics.get('cacheWriteInputTokenCount', 0)
+    return usage
+
+
+class ClaudeAdapter(ModelAdapter):
+    family = "claude"
+
+    def build_request(self, prompt, max_tokens=None, system=None, cache_prefix=False):
+        request = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": max_tokens or DEFAULT_MAX_TOKENS,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+        if system:
+            block = {"type": "text", "text": system}
+            if cache_prefix:
+                # Cache checkpoint after the shared prefix; later calls with the
+                # same prefix read it back at a fraction of the input price
+                block["cache_control"] = {"type": "ephemeral"}
+            request["system"] = [block]
+        return request
+
+    def parse_body(self, response_body):
+        usage = response_body.get('usage', {})
+        return response_body['content'][0]['text'], usage.get('input_tokens'), usage.get('output_tokens')
+
+    def cache_usage(self, response_body):
+        usage = response_body.get('usage', {})
+        return usage.get('cache_read_input_tokens') or 0, usage.get('cache_creation_input_tokens') or 0
+
+    def decode_chunk(self, chunk):
+        if chunk.get('type') == 'content_block_delta':
+            return chunk['delta'].get('text', ''), invocation_usage(chunk)
+        if chunk.get('type') == 'message_start':
+            # Prompt-cache usage is only reported up front
+            cache_read, cache_write = self.cache_usage(chunk.get('message', {}))
+            return '', dict(invocation_usage(chunk), cache_read_tokens=cache_read, cache_write_tokens=cache_write)
+        return '', invocation_usage(chunk)
+
+
+class Llama3Adapter(ModelAdapter):
+    family = "llama3"
+    template = PromptTemplate(
+        "<|begin_of_text|><|start_header_id|>user<|end_header_id|>\n\n{prompt}<|eot_id|>"
+        "<|start_header_id|>assistant<|end_header_id|>\n\n"
+    )
+    params = {"temperature": 0.5, "top_p": 0.9}
+
+    system_template = PromptTemplate(
+        "<|begin_of_text|><|start_header_id|>system<|end_header_id|>\n\n{prompt}<|eot_id|>"
+        "<|start_header_id|>user<|end_header_id|>\n\n"
+    )
+
+    def build_request(self, prompt, max_tokens=None, system=None, cache_prefix=False):
+        rendered = self.template.render(prompt)
+        if system:
+            # Native system turn in place of the bare user header
+            rendered = self.system_template.render(system) + rendered[len(self.template.prefix):]
+        return dict(self.params, prompt=rendered, max_gen_len=max_tokens or DEFAULT_MAX_TOKENS)
+
+    def parse_body(self, response_body):
+        return (
+            response_body['generation'],
+            response_body.get('prompt_token_count'),
+            response_body.get('generation_token_count')
+        )
+
+    def decode_chunk(self, chunk):
+        return chunk.get('generation') or '', invocation_usage(chunk)
+
+
+class MistralAdapter(ModelAdapter):
+    family = "mistral"
+    template = PromptTemplate("<s>[INST] {prompt} [/INST]")
+    params = {"temperature": 0.5, "top_p": 0.9, "top_k": 50}
+
+    def build_request(self, prompt, max_tokens=None, system=None, cache_prefix=False):
+        return dict(self.params, prompt=self.template.render(self.with_system(prompt, system)),
+                    max_tokens=max_tokens or DEFAULT_MAX_TOKENS)
+
+    def parse_body(self, response_body):
+        # Mistral reports token counts only in the response headers
+        return response_body['outputs'][0]['text'], None, None
+
+    def decode_chunk(self, chunk):
+        outputs = chunk.get('outputs') or [{}]
+        return outputs[0].get('text', ''), invocation_usage(chunk)
+
+
+class TitanAdapter(ModelAdapter):
+    family = "titan"
+    params = {"temperature": 0.5, "topP": 0.9}
+
+    def build_request(self, prompt, max_tokens=None, system=None, cache_prefix=False):
+        return {
+            "inputText": self.template.render(self.with_system(prompt, system)),
+            "textGenerationConfig": dict(self.params, maxTokenCount=max_tokens or DEFAULT_MAX_TOKENS)
+        }
+
+    def parse_body(self, response_body):
+        result = response_body['results'][0]
+        return result['outputText'], response_body.get('inputTextTokenCount'), result.get('tokenCount')
+
+    def decode_chunk(self, chunk):
+        return chunk.get('outputText') or '', invocation_usage(chunk)
+
+
+ADAPTERS = {
+    "claude": ClaudeAdapter(),
+    "llama3": Llama3Adapter(),
+    "mistral": MistralAdapter(),
+    "titan": TitanAdapter()
+}
+
+# Model-id prefix (provider.model family, up to the first "-") -> adapter
+PREFIXES = {
+    "anthropic.claude": ADAPTERS["claude"],
+    "meta.llama3": ADAPTERS["llama3"],
+    "mistral.mistral": ADAPTERS["mistral"],
+    "mistral.mixtral": ADAPTERS["mistral"],
+    "amazon.titan": ADAPTERS["titan"]
+}
+
+DEFAULT_ADAPTER = ADAPTERS["titan"]
+
+# Resolved model id -> adapter, so repeated lookups are a single dict hit
+_RESOLVED = {}
+
+
+def register(model_id, family):
+    # Explicit mapping for ids the prefix cannot classify (e.g. custom model ARNs)
+    _RESOLVED[model_id] = ADAPTERS[family]
+
+
+def get_adapter(model_id):
+    adapter = _RESOLVED.get(model_id)
+    if adapter is not None:
+        return adapter
+
+    adapter = PREFIXES.get(base_model_id(model_id).split("-", 1)[0], DEFAULT_ADAPTER)
+    _RESOLVED[model_id] = adapter
+    return adapter
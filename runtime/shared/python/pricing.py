@@ -0,0 +1,23 @@
+# Pricing (Approximate USD per 1M tokens for estimation)
+PRICING = {
+    "anthropic.claude-3-sonnet-20240229-v1:0": {"input": 3.00, "output": 15.00},
+    "meta.llama3-8b-instruct-v1:0": {"input": 0.40, "output": 0.60},
+    "mistral.mistral-7b-instruct-v0:2": {"input": 0.15, "output": 0.20},
+    "amazon.titan-text-express-v1": {"input": 0.20, "output": 0.60}
+}
+
+UNKNOWN_PRICE = {"input": 0, "output": 0}
+
+# Prompt-cache tokens relative to the input price: reads are discounted,
+# writes (the first call with a new prefix) carry a premium
+CACHE_READ_MULTIPLIER = 0.1
+CACHE_WRITE_MULTIPLIER = 1.25
+
+def price_for(model_id):
+    return PRICING.get(model_id, UNKNOWN_PRICE)
+
+def estimate_cost(model_id, input_tokens, output_tokens, cache_read_tokens=0, cache_write_tokens=0):
+    # input_tokens excludes cached tokens, as Bedrock reports it
+    price_cfg = price_for(model_id)
+    cached = cache_read_tokens * CACHE_READ_MULTIPLIER + cache_write_tokens * CACHE_WRITE_MULTIPLIER
+    return ((input_tokens + cached) / 1_000_000 * price_cfg['input']) + (output_tokens / 1_000_000 * price_cfg['output'])
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import threading
+
+import token_budget
+from model_adapters import PromptTemplate, MIN_CACHEABLE_TOKENS, supports_prompt_cache
+
+# Per-type prompt templates from the AppConfig `prompt_templates` section:
+#
+#   "prompt_templates": {
+#     "cache_prefix": true,
+#     "prefixes": {"persona": "...", "compliance": "..."},
+#     "types": {
+#       "default": {"prefixes": ["persona", "compliance"], "template": "{prompt}"},
+#       "finance_deep": {"prefixes": ["persona", "compliance"], "system": "...", "template": "..."}
+#     }
+#   }
+#
+# A type's system prefix is its named prefixes followed by its own `system`
+# text, always joined in the listed order so types that share prefixes send
+# byte-identical text (a prompt-cache hit needs an exact prefix match). The
+# template wraps the user question. Templates are compiled once per config
+# document, not per request.
+
+
+class CompiledTemplate:
+    def __init__(self, system, template):
+        self.system = system or None
+        self.template = PromptTemplate(template or "{prompt}")
+        self.system_tokens = token_budget.estimate_tokens(system, "claude") if system else 0
+        # Identifies the prefix and template, for caches whose entries depend on them
+        self.fingerprint = hashlib.sha256(json.dumps([system, template]).encode("utf-8")).hexdigest()[:16]
+
+    def render(self, question):
+        return self.system, self.template.render(question)
+
+
+class TemplateSet:
+    def __init__(self, section):
+        prefixes = section.get("prefixes", {})
+        self.cache_prefix = section.get("cache_prefix", True)
+        self.templates = {}
+        for req_type, spec in section.get("types", {}).items():
+            parts = [prefixes[name] for name in spec.get("prefixes", []) if name in prefixes]
+            if spec.get("system"):
+                parts.append(spec["system"])
+            self.templates[req_type] = CompiledTemplate("\n\n".join(parts), spec.get("template"))
+        # Prefixes long enough for Bedrock to cache
+        self.cacheable = {
+            t.system for t in self.templates.values()
+            if self.cache_prefix and t.system and t.system_tokens >= MIN_CACHEABLE_TOKENS
+        }
+
+    def for_type(self, req_type):
+        return self.templates.get(req_type) or self.templates.get("default")
+
+    def render(self, req_type, question):
+        # Returns (system, prompt); system is None when the type has no prefix
+        template = self.for_type(req_type)
+        if template is None:
+            return None, question
+        return template.render(question)
+
+    def fingerprint(self, req_type):
+        # None when the type has no template (the question is sent as-is)
+        template = self.for_type(req_type)
+        return template.fingerprint if template is not None else None
+
+    def use_cache(self, model_id, system):
+        # Marks the prefix only where Bedrock would actually cache it
+        return system in self.cacheable and supports_prompt_cache(model_id)
+
+
+EMPTY = TemplateSet({})
+
+# (section, compiled) for the config document currently in use
+_COMPILED = (None, EMPTY)
+_LOCK = threading.Lock()
+
+
+def templates_for(config):
+    global _COMPILED
+    section = config.get("prompt_templates")
+    if not section:
+        return EMPTY
+    source, compiled = _COMPILED
+    if source is section:
+        return compiled
+    with _LOCK:
+        if _COMPILED[0] is not section:
+            _COMPILED = (section, TemplateSet(section))
+        return _COMPILED[1]
+
+
+def use_cache(model_id, system):
+    # For call sites that only have the rendered prefix (e.g. the fallback model)
+    return bool(system) and _COMPILED[1].use_cache(model_id, system)
@@ -0,0 +1,65 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# CloudWatch Embedded Metric Format. Each record is one JSON line on stdout;
+# CloudWatch Logs extracts the metrics asynchronously, so emitting costs a
+# json.dumps and a write instead of a PutMetricData round trip per request.
+
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'GenAIModelRouter')
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+
+MILLISECONDS = "Milliseconds"
+COUNT = "Count"
+NONE = "None"
+
+
+class StageTimer:
+    # Wall-clock milliseconds per named stage; repeated stages accumulate
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name, ms):
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def metrics(self, suffix="Latency"):
+        # {"parse": 1.2} -> {"ParseLatency": (1.2, "Milliseconds")}
+        return {name.capitalize() + suffix: (round(ms, 2), MILLISECONDS) for name, ms in self.stages.items()}
+
+
+def emit(dimensions, metrics, properties=None):
+    # dimensions: {name: value}; metrics: {name: (value, unit)}, None values
+    # are dropped; properties: extra searchable fields that are not metrics
+    if not METRICS_ENABLED:
+        return None
+    metrics = {name: m for name, m in metrics.items() if m[0] is not None}
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": NAMESPACE,
+                "Dimensions": [list(dimensions)],
+                "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit) in metrics.items()]
+            }]
+        }
+    }
+    record.update(properties or {})
+    record.update(dimensions)
+    record.update({name: value for name, (value, _) in metrics.items()})
+    # One write per record so lines from concurrent threads never interleave
+    sys.stdout.write(json.dumps(record) + "\n")
+    return record
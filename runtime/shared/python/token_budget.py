@@ -0,0 +1,62 @@
+import re
+
+# Fast local token estimates per model family, plus per-type budgets from
+# AppConfig and prompt trimming. The estimate counts words and punctuation;
+# a long word counts as several tokens, one per `chars_per_token` characters
+# (smaller vocabularies split words into more pieces).
+
+CHARS_PER_TOKEN = {
+    "claude": 3.5,
+    "llama3": 4.2, # 128k-token vocabulary
+    "mistral": 3.2, # 32k-token vocabulary
+    "titan": 4.0
+}
+DEFAULT_CHARS_PER_TOKEN = 3.8
+
+DEFAULT_MAX_OUTPUT_TOKENS = 512
+DEFAULT_MAX_INPUT_TOKENS = 4000
+
+TRUNCATION_MARKER = " [...] "
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text, family=None):
+    if not text:
+        return 0
+    chars_per_token = CHARS_PER_TOKEN.get(family, DEFAULT_CHARS_PER_TOKEN)
+    total = 0
+    for piece in _PIECES.findall(text):
+        total += 1 + int(len(piece) / chars_per_token) if len(piece) > chars_per_token else 1
+    return total
+
+
+def resolve_budget(config, req_type):
+    # Returns (max_output_tokens, max_input_tokens) for a request type from the
+    # AppConfig `token_budgets` section: {"default": {...}, "<type>": {...}}
+    budgets = config.get('token_budgets', {})
+    budget = dict(budgets.get('default', {}), **budgets.get(req_type, {}))
+    return (
+        budget.get('max_output_tokens', DEFAULT_MAX_OUTPUT_TOKENS),
+        budget.get('max_input_tokens', DEFAULT_MAX_INPUT_TOKENS)
+    )
+
+
+def truncate_prompt(prompt, max_input_tokens, family=None):
+    # Returns (prompt, estimated_tokens, truncated). Oversized prompts keep their
+    # beginning (context) and end (usually the actual question) and drop the middle.
+    estimated = estimate_tokens(prompt, family)
+    if not max_input_tokens or estimated <= max_input_tokens:
+        return prompt, estimated, False
+
+    # Characters scale roughly linearly with tokens; shrink until it fits
+    keep_chars = int(len(prompt) * max_input_tokens / estimated)
+    while keep_chars > 0:
+        head = prompt[:keep_chars * 2 // 3]
+        tail = prompt[len(prompt) - keep_chars // 3:] if keep_chars // 3 else ""
+        trimmed = head + TRUNCATION_MARKER + tail
+        tokens = estimate_tokens(trimmed, family)
+        if tokens <= max_input_tokens:
+            return trimmed, tokens, True
+        keep_chars = int(keep_chars * 0.9)
+    return "", 0, True
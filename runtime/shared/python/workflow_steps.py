@@ -0,0 +1,55 @@
+import json
+
+import bedrock_invoker
+from aws_clients import get_client
+from model_adapters import get_adapter
+
+# Fallback and degradation steps of the circuit-breaker workflow. The Step
+# Functions Lambdas are thin wrappers around these, and the router calls them
+# in-process when API Gateway invokes it directly.
+
+FALLBACK_MODEL = "amazon.titan-text-express-v1"
+DEGRADED_ANSWER = "I'm sorry, system is currently under high load. Please try again later."
+
+# Used by the workflow Lambdas; the router passes its own invoker so limits are shared
+INVOKER = bedrock_invoker.BedrockInvoker()
+
+
+def extract_prompt(event):
+    # Step Functions passes input as-is or inside a Payload wrapper depending on previous state
+    prompt = event.get('question') or event.get('prompt')
+    if not prompt and isinstance(event.get('Payload'), dict):
+        prompt = event['Payload'].get('question') or event['Payload'].get('prompt')
+    return prompt
+
+
+def fallback_answer(prompt, model_id=FALLBACK_MODEL, invoker=None, deadline=None):
+    # Returns {"answer", "model_used"}; Bedrock errors propagate so the caller can degrade
+    adapter = get_adapter(model_id)
+    body = adapter.build_body(prompt)
+    response = (invoker or INVOKER).call(model_id, lambda: get_client('bedrock-runtime').invoke_model(
+        body=body,
+        modelId=model_id,
+        accept='application/json',
+        contentType='application/json'
+    ), deadline)
+    output_text, _, _ = adapter.parse_response(response, prompt)
+    return {"answer": output_text, "model_used": f"FALLBACK:{model_id}"}
+
+
+def degraded_answer():
+    return {"answer": DEGRADED_ANSWER, "model_used": "DEGRADED_SERVICE"}
+
+
+def fallback_or_degrade(prompt, model_id=FALLBACK_MODEL, invoker=None, deadline=None):
+    # Both remaining workflow steps in one call, for the direct API Gateway path
+    try:
+        return fallback_answer(prompt, model_id, invoker, deadline)
+    except Exception as e:
+        print(f"Fallback Failed: {e}")
+        print("Degradation Invoked")
+        return degraded_answer()
+
+
+def response(payload, status_code=200):
+    return {"statusCode": status_code, "body": json.dumps(payload)}